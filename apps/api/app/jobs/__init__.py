@@ -0,0 +1 @@
+"""Offline maintenance jobs, run as `python -m app.jobs.<name>`."""
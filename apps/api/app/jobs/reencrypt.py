@@ -0,0 +1,388 @@
+"""Resumable migration over every stored credential.
+
+Walks users/*/credentials with a paginated collection-group query ordered by
+document path. Each page is transformed with bounded concurrency and the
+changes are written through a rate-limited BulkWriter. Once a page's writes
+are confirmed, its last path is saved to a checkpoint file, so an interrupted
+run resumes after the last completed page. A write that is neither confirmed
+nor rejected (its batch RPC failed) ends the run, with the checkpoint just
+before that document. Migrations skip documents that
+are already in the target form, so re-running from scratch is safe, only
+slower; that is also how documents reported as failed are retried.
+
+Usage:
+    python -m app.jobs.reencrypt [--migration reencrypt|binary] [--checkpoint FILE]
+        [--page-size 500] [--concurrency 32] [--max-writes-per-second 500] [--dry-run]
+
+Set FIRESTORE_EMULATOR_HOST to run against the Firestore emulator.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Self
+
+from google.api_core.exceptions import GoogleAPICallError
+from google.cloud.firestore_v1.bulk_writer import (
+    BulkWriteFailure,
+    BulkWriterOptions,
+    BulkWriterUpdateOperation,
+)
+from google.rpc import code_pb2
+
+if TYPE_CHECKING:
+    from google.cloud.firestore_v1 import AsyncClient
+    from google.cloud.firestore_v1.bulk_writer import BulkWriter
+
+from app.lib import crypto
+from app.lib.config import get_settings
+from app.lib.firebase import get_async_firestore_client
+from app.lib.keyring import Keyring
+from app.models.credential import CredentialDocument
+from app.repositories.pagination import DOCUMENT_ID
+
+logger = logging.getLogger(__name__)
+
+# Returns the fields to update, or None to leave the credential as it is
+Migration = Callable[[str, CredentialDocument], Awaitable[dict[str, Any] | None]]
+
+# Attempts per write before it is reported as failed
+_MAX_WRITE_ATTEMPTS = 5
+
+# Firestore's ramp-up guidance: start at 500 writes/s and grow from there
+_INITIAL_WRITES_PER_SECOND = 500
+
+
+def reencrypt(keyring: Keyring) -> Migration:
+    """Seal legacy master-key blobs with the owner's data key.
+
+    Loading a user's data key also rewraps it if it was wrapped by a
+    retired master key, so this migration completes a master key rotation.
+    """
+
+    async def migrate(uid: str, doc: CredentialDocument) -> dict[str, Any] | None:
+        await keyring.data_key(uid)
+        if not doc.encrypted_key or crypto.envelope_version(doc.encrypted_key) is not None:
+            return None
+        # Legacy blobs are always text; bytes are binary envelopes
+        if not isinstance(doc.encrypted_key, str):
+            return None
+        plaintext = crypto.decrypt_legacy(doc.encrypted_key)
+        return {"encrypted_key": await keyring.encrypt(uid, plaintext)}
+
+    return migrate
+
+
+def to_binary(keyring: Keyring) -> Migration:
+    """Store every credential in the binary envelope format (opt-in).
+
+    Text envelopes are converted without decrypting them; legacy blobs are
+    re-sealed as in `reencrypt`.
+    """
+    reseal = reencrypt(keyring)
+
+    async def migrate(uid: str, doc: CredentialDocument) -> dict[str, Any] | None:
+        blob = doc.encrypted_key
+        if isinstance(blob, str) and blob and crypto.envelope_version(blob) is not None:
+            return {"encrypted_key": crypto.envelope_to_bytes(blob)}
+        return await reseal(uid, doc)
+
+    return migrate
+
+
+MIGRATIONS: dict[str, Callable[[Keyring], Migration]] = {
+    "reencrypt": reencrypt,
+    "binary": to_binary,
+}
+
+
+class UnconfirmedWritesError(RuntimeError):
+    """Raised when writes were neither confirmed nor rejected, e.g. a batch RPC failed."""
+
+
+@dataclass
+class Checkpoint:
+    """Progress of a run, saved after every page."""
+
+    migration: str
+    # Path of the last credential in the last completed page
+    after: str | None = None
+    processed: int = 0
+    updated: int = 0
+    failed: int = 0
+
+    @classmethod
+    def load(cls, path: Path, migration: str) -> Self:
+        """Read a checkpoint for `migration`, or start a new one if the file is missing."""
+        if not path.exists():
+            return cls(migration)
+        checkpoint = cls(**json.loads(path.read_text()))
+        if checkpoint.migration != migration:
+            raise ValueError(
+                f"{path} is a checkpoint for {checkpoint.migration!r}, not {migration!r}"
+            )
+        return checkpoint
+
+    def save(self, path: Path) -> None:
+        """Write the checkpoint atomically (a crash never leaves a partial file)."""
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(asdict(self)))
+        os.replace(tmp, path)
+
+
+@dataclass
+class Progress:
+    """Throughput and ETA for the documents processed by this run."""
+
+    total: int | None
+    start: int
+    clock: Callable[[], float] = time.monotonic
+    started_at: float = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.started_at = self.clock()
+
+    def rate(self, processed: int) -> float:
+        """Documents per second since this run started."""
+        elapsed = self.clock() - self.started_at
+        return (processed - self.start) / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, processed: int) -> float | None:
+        """Seconds until every document is processed, if the total is known."""
+        rate = self.rate(processed)
+        if self.total is None or rate <= 0:
+            return None
+        return max(self.total - processed, 0) / rate
+
+    def describe(self, checkpoint: Checkpoint) -> str:
+        """One log line summarizing the run so far."""
+        done = f"{checkpoint.processed}" + (f"/{self.total}" if self.total is not None else "")
+        eta = self.eta(checkpoint.processed)
+        return (
+            f"{done} processed, {checkpoint.updated} updated, {checkpoint.failed} failed, "
+            f"{self.rate(checkpoint.processed):.0f} docs/s, "
+            f"ETA {f'{eta:.0f}s' if eta is not None else 'unknown'}"
+        )
+
+
+class ReencryptJob:
+    """Apply a migration to every credential, one checkpointed page at a time."""
+
+    def __init__(
+        self,
+        db: "AsyncClient",
+        migration: Migration,
+        checkpoint: Checkpoint,
+        checkpoint_path: Path | None = None,
+        page_size: int = 500,
+        concurrency: int = 32,
+        max_writes_per_second: int = 500,
+        dry_run: bool = False,
+    ) -> None:
+        """Create a job over `db`.
+
+        `concurrency` bounds how many credentials are transformed at once and
+        `max_writes_per_second` caps the BulkWriter. With `dry_run`, changes
+        are computed and counted but neither written nor checkpointed.
+        """
+        self.db = db
+        self.migration = migration
+        self.checkpoint = checkpoint
+        self.checkpoint_path = checkpoint_path
+        self.page_size = page_size
+        self.dry_run = dry_run
+        self._limit = asyncio.Semaphore(concurrency)
+        self._writer_options = BulkWriterOptions(
+            initial_ops_per_second=min(_INITIAL_WRITES_PER_SECOND, max_writes_per_second),
+            max_ops_per_second=max_writes_per_second,
+        )
+
+    async def run(self) -> Checkpoint:
+        """Process every credential after the checkpoint and return the final checkpoint."""
+        progress = Progress(await self._count(), self.checkpoint.processed)
+        writer = None if self.dry_run else self.db.bulk_writer(self._writer_options)
+        try:
+            while page := await self._next_page():
+                results = await asyncio.gather(*map(self._transform, page))
+                updates = [r for r in results if isinstance(r, _Update)]
+                failed = sum(r is _FAILED for r in results)
+                rejected: set[str] = set()
+                unconfirmed: list[str] = []
+                if writer is not None and updates:
+                    rejected, unconfirmed = await asyncio.to_thread(self._write, writer, updates)
+                complete = len(page)
+                if unconfirmed:
+                    # Keep the checkpoint before the first write not known to have happened
+                    lost = set(unconfirmed)
+                    complete = next(
+                        i
+                        for i, r in enumerate(results)
+                        if isinstance(r, _Update) and r.doc_ref.path in lost
+                    )
+                    updates = [r for r in results[:complete] if isinstance(r, _Update)]
+                    failed = sum(r is _FAILED for r in results[:complete])
+                write_failures = sum(u.doc_ref.path in rejected for u in updates)
+
+                if complete:
+                    self.checkpoint.after = page[complete - 1].reference.path
+                self.checkpoint.processed += complete
+                self.checkpoint.updated += len(updates) - write_failures
+                self.checkpoint.failed += failed + write_failures
+                if self.checkpoint_path is not None and not self.dry_run:
+                    self.checkpoint.save(self.checkpoint_path)
+                logger.info(progress.describe(self.checkpoint))
+                if unconfirmed:
+                    raise UnconfirmedWritesError(
+                        f"{len(unconfirmed)} writes were not confirmed; "
+                        f"resume to retry from {unconfirmed[0]}"
+                    )
+                if len(page) < self.page_size:
+                    break
+        finally:
+            if writer is not None:
+                await asyncio.to_thread(writer.close)
+        return self.checkpoint
+
+    async def _count(self) -> int | None:
+        """Count every credential for the ETA; None if the aggregation query fails."""
+        try:
+            result = await self.db.collection_group(CredentialDocument.COLLECTION).count().get()
+        except GoogleAPICallError:
+            logger.warning("Could not count credentials; ETA unavailable", exc_info=True)
+            return None
+        return int(result[0][0].value)
+
+    async def _next_page(self) -> list[Any]:
+        """Read the next page of credentials after the checkpoint, in path order."""
+        query = (
+            self.db.collection_group(CredentialDocument.COLLECTION)
+            .order_by(DOCUMENT_ID)
+            .limit(self.page_size)
+        )
+        if self.checkpoint.after is not None:
+            query = query.start_after({DOCUMENT_ID: self.db.document(self.checkpoint.after)})
+        return [snapshot async for snapshot in query.stream()]
+
+    async def _transform(self, snapshot: Any) -> "_Update | _Failed | None":
+        doc_ref = snapshot.reference
+        # users/{uid}/credentials/{id}
+        uid = doc_ref.parent.parent.id
+        doc = CredentialDocument.from_dict(snapshot.id, snapshot.to_dict() or {})
+        async with self._limit:
+            try:
+                data = await self.migration(uid, doc)
+            except Exception:
+                logger.warning("Could not migrate %s", doc_ref.path, exc_info=True)
+                return _FAILED
+        if data is None:
+            return None
+        return _Update(doc_ref, data, snapshot.update_time)
+
+    def _write(self, writer: "BulkWriter", updates: list["_Update"]) -> tuple[set[str], list[str]]:
+        """Write a page of updates and wait for them (runs in a worker thread).
+
+        Each write is conditional on the document being unchanged since it
+        was read, so a concurrent edit is never overwritten; such writes are
+        rejected and picked up by the next run. Returns the paths of rejected
+        writes and, in page order, of writes that got no result at all (the
+        BulkWriter reports neither success nor error when a batch RPC fails).
+        """
+        confirmed: set[str] = set()
+        rejected: set[str] = set()
+
+        def on_result(reference: Any, _result: Any, _writer: "BulkWriter") -> None:
+            confirmed.add(reference.path)
+
+        def on_error(failure: BulkWriteFailure, _: "BulkWriter") -> bool:
+            retry = (
+                failure.code != code_pb2.FAILED_PRECONDITION
+                and failure.attempts < _MAX_WRITE_ATTEMPTS
+            )
+            if not retry and isinstance(failure.operation, BulkWriterUpdateOperation):
+                path = failure.operation.reference.path
+                rejected.add(path)
+                logger.warning("Write failed for %s: %s", path, failure.message)
+            return retry
+
+        writer.on_write_result(on_result)
+        writer.on_write_error(on_error)
+        for update in updates:
+            option = self.db.write_option(last_update_time=update.update_time)
+            writer.update(update.doc_ref, update.data, option=option)
+        try:
+            writer.flush()
+        except Exception:
+            logger.warning("Flushing writes failed", exc_info=True)
+        unconfirmed = [
+            u.doc_ref.path
+            for u in updates
+            if u.doc_ref.path not in confirmed and u.doc_ref.path not in rejected
+        ]
+        for path in unconfirmed:
+            logger.warning("Write not confirmed for %s", path)
+        return rejected, unconfirmed
+
+
+@dataclass(slots=True)
+class _Update:
+    doc_ref: Any
+    data: dict[str, Any]
+    update_time: datetime
+
+
+class _Failed:
+    """Marker for a credential the migration raised on."""
+
+
+_FAILED = _Failed()
+
+
+async def _main(args: argparse.Namespace) -> Checkpoint:
+    settings = get_settings()
+    db = get_async_firestore_client()
+    keyring = Keyring(lambda: db, maxsize=settings.credential_dek_cache_size, ttl=None)
+    path = Path(args.checkpoint)
+    job = ReencryptJob(
+        db,
+        MIGRATIONS[args.migration](keyring),
+        Checkpoint.load(path, args.migration),
+        checkpoint_path=path,
+        page_size=args.page_size,
+        concurrency=args.concurrency,
+        max_writes_per_second=args.max_writes_per_second,
+        dry_run=args.dry_run,
+    )
+    if job.checkpoint.after is not None:
+        logger.info("Resuming after %s", job.checkpoint.after)
+    return await job.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--migration", choices=sorted(MIGRATIONS), default="reencrypt")
+    parser.add_argument("--checkpoint", default="reencrypt.checkpoint.json")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--max-writes-per-second", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    final = asyncio.run(_main(args))
+    logger.info(
+        "Done: %d processed, %d updated, %d failed",
+        final.processed,
+        final.updated,
+        final.failed,
+    )
+    if final.failed:
+        raise SystemExit(1)
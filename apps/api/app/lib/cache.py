@@ -0,0 +1,135 @@
+"""Bounded in-process cache with per-entry expiry and LRU eviction."""
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass
+class CacheStats:
+    """Counters reported by a cache instance."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """Fraction of lookups served from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the counters as a JSON-serializable dict."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hit_ratio, 4),
+        }
+
+
+class TTLCache[K: Hashable, V]:
+    """LRU cache whose entries expire at an absolute deadline.
+
+    Expiry is checked lazily on lookup, so there is no background sweeper.
+    When the cache is full the least recently used entry is evicted.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        on_remove: Callable[[K, V], None] | None = None,
+    ) -> None:
+        """Create a cache holding at most `maxsize` entries.
+
+        `ttl` is the default lifetime in seconds for entries stored without an
+        explicit deadline (None means they never expire). Deadlines are
+        measured on `clock`. `on_remove` is called with each value that
+        leaves the cache: evicted, expired, replaced, popped or cleared.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.on_remove = on_remove
+        self.stats = CacheStats()
+        self._data: OrderedDict[K, tuple[V, float | None]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        entry = self._data.get(key)  # type: ignore[arg-type]
+        return entry is not None and not self._expired(entry[1])
+
+    def _expired(self, expires_at: float | None) -> bool:
+        return expires_at is not None and expires_at <= self.clock()
+
+    def _removed(self, key: K, entry: tuple[V, float | None] | None) -> None:
+        if entry is not None and self.on_remove is not None:
+            self.on_remove(key, entry[0])
+
+    def get(self, key: K) -> V | None:
+        """Return the cached value, or None on a miss or expired entry."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        value, expires_at = entry
+        if self._expired(expires_at):
+            del self._data[key]
+            self._removed(key, entry)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: K, value: V, expires_at: float | None = None) -> None:
+        """Store a value until `expires_at` (defaults to now + ttl)."""
+        if self.maxsize <= 0:
+            return
+        if expires_at is None and self.ttl is not None:
+            expires_at = self.clock() + self.ttl
+        if self._expired(expires_at):
+            self._removed(key, self._data.pop(key, None))
+            return
+        previous = self._data.get(key)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        if previous is not None and previous[0] is not value:
+            self._removed(key, previous)
+        while len(self._data) > self.maxsize:
+            evicted_key, evicted = self._data.popitem(last=False)
+            self._removed(evicted_key, evicted)
+            self.stats.evictions += 1
+
+    def peek(self, key: K) -> V | None:
+        """Return a live value without counting a lookup or refreshing its LRU position."""
+        entry = self._data.get(key)
+        if entry is None or self._expired(entry[1]):
+            return None
+        return entry[0]
+
+    def pop(self, key: K) -> V | None:
+        """Remove an entry and return its value if it was present."""
+        entry = self._data.pop(key, None)
+        self._removed(key, entry)
+        return entry[0] if entry is not None else None
+
+    def items(self) -> list[tuple[K, V]]:
+        """Return a snapshot of the live (unexpired) entries."""
+        return [(k, v) for k, (v, exp) in self._data.items() if not self._expired(exp)]
+
+    def clear(self) -> None:
+        """Drop all entries. Counters are kept."""
+        entries, self._data = self._data, OrderedDict()
+        for key, entry in entries.items():
+            self._removed(key, entry)
@@ -23,10 +23,75 @@ class Settings(BaseSettings):
 
     # Credential encryption (base64-encoded 32-byte AES-256-GCM key)
     credential_encryption_key: str = ""
+    # Version of credential_encryption_key; bump it when rotating the master key
+    credential_encryption_key_version: int = 1
+    # Retired master keys still wrapping some data keys: "1:base64key,2:base64key"
+    credential_encryption_previous_keys: str = ""
+    # Unwrapped per-user data keys kept in memory (size 0 disables the cache)
+    credential_dek_cache_size: int = 1024
+    credential_dek_cache_ttl: float = 300.0
 
     # Development mode
     auth_disabled: bool = True
 
+    # Serve per-instance counters at /api/health/metrics, without authentication
+    metrics_enabled: bool = False
+
+    # Max verified ID tokens kept in memory (0 disables the cache)
+    token_cache_size: int = 4096
+
+    # User profile cache for /api/auth/me (size 0 disables it)
+    profile_cache_size: int = 1024
+    profile_cache_ttl: float = 300.0
+    # Shared Redis-compatible backend, e.g. redis://host:6379/0 (empty: in-process only)
+    profile_cache_redis_url: str = ""
+    # Per-instance copy lifetime when the shared backend is enabled
+    profile_cache_local_ttl: float = 5.0
+
+    # Outbound HTTP client pool
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_max_connections_per_host: int = 20
+    http_keepalive_expiry: float = 30.0
+    http_timeout: float = 10.0
+    http_connect_timeout: float = 5.0
+    http2_enabled: bool = False
+    http_retry_attempts: int = 2
+    http_retry_budget_ratio: float = 0.2
+    http_breaker_threshold: int = 5
+    http_breaker_reset_timeout: float = 30.0
+
+    # Websocket delivery: per-connection send queue and what to do when it fills up
+    # (drop_oldest, drop_newest or disconnect)
+    ws_send_queue_size: int = 256
+    ws_slow_consumer_policy: str = "drop_oldest"
+    ws_send_timeout: float = 10.0
+    ws_max_topics_per_connection: int = 100
+    # Redis pub/sub carrying websocket events between instances (empty: single instance)
+    ws_pubsub_redis_url: str = ""
+    # Events kept per topic for clients resuming after a reconnect, and how long a
+    # topic's history outlives its last subscriber on this instance (seconds)
+    ws_replay_buffer_size: int = 100
+    ws_replay_linger: float = 120.0
+    # Lifetime of a topic's sequence counter in Redis (seconds)
+    ws_sequence_ttl: int = 86400
+    # Heartbeat a websocket silent for this many seconds (a heartbeat that cannot be
+    # sent within ws_send_timeout closes it); close one silent for ws_idle_timeout
+    # (0 never closes: listen-only clients send nothing)
+    ws_heartbeat_interval: float = 30.0
+    ws_idle_timeout: float = 0.0
+    # Merge state updates to the same entity for this many seconds before sending,
+    # and keep this many versions of each entity to compute patches against
+    ws_state_tick: float = 0.1
+    ws_state_history: int = 8
+
+    # Task engine: tasks running at once overall, per team member and per provider
+    # (0: no limit), with per-provider overrides as "anthropic:8,openai:16"
+    tasks_max_workers: int = 32
+    tasks_max_per_member: int = 4
+    tasks_max_per_provider: int = 16
+    tasks_provider_limits: str = ""
+
     # API Settings
     api_host: str = "0.0.0.0"
     api_port: int = 8000
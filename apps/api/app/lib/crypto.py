@@ -1,14 +1,50 @@
-"""AES-256-GCM encryption for credential storage."""
+"""AES-256-GCM encryption for credential storage.
 
+Credentials are sealed with envelope encryption: each user has a data key
+(DEK) that encrypts their credentials, and the DEK is stored wrapped by the
+master key (CREDENTIAL_ENCRYPTION_KEY).
+
+Stored credential formats, all readable:
+- bytes: version byte (the DEK version) + nonce + ciphertext + tag. Written
+  for every new credential; stored as a Firestore bytes field.
+- str "v{dek_version}:" + base64(nonce + ciphertext + tag): the first
+  envelope format, converted by `envelope_to_bytes`.
+- str base64(nonce + ciphertext + tag) without a prefix: encrypted directly
+  with the master key before data keys existed, read with `decrypt_legacy`.
+"""
+
+import asyncio
 import base64
 import os
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
 from app.lib.config import get_settings
 
 _cached_key: bytes | None = None
 
+# Cipher built for _cached_key; rebuilt whenever the key object changes
+_cached_cipher: tuple[bytes, AESGCM] | None = None
+
+# Batches smaller than this are processed inline; a thread hop costs more
+_PARALLEL_THRESHOLD = 256
+
+# Single plaintexts larger than this are encrypted off the event loop
+_ASYNC_INLINE_LIMIT = 64 * 1024
+
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+
+# Master-key ciphers by version, built for _cached_key (see _get_master_ciphers)
+_cached_masters: tuple[bytes, dict[int, AESGCM]] | None = None
+
+# Envelope ciphertexts start with "v<dek version>:"; base64 never contains ":"
+_ENVELOPE_SEPARATOR = ":"
+
 
 def _get_key() -> bytes:
     """Read and cache the base64-decoded 32-byte encryption key from settings."""
@@ -24,37 +60,259 @@ def _get_key() -> bytes:
             'print(base64.b64encode(secrets.token_bytes(32)).decode())"'
         )
 
-    key = base64.b64decode(raw)
-    if len(key) != 32:
-        raise RuntimeError("CREDENTIAL_ENCRYPTION_KEY must be exactly 32 bytes (256 bits)")
-
-    _cached_key = key
+    _cached_key = _decode_key(raw, "CREDENTIAL_ENCRYPTION_KEY")
     return _cached_key
 
 
-def encrypt(plaintext: str) -> str:
-    """Encrypt a string with AES-256-GCM. Returns base64(nonce + ciphertext + tag)."""
+def _get_cipher() -> AESGCM:
+    """Return the AESGCM instance for the current key, building it once per key.
+
+    AESGCM holds only the key and is safe to share between threads.
+    """
+    global _cached_cipher
     key = _get_key()
-    nonce = os.urandom(12)
-    aesgcm = AESGCM(key)
-    ct = aesgcm.encrypt(nonce, plaintext.encode("utf-8"), None)
+    if _cached_cipher is None or _cached_cipher[0] is not key:
+        _cached_cipher = (key, AESGCM(key))
+    return _cached_cipher[1]
+
+
+def _encrypt_with(cipher: AESGCM, plaintext: str) -> str:
+    nonce = os.urandom(_NONCE_SIZE)
+    ct = cipher.encrypt(nonce, plaintext.encode("utf-8"), None)
     # ct already includes the 16-byte GCM tag appended by cryptography
     return base64.b64encode(nonce + ct).decode("ascii")
 
 
-def decrypt(ciphertext_b64: str) -> str:
-    """Decrypt a base64-encoded AES-256-GCM blob. Returns plaintext string."""
-    key = _get_key()
-    raw = base64.b64decode(ciphertext_b64)
-    if len(raw) < 28:  # 12 nonce + 16 tag minimum
+def _decrypt_with(cipher: AESGCM, ciphertext_b64: str) -> str:
+    return _open(cipher, base64.b64decode(ciphertext_b64))
+
+
+def _open(cipher: AESGCM, raw: bytes) -> str:
+    if len(raw) < _NONCE_SIZE + _TAG_SIZE:
         raise ValueError("Ciphertext too short")
-    nonce = raw[:12]
-    ct = raw[12:]
-    aesgcm = AESGCM(key)
-    plaintext = aesgcm.decrypt(nonce, ct, None)
+    plaintext = cipher.decrypt(raw[:_NONCE_SIZE], raw[_NONCE_SIZE:], None)
     return plaintext.decode("utf-8")
 
 
+def _decode_key(raw: str, name: str) -> bytes:
+    key = base64.b64decode(raw)
+    if len(key) != 32:
+        raise RuntimeError(f"{name} must be exactly 32 bytes (256 bits)")
+    return key
+
+
+def _get_master_ciphers() -> dict[int, AESGCM]:
+    """Return a cipher per master key version: the current key plus retired ones.
+
+    Retired keys come from CREDENTIAL_ENCRYPTION_PREVIOUS_KEYS as
+    "version:base64key" pairs separated by commas. They are only used to
+    unwrap data keys that have not been rewrapped yet.
+    """
+    global _cached_masters
+    key = _get_key()
+    if _cached_masters is None or _cached_masters[0] is not key:
+        settings = get_settings()
+        ciphers: dict[int, AESGCM] = {}
+        for entry in filter(
+            None, (e.strip() for e in settings.credential_encryption_previous_keys.split(","))
+        ):
+            version, _, raw = entry.partition(":")
+            ciphers[int(version)] = AESGCM(_decode_key(raw, "CREDENTIAL_ENCRYPTION_PREVIOUS_KEYS"))
+        ciphers[settings.credential_encryption_key_version] = _get_cipher()
+        _cached_masters = (key, ciphers)
+    return _cached_masters[1]
+
+
+def current_master_version() -> int:
+    """Version of the master key that wraps new data keys."""
+    return get_settings().credential_encryption_key_version
+
+
+def generate_data_key() -> bytes:
+    """Return a new random 256-bit data key."""
+    return AESGCM.generate_key(bit_length=256)
+
+
+def wrap_data_key(data_key: bytes, owner: str) -> tuple[str, int]:
+    """Encrypt a data key with the current master key.
+
+    The owner's UID is bound in as associated data, so a wrapped key copied
+    to another user's keyring does not unwrap. Returns the base64 blob and
+    the master key version used.
+    """
+    version = current_master_version()
+    nonce = os.urandom(_NONCE_SIZE)
+    wrapped = _get_master_ciphers()[version].encrypt(nonce, data_key, owner.encode("utf-8"))
+    return base64.b64encode(nonce + wrapped).decode("ascii"), version
+
+
+def unwrap_data_key(wrapped_b64: str, master_version: int, owner: str) -> bytes:
+    """Decrypt a data key wrapped by `wrap_data_key` with any configured master key."""
+    cipher = _get_master_ciphers().get(master_version)
+    if cipher is None:
+        raise RuntimeError(f"Master key version {master_version} is not configured")
+    raw = base64.b64decode(wrapped_b64)
+    return cipher.decrypt(raw[:_NONCE_SIZE], raw[_NONCE_SIZE:], owner.encode("utf-8"))
+
+
+def envelope_version(ciphertext: str | bytes) -> int | None:
+    """Return the data key version of an envelope ciphertext, or None for a legacy blob."""
+    if isinstance(ciphertext, bytes):
+        if not ciphertext:
+            raise ValueError("Ciphertext too short")
+        return ciphertext[0]
+    prefix, sep, _ = ciphertext.partition(_ENVELOPE_SEPARATOR)
+    if not sep:
+        return None
+    if not prefix.startswith("v") or not prefix[1:].isdigit():
+        raise ValueError("Malformed ciphertext version prefix")
+    return int(prefix[1:])
+
+
+def seal(cipher: AESGCM, version: int, plaintext: str) -> bytes:
+    """Encrypt with a data key cipher. Returns version byte + nonce + ciphertext + tag."""
+    if not 0 < version < 256:
+        raise ValueError(f"Data key version {version} does not fit in the version byte")
+    nonce = os.urandom(_NONCE_SIZE)
+    return bytes((version,)) + nonce + cipher.encrypt(nonce, plaintext.encode("utf-8"), None)
+
+
+def unseal(cipher: AESGCM, ciphertext: str | bytes) -> str:
+    """Decrypt an envelope ciphertext, binary or "v{n}:" text, with its data key."""
+    if isinstance(ciphertext, bytes):
+        return _open(cipher, ciphertext[1:])
+    return _decrypt_with(cipher, ciphertext.partition(_ENVELOPE_SEPARATOR)[2])
+
+
+def envelope_to_bytes(ciphertext: str) -> bytes:
+    """Convert a "v{n}:" text envelope to the binary format without decrypting it."""
+    version = envelope_version(ciphertext)
+    if version is None:
+        raise ValueError("Legacy ciphertexts must be re-sealed, not converted")
+    raw = base64.b64decode(ciphertext.partition(_ENVELOPE_SEPARATOR)[2])
+    return bytes((version,)) + raw
+
+
+def encrypt(plaintext: str) -> str:
+    """Encrypt a string with the master key. Returns base64(nonce + ciphertext + tag).
+
+    Credentials are sealed with the owner's data key instead (see app.lib.keyring).
+    """
+    return _encrypt_with(_get_cipher(), plaintext)
+
+
+def decrypt(ciphertext_b64: str) -> str:
+    """Decrypt a base64-encoded AES-256-GCM blob. Returns plaintext string."""
+    return _decrypt_with(_get_cipher(), ciphertext_b64)
+
+
+def decrypt_legacy(ciphertext_b64: str) -> str:
+    """Decrypt a pre-envelope blob with the current or, failing that, a retired master key."""
+    current = _get_cipher()
+    try:
+        return _decrypt_with(current, ciphertext_b64)
+    except InvalidTag:
+        retired = [c for c in _get_master_ciphers().values() if c is not current]
+        for cipher in retired:
+            try:
+                return _decrypt_with(cipher, ciphertext_b64)
+            except InvalidTag:
+                continue
+        raise
+
+
+# Worker threads for large batches; OpenSSL releases the GIL while it runs
+_WORKERS = min(4, os.cpu_count() or 1)
+
+
+@lru_cache
+def _get_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by the batch encrypt/decrypt functions."""
+    return ThreadPoolExecutor(max_workers=_WORKERS, thread_name_prefix="crypto")
+
+
+def _split[T](items: Sequence[T]) -> list[Sequence[T]]:
+    """Split a batch into one chunk per worker thread."""
+    size = -(-len(items) // _WORKERS)
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def _run_chunk[T, R](fn: Callable[[AESGCM, T], R], cipher: AESGCM, chunk: Sequence[T]) -> list[R]:
+    return [fn(cipher, item) for item in chunk]
+
+
+def _map_batch(fn: Callable[[AESGCM, str], str], items: Sequence[str], parallel: bool) -> list[str]:
+    cipher = _get_cipher()
+    if not parallel or _WORKERS == 1 or len(items) < _PARALLEL_THRESHOLD:
+        return _run_chunk(fn, cipher, items)
+    parts = _get_executor().map(lambda chunk: _run_chunk(fn, cipher, chunk), _split(items))
+    return [result for part in parts for result in part]
+
+
+async def _map_batch_async[T, R](
+    fn: Callable[[AESGCM, T], R], cipher: AESGCM, items: Sequence[T]
+) -> list[R]:
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    chunks = _split(items) if len(items) >= _PARALLEL_THRESHOLD else [items]
+    parts = await asyncio.gather(
+        *(loop.run_in_executor(executor, _run_chunk, fn, cipher, chunk) for chunk in chunks)
+    )
+    return [result for part in parts for result in part]
+
+
+def encrypt_many(plaintexts: Sequence[str], parallel: bool = True) -> list[str]:
+    """Encrypt many strings with the shared cipher, in order.
+
+    Batches of at least _PARALLEL_THRESHOLD items are split across the
+    crypto thread pool unless `parallel` is False.
+    """
+    return _map_batch(_encrypt_with, plaintexts, parallel)
+
+
+def decrypt_many(ciphertexts: Sequence[str], parallel: bool = True) -> list[str]:
+    """Decrypt many blobs with the shared cipher, in order (see encrypt_many).
+
+    Raises on the first blob that fails to decrypt.
+    """
+    return _map_batch(_decrypt_with, ciphertexts, parallel)
+
+
+async def encrypt_async(plaintext: str) -> str:
+    """Encrypt from async code; large plaintexts are encrypted in a worker thread."""
+    if len(plaintext) > _ASYNC_INLINE_LIMIT:
+        return await asyncio.to_thread(encrypt, plaintext)
+    return encrypt(plaintext)
+
+
+async def decrypt_async(ciphertext_b64: str) -> str:
+    """Decrypt from async code; large blobs are decrypted in a worker thread."""
+    if len(ciphertext_b64) > _ASYNC_INLINE_LIMIT:
+        return await asyncio.to_thread(decrypt, ciphertext_b64)
+    return decrypt(ciphertext_b64)
+
+
+async def encrypt_many_async(plaintexts: Sequence[str]) -> list[str]:
+    """Encrypt a batch on the crypto thread pool, off the event loop (see encrypt_many)."""
+    if not plaintexts:
+        return []
+    return await _map_batch_async(_encrypt_with, _get_cipher(), plaintexts)
+
+
+async def decrypt_many_async(ciphertexts: Sequence[str]) -> list[str]:
+    """Decrypt a batch on the crypto thread pool, off the event loop (see decrypt_many)."""
+    if not ciphertexts:
+        return []
+    return await _map_batch_async(_decrypt_with, _get_cipher(), ciphertexts)
+
+
+async def seal_many_async(cipher: AESGCM, version: int, plaintexts: Sequence[str]) -> list[bytes]:
+    """Seal a batch with a data key cipher on the crypto thread pool (see seal)."""
+    if not plaintexts:
+        return []
+    return await _map_batch_async(lambda c, p: seal(c, version, p), cipher, plaintexts)
+
+
 def mask_key(key: str) -> str:
     """Return a masked display hint, e.g. 'sk-...7f3a'.
 
@@ -0,0 +1,104 @@
+"""Fast JSON (and optional MessagePack) encoding for responses and websocket events.
+
+Uses orjson when it is installed (pip install -e ".[orjson]") and the
+standard library otherwise; both produce compact UTF-8 JSON. MessagePack
+needs the optional `msgpack` package.
+"""
+
+import json
+from typing import Any, cast
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover - depends on installed extras
+    orjson = None
+
+try:
+    import msgpack  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover - depends on installed extras
+    msgpack = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _dumps_stdlib(obj: Any) -> bytes:
+    # Same output as Starlette's JSONResponse
+    return json.dumps(
+        obj, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode to compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _dumps_stdlib(obj)
+
+
+def loads(data: bytes | str) -> Any:
+    """Decode JSON."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def msgpack_available() -> bool:
+    """Whether the optional msgpack package is installed."""
+    return msgpack is not None
+
+
+def packb(obj: Any) -> bytes:
+    """Encode to MessagePack."""
+    if msgpack is None:
+        raise RuntimeError('MessagePack needs the msgpack package: pip install -e ".[msgpack]"')
+    return cast(bytes, msgpack.packb(obj))
+
+
+def unpackb(data: bytes) -> Any:
+    """Decode MessagePack."""
+    if msgpack is None:
+        raise RuntimeError('MessagePack needs the msgpack package: pip install -e ".[msgpack]"')
+    return msgpack.unpackb(data)
+
+
+class Encoded:
+    """A message encoded once and sent unchanged to any number of connections.
+
+    Holds the JSON bytes; the text and MessagePack forms are derived on first
+    use and shared by every connection that needs them.
+    """
+
+    __slots__ = ("json", "_text", "_msgpack")
+
+    def __init__(self, json: bytes) -> None:
+        self.json = json
+        self._text: str | None = None
+        self._msgpack: bytes | None = None
+
+    @classmethod
+    def of(cls, obj: Any) -> "Encoded":
+        """Encode a message."""
+        return cls(dumps(obj))
+
+    @property
+    def text(self) -> str:
+        """The JSON as str, for websocket text frames."""
+        if self._text is None:
+            self._text = self.json.decode("utf-8")
+        return self._text
+
+    @property
+    def msgpack(self) -> bytes:
+        """The message as MessagePack, for binary websocket clients."""
+        if self._msgpack is None:
+            self._msgpack = packb(loads(self.json))
+        return self._msgpack
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with `dumps`; the app's default response class."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
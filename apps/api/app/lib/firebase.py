@@ -1,19 +1,23 @@
 """Firebase SDK initialization with emulator support."""
 
+import asyncio
 import os
 from typing import TYPE_CHECKING
 
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1 import AsyncClient as AsyncFirestoreClient
 from google.cloud.firestore_v1 import Client as FirestoreClient
 
 if TYPE_CHECKING:
-    from google.cloud.firestore_v1 import Client
+    from google.cloud.firestore_v1 import AsyncClient, Client
 
 from app.lib.config import get_settings
 
-# Cached client instance
+# Cached client instances
 _firestore_client: "Client | None" = None
+_async_firestore_client: "AsyncClient | None" = None
+_async_client_loop: asyncio.AbstractEventLoop | None = None
 
 
 def _initialize_app() -> firebase_admin.App | None:
@@ -58,3 +62,33 @@ def get_firestore_client() -> "Client":
         _firestore_client = firestore.client()
 
     return _firestore_client
+
+
+def get_async_firestore_client() -> "AsyncClient":
+    """Get the async Firestore client for use from request handlers.
+
+    The underlying gRPC channel is bound to the event loop it was first used
+    on, so a new client is created if called from a different loop (e.g.
+    test clients that run each request on a fresh loop).
+    """
+    global _async_firestore_client, _async_client_loop
+
+    try:
+        loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    if _async_firestore_client is not None and (loop is None or loop is _async_client_loop):
+        return _async_firestore_client
+
+    settings = get_settings()
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        # Production mode - make sure default credentials are initialized
+        _initialize_app()
+    # google-cloud-firestore auto-detects FIRESTORE_EMULATOR_HOST
+    _async_firestore_client = AsyncFirestoreClient(
+        project=settings.firebase_project_id,
+        database=settings.firestore_database,
+    )
+    _async_client_loop = loop
+    return _async_firestore_client
@@ -0,0 +1,381 @@
+"""Shared pooled HTTP client for outbound calls.
+
+One `httpx.AsyncClient` lives for the lifetime of the app so logins and token
+checks reuse keep-alive connections instead of paying a TCP/TLS handshake per
+call. On top of httpx's pool this adds per-host concurrency limits, a retry
+budget, a per-host circuit breaker and utilization counters.
+"""
+
+import asyncio
+import enum
+import logging
+import random
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+
+from app.lib.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRYABLE_STATUS = frozenset({502, 503, 504})
+# Errors raised before the request reached the server are always safe to retry
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when calls to a host are short-circuited after repeated failures."""
+
+    def __init__(self, host: str, retry_after: float) -> None:
+        super().__init__(f"Circuit open for {host}; retry in {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class RetryBudget:
+    """Caps retries at a fraction of recent request volume.
+
+    Every request deposits `ratio` tokens and every retry withdraws one, so
+    a failing dependency sees at most ~ratio extra load instead of
+    attempts-times the load. `min_tokens` allows a trickle of retries on
+    low-traffic instances.
+    """
+
+    def __init__(
+        self, ratio: float = 0.2, min_tokens: float = 10.0, max_tokens: float = 100.0
+    ) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+        self.retries = 0
+        self.exhausted = 0
+
+    def deposit(self) -> None:
+        """Credit the budget for one outgoing request."""
+        self.tokens = min(self.tokens + self.ratio, self.max_tokens)
+
+    def try_withdraw(self) -> bool:
+        """Spend one token on a retry. Returns False when the budget is empty."""
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            self.retries += 1
+            return True
+        self.exhausted += 1
+        return False
+
+
+class BreakerState(enum.StrEnum):
+    """Circuit breaker states."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for a single host."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def before_call(self, host: str) -> None:
+        """Raise CircuitOpenError unless a call may proceed."""
+        if self.state is BreakerState.OPEN:
+            elapsed = self.clock() - self.opened_at
+            if elapsed < self.reset_timeout:
+                raise CircuitOpenError(host, self.reset_timeout - elapsed)
+            self.state = BreakerState.HALF_OPEN
+        if self.state is BreakerState.HALF_OPEN:
+            if self._trial_in_flight:
+                raise CircuitOpenError(host, self.reset_timeout)
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def abandon(self) -> None:
+        """Release a half-open trial slot for a call that was cancelled."""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Count a failure, opening the circuit at the threshold."""
+        self._trial_in_flight = False
+        self.failures += 1
+        if self.state is BreakerState.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = BreakerState.OPEN
+            self.opened_at = self.clock()
+
+
+@dataclass
+class HostStats:
+    """Per-host counters."""
+
+    limit: asyncio.Semaphore
+    breaker: CircuitBreaker
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    latency_total: float = 0.0
+    waiting: int = 0
+
+
+class HttpClientPool:
+    """App-lifetime HTTP client with per-host limits, retries and breakers."""
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        max_connections_per_host: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        http2: bool = False,
+        retry_attempts: int = 2,
+        retry_backoff: float = 0.1,
+        retry_budget: RetryBudget | None = None,
+        breaker_threshold: int = 5,
+        breaker_reset_timeout: float = 30.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        """Create the pool. `transport` overrides the network layer (tests)."""
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested but the 'h2' package is missing; using HTTP/1.1")
+                http2 = False
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.retry_attempts = retry_attempts
+        self.retry_backoff = retry_backoff
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.http2 = http2
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            http2=http2,
+            transport=transport,
+        )
+        self._hosts: dict[str, HostStats] = {}
+
+    @classmethod
+    def from_settings(cls, keepalive: bool = True) -> "HttpClientPool":
+        """Create a pool configured from application settings.
+
+        Without `keepalive`, connections are closed after each request.
+        """
+        s = get_settings()
+        return cls(
+            max_connections=s.http_max_connections,
+            max_keepalive_connections=s.http_max_keepalive_connections if keepalive else 0,
+            max_connections_per_host=s.http_max_connections_per_host,
+            keepalive_expiry=s.http_keepalive_expiry,
+            timeout=s.http_timeout,
+            connect_timeout=s.http_connect_timeout,
+            http2=s.http2_enabled,
+            retry_attempts=s.http_retry_attempts,
+            retry_budget=RetryBudget(ratio=s.http_retry_budget_ratio),
+            breaker_threshold=s.http_breaker_threshold,
+            breaker_reset_timeout=s.http_breaker_reset_timeout,
+        )
+
+    def _host(self, url: httpx.URL) -> tuple[str, HostStats]:
+        key = f"{url.scheme}://{url.netloc.decode('ascii')}"
+        stats = self._hosts.get(key)
+        if stats is None:
+            stats = HostStats(
+                limit=asyncio.Semaphore(self.max_connections_per_host),
+                breaker=CircuitBreaker(self.breaker_threshold, self.breaker_reset_timeout),
+            )
+            self._hosts[key] = stats
+        return key, stats
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        idempotent: bool | None = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """Send a request, retrying transient failures within the budget.
+
+        Requests are only retried when they are idempotent (by method, or
+        `idempotent=True`) or when the failure happened before sending.
+        5xx responses other than 502/503/504 are returned as-is.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        host, stats = self._host(httpx.URL(url))
+        self.retry_budget.deposit()
+
+        attempt = 0
+        while True:
+            stats.breaker.before_call(host)
+            stats.waiting += 1
+            try:
+                await stats.limit.acquire()
+            except BaseException:
+                stats.breaker.abandon()
+                raise
+            finally:
+                stats.waiting -= 1
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+            stats.requests += 1
+            started = time.perf_counter()
+            try:
+                resp = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                stats.failures += 1
+                stats.breaker.record_failure()
+                retryable = idempotent or isinstance(e, _UNSENT_ERRORS)
+                if not retryable or not self._may_retry(attempt):
+                    raise
+            except BaseException:
+                stats.breaker.abandon()
+                raise
+            else:
+                if resp.status_code not in RETRYABLE_STATUS:
+                    stats.breaker.record_success()
+                    return resp
+                stats.failures += 1
+                stats.breaker.record_failure()
+                if not idempotent or not self._may_retry(attempt):
+                    return resp
+                await resp.aclose()
+            finally:
+                stats.in_flight -= 1
+                stats.latency_total += time.perf_counter() - started
+                stats.limit.release()
+            attempt += 1
+            # Exponential backoff with full jitter
+            await asyncio.sleep(random.uniform(0, self.retry_backoff * 2**attempt))
+
+    def _may_retry(self, attempt: int) -> bool:
+        return attempt < self.retry_attempts and self.retry_budget.try_withdraw()
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a GET request."""
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a POST request (not retried after sending unless `idempotent=True`)."""
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self) -> None:
+        """Close all pooled connections."""
+        await self.client.aclose()
+
+    def metrics(self) -> dict[str, Any]:
+        """Return pool utilization and per-host counters."""
+        in_flight = sum(h.in_flight for h in self._hosts.values())
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "in_flight": in_flight,
+            "utilization": round(in_flight / self.max_connections, 4),
+            "retries": self.retry_budget.retries,
+            "retry_budget_exhausted": self.retry_budget.exhausted,
+            "hosts": {
+                host: {
+                    "in_flight": h.in_flight,
+                    "peak_in_flight": h.peak_in_flight,
+                    "waiting": h.waiting,
+                    "limit": self.max_connections_per_host,
+                    "requests": h.requests,
+                    "failures": h.failures,
+                    "avg_latency_ms": round(h.latency_total / h.requests * 1000, 2)
+                    if h.requests
+                    else 0.0,
+                    "breaker": h.breaker.state.value,
+                }
+                for host, h in self._hosts.items()
+            },
+        }
+
+
+# Cached pool instance, bound to the event loop that created it
+_pool: HttpClientPool | None = None
+_pool_loop: asyncio.AbstractEventLoop | None = None
+# Whether _pool was started by the app lifespan rather than created lazily
+_pool_managed = False
+
+
+async def start_http_client() -> HttpClientPool:
+    """Create the shared pool. Called from the app lifespan."""
+    global _pool, _pool_loop, _pool_managed
+    if _pool is not None:
+        await _pool.aclose()
+    _pool = HttpClientPool.from_settings()
+    _pool_loop = asyncio.get_running_loop()
+    _pool_managed = True
+    return _pool
+
+
+async def close_http_client() -> None:
+    """Close the shared pool. Called from the app lifespan."""
+    global _pool, _pool_loop, _pool_managed
+    if _pool is not None:
+        await _pool.aclose()
+    _pool = None
+    _pool_loop = None
+    _pool_managed = False
+
+
+def get_http_client() -> HttpClientPool:
+    """Get the shared HTTP client pool.
+
+    Outside the app lifespan (scripts, tests without lifespan) a pool is
+    created lazily. Connections cannot cross event loops, so a new one is
+    made if the running loop changed; lazily created pools keep no idle
+    connections, so the pool left behind holds no open sockets once its
+    requests are done. The lifespan's pool is never replaced: using it from
+    another event loop while the app's loop is open raises RuntimeError.
+    """
+    global _pool, _pool_loop, _pool_managed
+    try:
+        loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if _pool is not None and loop is not None and _pool_loop is not loop:
+        if _pool_managed and _pool_loop is not None and not _pool_loop.is_closed():
+            raise RuntimeError("The shared HTTP client pool is bound to the app's event loop")
+        _pool = None
+    if _pool is None:
+        _pool = HttpClientPool.from_settings(keepalive=False)
+        _pool_loop = loop
+        _pool_managed = False
+    return _pool
+
+
+def get_http_metrics() -> dict[str, Any]:
+    """Return pool metrics, or an empty dict if no pool has been created."""
+    return _pool.metrics() if _pool is not None else {}
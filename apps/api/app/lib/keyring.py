@@ -0,0 +1,154 @@
+"""Envelope encryption of credentials with per-user data keys.
+
+Each user's credentials are sealed with that user's data key (DEK). The DEK
+is created on first use, stored wrapped by the master key (see
+app.repositories.keyring), and kept unwrapped in a small TTL cache so that
+sealing a credential normally costs no Firestore read. Rotating the master
+key only rewraps each user's DEK, which happens on its next load.
+"""
+
+import logging
+from collections.abc import Callable, Sequence
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, cast
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from google.api_core.exceptions import GoogleAPICallError
+
+if TYPE_CHECKING:
+    from google.cloud.firestore_v1 import AsyncClient
+
+from app.lib import crypto
+from app.lib.cache import TTLCache
+from app.lib.config import get_settings
+from app.lib.firebase import get_async_firestore_client
+from app.models.keyring import DataKey
+from app.repositories.keyring import AsyncKeyringRepository
+
+logger = logging.getLogger(__name__)
+
+# Attempts to load or create a user's data key when concurrent creators race
+_CREATE_ATTEMPTS = 3
+
+
+class Keyring:
+    """Seal and open credentials with their owner's data key."""
+
+    def __init__(
+        self,
+        client: Callable[[], "AsyncClient"],
+        maxsize: int = 1024,
+        ttl: float | None = 300.0,
+    ) -> None:
+        """Create a keyring reading data keys through `client()`.
+
+        Up to `maxsize` unwrapped data keys are cached for `ttl` seconds.
+        """
+        self._client = client
+        self._keys: TTLCache[str, tuple[int, AESGCM]] = TTLCache(maxsize, ttl)
+        self.created = 0
+        self.unwrapped = 0
+        self.rewrapped = 0
+        self.legacy_reads = 0
+
+    def _repo(self, uid: str) -> AsyncKeyringRepository:
+        return AsyncKeyringRepository(self._client(), uid)
+
+    async def data_key(self, uid: str) -> tuple[int, AESGCM]:
+        """Return the version and cipher of the user's data key, creating it if needed."""
+        cached = self._keys.get(uid)
+        if cached is not None:
+            return cached
+        repo = self._repo(uid)
+        stored = await repo.get()
+        for _ in range(_CREATE_ATTEMPTS):
+            if stored is None:
+                stored = await self._create(uid, repo)
+            if stored is None:
+                # Another request created the key first; read it straight from Firestore
+                stored = await repo.read()
+            if stored is not None:
+                entry = (stored.version, AESGCM(await self._unwrap(uid, repo, stored)))
+                self._keys.set(uid, entry)
+                return entry
+        raise RuntimeError(f"Could not load or create the data key for user {uid}")
+
+    async def _create(self, uid: str, repo: AsyncKeyringRepository) -> DataKey | None:
+        wrapped, master_version = crypto.wrap_data_key(crypto.generate_data_key(), uid)
+        created = await repo.create(DataKey(wrapped_key=wrapped, master_version=master_version))
+        if created is not None:
+            self.created += 1
+        return created
+
+    async def _unwrap(self, uid: str, repo: AsyncKeyringRepository, stored: DataKey) -> bytes:
+        key = crypto.unwrap_data_key(stored.wrapped_key, stored.master_version, uid)
+        self.unwrapped += 1
+        if stored.master_version != crypto.current_master_version():
+            # Lazy rotation: rewrap under the current master key; failure is retried next load
+            wrapped, master_version = crypto.wrap_data_key(key, uid)
+            try:
+                if await repo.rewrap(stored, wrapped, master_version) is not None:
+                    self.rewrapped += 1
+            except GoogleAPICallError:
+                logger.warning("Could not rewrap data key for user %s", uid, exc_info=True)
+        return key
+
+    async def rewrap(self, uid: str) -> bool:
+        """Rewrap the user's data key under the current master key if it is older.
+
+        Returns True if the stored key was rewritten.
+        """
+        repo = self._repo(uid)
+        stored = await repo.get()
+        if stored is None or stored.master_version == crypto.current_master_version():
+            return False
+        before = self.rewrapped
+        await self._unwrap(uid, repo, stored)
+        return self.rewrapped > before
+
+    async def encrypt(self, uid: str, plaintext: str) -> bytes:
+        """Seal one credential for `uid`."""
+        version, cipher = await self.data_key(uid)
+        return crypto.seal(cipher, version, plaintext)
+
+    async def encrypt_many(self, uid: str, plaintexts: Sequence[str]) -> list[bytes]:
+        """Seal a batch of credentials for `uid`, off the event loop."""
+        version, cipher = await self.data_key(uid)
+        return await crypto.seal_many_async(cipher, version, plaintexts)
+
+    async def decrypt(self, uid: str, ciphertext: str | bytes) -> str:
+        """Open a credential of `uid`, sealed with their data key or (legacy) the master key."""
+        version = crypto.envelope_version(ciphertext)
+        if version is None:
+            self.legacy_reads += 1
+            return crypto.decrypt_legacy(cast(str, ciphertext))
+        current, cipher = await self.data_key(uid)
+        if version != current:
+            raise ValueError(f"Credential was sealed with data key v{version}, not v{current}")
+        return crypto.unseal(cipher, ciphertext)
+
+    def forget(self, uid: str) -> None:
+        """Drop the user's cached data key."""
+        self._keys.pop(uid)
+
+    def stats(self) -> dict[str, Any]:
+        """Return data key cache and key management counters."""
+        return {
+            **self._keys.stats.as_dict(),
+            "size": len(self._keys),
+            "created": self.created,
+            "unwrapped": self.unwrapped,
+            "rewrapped": self.rewrapped,
+            "legacy_reads": self.legacy_reads,
+        }
+
+
+@lru_cache
+def get_keyring() -> Keyring:
+    """Get the process-wide keyring."""
+    s = get_settings()
+    return Keyring(
+        get_async_firestore_client,
+        maxsize=s.credential_dek_cache_size,
+        ttl=s.credential_dek_cache_ttl,
+    )
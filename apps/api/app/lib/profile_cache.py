@@ -0,0 +1,240 @@
+"""Read-through cache of user profiles for /api/auth/me.
+
+The desktop app fetches its profile on every window focus and reconnect, so
+User documents are cached in process (bounded, with a TTL) and, optionally,
+in a shared Redis-compatible store so all Cloud Run instances see the same
+value. Writes go through `AsyncUserRepository`, which refreshes both tiers.
+
+With a shared backend, each instance's in-process copy is kept only for a
+few seconds (`profile_cache_local_ttl`), which bounds how stale one instance
+can be after another instance writes. Backend failures are logged and
+treated as misses; the cache never fails a request.
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections.abc import Callable
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Protocol
+
+from app.lib.cache import TTLCache
+from app.lib.config import get_settings
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "mcontrol:profile:"
+
+
+class ProfileCacheBackend(Protocol):
+    """Shared key-value store for cached profiles (a subset of redis.asyncio.Redis)."""
+
+    async def get(self, name: str) -> bytes | str | None: ...
+
+    async def set(self, name: str, value: bytes, ex: int | None = None) -> Any: ...
+
+    async def delete(self, *names: str) -> Any: ...
+
+    async def aclose(self) -> None: ...
+
+
+class RedisBackend:
+    """Profile cache backend on a Redis server, connected lazily per event loop."""
+
+    def __init__(self, url: str) -> None:
+        """Create a backend for `url`; requires the optional `redis` package."""
+        self.url = url
+        self._client: Any = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_client(self) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            try:
+                import redis.asyncio as redis  # type: ignore[import-not-found]
+            except ImportError as e:
+                raise RuntimeError(
+                    'PROFILE_CACHE_REDIS_URL is set but redis is not installed: pip install -e ".[redis]"'
+                ) from e
+            self._client = redis.Redis.from_url(self.url)
+            self._loop = loop
+        return self._client
+
+    async def get(self, name: str) -> bytes | str | None:
+        return await self._get_client().get(name)
+
+    async def set(self, name: str, value: bytes, ex: int | None = None) -> Any:
+        return await self._get_client().set(name, value, ex=ex)
+
+    async def delete(self, *names: str) -> Any:
+        return await self._get_client().delete(*names)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+def _encode(user: User, cached_at: float) -> bytes:
+    data = user.to_dict()
+    data["created_at"] = user.created_at.isoformat()
+    data["updated_at"] = user.updated_at.isoformat()
+    return json.dumps({"id": user.id, "cached_at": cached_at, "user": data}).encode()
+
+
+def _decode(raw: bytes | str) -> tuple[User, float]:
+    payload = json.loads(raw)
+    data = payload["user"]
+    data["created_at"] = datetime.fromisoformat(data["created_at"])
+    data["updated_at"] = datetime.fromisoformat(data["updated_at"])
+    return User.from_dict(payload["id"], data), float(payload["cached_at"])
+
+
+class ProfileCache:
+    """Two-tier (in-process, then shared) TTL cache of User documents by Firebase UID."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        backend: ProfileCacheBackend | None = None,
+        local_ttl: float | None = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Create a cache of at most `maxsize` profiles, each kept for `ttl` seconds.
+
+        With a `backend`, entries are also stored there for `ttl`, and the
+        in-process copy is kept for `local_ttl` (default: `ttl`).
+        """
+        self.ttl = ttl
+        self.backend = backend
+        self.clock = clock
+        local = ttl if local_ttl is None or backend is None else min(ttl, local_ttl)
+        # Values are (user, cached_at) so staleness can be reported on every hit
+        self._local: TTLCache[str, tuple[User, float]] = TTLCache(maxsize, local, clock=clock)
+        self.backend_hits = 0
+        self.backend_errors = 0
+        self._served = 0
+        self._staleness_total = 0.0
+        self._staleness_max = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        """False when the cache is sized to zero."""
+        return self._local.maxsize > 0
+
+    def _served_entry(self, user: User, cached_at: float) -> User:
+        age = max(0.0, self.clock() - cached_at)
+        self._served += 1
+        self._staleness_total += age
+        self._staleness_max = max(self._staleness_max, age)
+        # Callers may mutate what they get back (e.g. apply_update)
+        return copy.copy(user)
+
+    async def get(self, uid: str) -> User | None:
+        """Return the cached profile for `uid`, or None on a miss."""
+        if not self.enabled:
+            return None
+        entry = self._local.get(uid)
+        if entry is not None:
+            return self._served_entry(*entry)
+        if self.backend is None:
+            return None
+
+        try:
+            raw = await self.backend.get(_KEY_PREFIX + uid)
+        except Exception:
+            self.backend_errors += 1
+            logger.warning("Profile cache backend read failed", exc_info=True)
+            return None
+        if raw is None:
+            return None
+        try:
+            user, cached_at = _decode(raw)
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Discarding malformed cached profile for %s", uid)
+            return None
+        self.backend_hits += 1
+        self._local.set(uid, (user, cached_at))
+        return self._served_entry(user, cached_at)
+
+    async def put(self, user: User) -> None:
+        """Store (or refresh) a profile in both tiers."""
+        if not self.enabled:
+            return
+        held = self._local.peek(user.firebase_uid)
+        if held is not None and held[0].updated_at > user.updated_at:
+            # A read that raced a write must not replace the newer profile
+            return
+        cached_at = self.clock()
+        self._local.set(user.firebase_uid, (copy.copy(user), cached_at))
+        if self.backend is None:
+            return
+        try:
+            await self.backend.set(
+                _KEY_PREFIX + user.firebase_uid, _encode(user, cached_at), ex=max(1, int(self.ttl))
+            )
+        except Exception:
+            self.backend_errors += 1
+            logger.warning("Profile cache backend write failed", exc_info=True)
+            # Without the write, the shared copy may be stale; drop it instead
+            await self._delete_shared(self.backend, user.firebase_uid)
+
+    async def invalidate(self, uid: str) -> None:
+        """Drop a profile from both tiers."""
+        self._local.pop(uid)
+        if self.backend is not None:
+            await self._delete_shared(self.backend, uid)
+
+    async def _delete_shared(self, backend: ProfileCacheBackend, uid: str) -> None:
+        try:
+            await backend.delete(_KEY_PREFIX + uid)
+        except Exception:
+            self.backend_errors += 1
+            logger.warning("Profile cache backend delete failed", exc_info=True)
+
+    async def aclose(self) -> None:
+        """Close the shared backend connection, if any."""
+        if self.backend is not None:
+            await self.backend.aclose()
+
+    def stats(self) -> dict[str, Any]:
+        """Return hit ratio, staleness and size counters for the metrics endpoint."""
+        local = self._local.stats
+        hits = local.hits + self.backend_hits
+        lookups = local.hits + local.misses
+        return {
+            "hits": hits,
+            "misses": lookups - hits,
+            "local_hits": local.hits,
+            "backend_hits": self.backend_hits,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "evictions": local.evictions,
+            "expirations": local.expirations,
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "backend_errors": self.backend_errors,
+            "size": len(self._local),
+            "maxsize": self._local.maxsize,
+            "staleness_avg_seconds": round(self._staleness_total / self._served, 3)
+            if self._served
+            else 0.0,
+            "staleness_max_seconds": round(self._staleness_max, 3),
+        }
+
+
+@lru_cache
+def get_profile_cache() -> ProfileCache:
+    """Get the process-wide profile cache."""
+    s = get_settings()
+    backend = RedisBackend(s.profile_cache_redis_url) if s.profile_cache_redis_url else None
+    return ProfileCache(
+        maxsize=s.profile_cache_size,
+        ttl=s.profile_cache_ttl,
+        backend=backend,
+        local_ttl=s.profile_cache_local_ttl,
+    )
@@ -0,0 +1,161 @@
+"""Cache of verified Firebase ID token claims.
+
+The desktop app reuses the same ID token for up to an hour, so re-verifying it
+on every request is wasted work. Verified claims are cached under a SHA-256
+digest of the token (the raw token is never stored) until the token's `exp`.
+
+Revocations are applied locally and returned as messages for the caller to
+broadcast on REVOCATION_TOPIC; every instance applies them with
+`apply_revocation`, so a token revoked on one instance is rejected by all.
+"""
+
+import base64
+import hashlib
+import heapq
+import json
+import time
+from collections.abc import Callable
+from functools import lru_cache
+from typing import Any
+
+from app.lib.cache import TTLCache
+from app.lib.config import get_settings
+
+# Firebase ID tokens are valid for at most one hour after issue.
+MAX_TOKEN_LIFETIME = 3600.0
+
+# Websocket backbone topic revocations are broadcast on; clients cannot subscribe to it
+REVOCATION_TOPIC = "auth:revocations"
+
+
+def peek_claims(token: str) -> dict[str, Any]:
+    """Decode a JWT payload WITHOUT verifying it.
+
+    Only used to bound cache lifetimes for tokens that were verified by other
+    means (e.g. the Auth emulator, which does not return `exp`).
+    """
+    try:
+        payload = token.split(".")[1]
+        padded = payload + "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(padded))
+    except (IndexError, ValueError):
+        return {}
+    return claims if isinstance(claims, dict) else {}
+
+
+class VerifiedTokenCache:
+    """Bounded LRU cache of verified token claims with explicit revocation."""
+
+    def __init__(
+        self,
+        maxsize: int = 4096,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Create a cache holding at most `maxsize` verified tokens."""
+        self.clock = clock
+        self._claims: TTLCache[bytes, dict[str, Any]] = TTLCache(maxsize, clock=clock)
+        # Digest -> expiry of explicitly revoked tokens. Bounded only by expiry, never
+        # by size: evicting a revocation early would make its token valid again.
+        self._revoked: dict[bytes, float] = {}
+        self._revoked_expiry: list[tuple[float, bytes]] = []
+        # uid -> time before which issued tokens are rejected
+        self._revoked_before: dict[str, float] = {}
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def _expires_at(self, token: str, claims: dict[str, Any]) -> float:
+        exp = claims.get("exp") or peek_claims(token).get("exp")
+        ceiling = self.clock() + MAX_TOKEN_LIFETIME
+        if isinstance(exp, int | float):
+            return min(float(exp), ceiling)
+        return ceiling
+
+    def get(self, token: str) -> dict[str, Any] | None:
+        """Return cached claims for a token, or None if it must be verified."""
+        return self._claims.get(self._key(token))
+
+    def put(self, token: str, claims: dict[str, Any]) -> None:
+        """Cache verified claims until the token expires."""
+        self._claims.set(self._key(token), claims, self._expires_at(token, claims))
+
+    def is_revoked(self, token: str, claims: dict[str, Any]) -> bool:
+        """Check a freshly verified token against the revocation lists."""
+        expires = self._revoked.get(self._key(token))
+        if expires is not None and expires > self.clock():
+            return True
+        cutoff = self._revoked_before.get(claims.get("uid", ""))
+        if cutoff is None:
+            return False
+        issued = claims.get("auth_time") or claims.get("iat") or peek_claims(token).get("iat")
+        return not isinstance(issued, int | float) or issued < cutoff
+
+    def revoke(self, token: str) -> dict[str, Any]:
+        """Reject a single token until it expires.
+
+        Returns the revocation for other instances (see apply_revocation).
+        """
+        key = self._key(token)
+        expires = self._expires_at(token, self._claims.pop(key) or {})
+        self._revoke_key(key, expires)
+        return {"token": key.hex(), "expires": expires}
+
+    def _revoke_key(self, key: bytes, expires: float) -> None:
+        self._claims.pop(key)
+        self._prune_revoked()
+        if self._revoked.get(key, 0.0) < expires:
+            self._revoked[key] = expires
+            heapq.heappush(self._revoked_expiry, (expires, key))
+
+    def _prune_revoked(self) -> None:
+        """Forget revocations of tokens that have expired anyway."""
+        now = self.clock()
+        while self._revoked_expiry and self._revoked_expiry[0][0] <= now:
+            expires, key = heapq.heappop(self._revoked_expiry)
+            if self._revoked.get(key) == expires:
+                del self._revoked[key]
+
+    def revoke_user(self, uid: str, before: float | None = None) -> dict[str, Any]:
+        """Reject every token for `uid` issued before `before` (default: now).
+
+        Returns the revocation for other instances (see apply_revocation).
+        """
+        now = self.clock()
+        cutoff = now if before is None else before
+        self._revoked_before[uid] = max(cutoff, self._revoked_before.get(uid, cutoff))
+        # Cutoffs older than the max token lifetime can no longer match anything
+        stale = now - MAX_TOKEN_LIFETIME
+        self._revoked_before = {u: t for u, t in self._revoked_before.items() if t > stale}
+        for key, claims in self._claims.items():
+            if claims.get("uid") == uid:
+                self._claims.pop(key)
+        return {"uid": uid, "before": cutoff}
+
+    def apply_revocation(self, message: dict[str, Any]) -> None:
+        """Apply a revocation returned by revoke or revoke_user on any instance."""
+        if "token" in message:
+            self._revoke_key(bytes.fromhex(message["token"]), float(message["expires"]))
+        elif "uid" in message:
+            self.revoke_user(message["uid"], float(message["before"]))
+
+    def clear(self) -> None:
+        """Drop all cached claims and revocations."""
+        self._claims.clear()
+        self._revoked.clear()
+        self._revoked_expiry.clear()
+        self._revoked_before.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """Return hit/miss counters and current size."""
+        return {
+            **self._claims.stats.as_dict(),
+            "size": len(self._claims),
+            "maxsize": self._claims.maxsize,
+        }
+
+
+@lru_cache
+def get_token_cache() -> VerifiedTokenCache:
+    """Get the process-wide verified token cache."""
+    return VerifiedTokenCache(maxsize=get_settings().token_cache_size)
@@ -0,0 +1,277 @@
+"""Offline Firebase ID token verification with a background-refreshed key set.
+
+`firebase_admin.auth.verify_id_token` is synchronous and fetches Google's
+signing certificates on the calling thread whenever its cache expires, which
+stalls the event loop. This verifier keeps the certificates in memory,
+refreshes them from a background task before their Cache-Control expiry, and
+checks signatures and claims without any network I/O on the request path.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import re
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+
+from app.lib.config import get_settings
+from app.lib.http import CircuitOpenError, HttpClientPool, get_http_client
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class InvalidTokenError(ValueError):
+    """Raised when an ID token fails signature or claim validation."""
+
+
+@dataclass
+class KeySet:
+    """Public keys by key ID, with the time they stop being fresh."""
+
+    keys: dict[str, RSAPublicKey] = field(default_factory=dict)
+    fetched_at: float = 0.0
+    expires_at: float = 0.0
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def parse_max_age(cache_control: str | None, default: float) -> float:
+    """Return the max-age in seconds from a Cache-Control header."""
+    if cache_control:
+        match = _MAX_AGE_RE.search(cache_control)
+        if match:
+            return float(match.group(1))
+    return default
+
+
+class FirebaseTokenVerifier:
+    """Verify Firebase ID tokens against an in-memory copy of Google's certs."""
+
+    def __init__(
+        self,
+        project_id: str,
+        certs_url: str = GOOGLE_CERTS_URL,
+        client: httpx.AsyncClient | HttpClientPool | None = None,
+        refresh_fraction: float = 0.9,
+        retry_interval: float = 30.0,
+        min_refresh_interval: float = 60.0,
+        default_max_age: float = 3600.0,
+        leeway: float = 0.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Create a verifier for tokens issued to `project_id`.
+
+        Certificates are fetched with `client`, or the shared HTTP client pool
+        if none is given. Keys are refreshed once `refresh_fraction` of their max-age has
+        elapsed. Failed refreshes are retried every `retry_interval` seconds
+        while the previous keys stay in use; with no keys at all, requests
+        fail fast for that long instead of each retrying the fetch. Tokens signed by an unknown key
+        trigger an early refresh at most once per `min_refresh_interval`.
+        """
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.certs_url = certs_url
+        self.refresh_fraction = refresh_fraction
+        self.retry_interval = retry_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.default_max_age = default_max_age
+        self.leeway = leeway
+        self.clock = clock
+        self.key_set = KeySet()
+        self.refresh_count = 0
+        # When the last refresh failed, if it did
+        self.failed_at: float | None = None
+        self._client = client
+        self._task: asyncio.Task[None] | None = None
+        # Created in start() so they bind to the loop that runs the refresh task
+        self._wake: asyncio.Event | None = None
+        self._refresh_lock: asyncio.Lock | None = None
+
+    # -- key management -----------------------------------------------------
+
+    async def refresh(self) -> KeySet:
+        """Fetch the current certificates and swap them in."""
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            try:
+                return await self._refresh()
+            except Exception:
+                self.failed_at = self.clock()
+                raise
+
+    async def _refresh(self) -> KeySet:
+        client = self._client or get_http_client()
+        resp = await client.get(self.certs_url)
+        resp.raise_for_status()
+        certs: dict[str, str] = resp.json()
+        keys: dict[str, RSAPublicKey] = {}
+        for kid, pem in certs.items():
+            public_key = x509.load_pem_x509_certificate(pem.encode("ascii")).public_key()
+            if isinstance(public_key, RSAPublicKey):
+                keys[kid] = public_key
+        now = self.clock()
+        max_age = parse_max_age(resp.headers.get("cache-control"), self.default_max_age)
+        self.key_set = KeySet(keys=keys, fetched_at=now, expires_at=now + max_age)
+        self.failed_at = None
+        self.refresh_count += 1
+        logger.info("Loaded %d token signing keys (max-age=%ds)", len(keys), max_age)
+        return self.key_set
+
+    def _next_refresh_delay(self) -> float:
+        ks = self.key_set
+        lifetime = ks.expires_at - ks.fetched_at
+        due = ks.fetched_at + lifetime * self.refresh_fraction
+        return max(due - self.clock(), 0.0)
+
+    async def _refresh_loop(self, wake: asyncio.Event) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=self._next_refresh_delay())
+            except TimeoutError:
+                pass
+            wake.clear()
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Token signing key refresh failed; keeping previous keys")
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=self.retry_interval)
+                except TimeoutError:
+                    pass
+
+    async def start(self) -> None:
+        """Load the keys and start the background refresh task."""
+        if self._task is not None:
+            return
+        self._wake = asyncio.Event()
+        self._refresh_lock = asyncio.Lock()
+        try:
+            await self.refresh()
+        except Exception:
+            logger.exception("Initial token signing key fetch failed; will retry in background")
+        self._task = asyncio.create_task(self._refresh_loop(self._wake), name="token-key-refresh")
+
+    async def stop(self) -> None:
+        """Stop the background refresh task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._wake = None
+
+    # -- verification -------------------------------------------------------
+
+    def verify(self, token: str) -> dict[str, Any]:
+        """Verify a token using only the in-memory key set.
+
+        Returns the decoded claims with `uid` set to `sub`, matching the shape
+        returned by `firebase_admin.auth.verify_id_token`.
+        """
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            header = json.loads(_b64decode(header_b64))
+            claims = json.loads(_b64decode(payload_b64))
+            signature = _b64decode(signature_b64)
+        except ValueError as e:
+            raise InvalidTokenError("Malformed token") from e
+
+        if header.get("alg") != "RS256":
+            raise InvalidTokenError("Unexpected signing algorithm")
+
+        public_key = self.key_set.keys.get(header.get("kid", ""))
+        if public_key is None:
+            # Google may have rotated keys early; pull them in the background
+            since_fetch = self.clock() - self.key_set.fetched_at
+            if self._wake is not None and since_fetch >= self.min_refresh_interval:
+                self._wake.set()
+            raise InvalidTokenError("Unknown signing key")
+
+        try:
+            public_key.verify(
+                signature,
+                f"{header_b64}.{payload_b64}".encode("ascii"),
+                padding.PKCS1v15(),
+                hashes.SHA256(),
+            )
+        except InvalidSignature as e:
+            raise InvalidTokenError("Invalid signature") from e
+
+        self._check_claims(claims)
+        claims["uid"] = claims["sub"]
+        return claims
+
+    def _check_claims(self, claims: dict[str, Any]) -> None:
+        now = self.clock()
+        if claims.get("aud") != self.project_id:
+            raise InvalidTokenError("Incorrect audience")
+        if claims.get("iss") != self.issuer:
+            raise InvalidTokenError("Incorrect issuer")
+        sub = claims.get("sub")
+        if not isinstance(sub, str) or not sub or len(sub) > 128:
+            raise InvalidTokenError("Invalid subject")
+        exp = claims.get("exp")
+        if not isinstance(exp, int | float) or exp + self.leeway <= now:
+            raise InvalidTokenError("Token expired")
+        iat = claims.get("iat")
+        if not isinstance(iat, int | float) or iat - self.leeway > now:
+            raise InvalidTokenError("Token issued in the future")
+        auth_time = claims.get("auth_time")
+        if auth_time is not None and auth_time - self.leeway > now:
+            raise InvalidTokenError("Authentication time in the future")
+
+    async def verify_async(self, token: str) -> dict[str, Any]:
+        """Verify a token, loading the keys first if they were never fetched.
+
+        Raises CircuitOpenError if there are no keys and the last fetch failed
+        less than `retry_interval` seconds ago; the background task retries it.
+        """
+        if not self.key_set.keys:
+            self._check_backoff()
+            if self._refresh_lock is None:
+                self._refresh_lock = asyncio.Lock()
+            async with self._refresh_lock:
+                # Requests queued behind a fetch do not repeat it
+                if not self.key_set.keys:
+                    self._check_backoff()
+                    try:
+                        await self._refresh()
+                    except Exception:
+                        self.failed_at = self.clock()
+                        raise
+        return self.verify(token)
+
+    def _check_backoff(self) -> None:
+        if self.failed_at is not None:
+            retry_after = self.failed_at + self.retry_interval - self.clock()
+            if retry_after > 0:
+                raise CircuitOpenError(urlsplit(self.certs_url).netloc, retry_after)
+
+
+@lru_cache
+def get_token_verifier() -> FirebaseTokenVerifier:
+    """Get the process-wide token verifier."""
+    return FirebaseTokenVerifier(project_id=get_settings().firebase_project_id)
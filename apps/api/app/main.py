@@ -1,12 +1,25 @@
 """FastAPI application factory."""
 
 import logging
+import os
 import sys
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
+from app.lib.config import get_settings
+from app.lib.encoding import FastJSONResponse
+from app.lib.http import CircuitOpenError, close_http_client, start_http_client
+from app.lib.profile_cache import get_profile_cache
+from app.lib.token_cache import REVOCATION_TOPIC, get_token_cache
+from app.lib.token_verifier import get_token_verifier
+from app.realtime.manager import get_connection_manager
+from app.repositories.identity import IdentityMapMiddleware
 from app.routes import auth, health, keys, websocket
+from app.tasks.engine import get_task_engine
 
 # Configure logging to stdout so Cloud Run captures it
 logging.basicConfig(
@@ -17,6 +30,41 @@ logging.basicConfig(
 )
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Start and stop background services for the app's lifetime."""
+    verify_tokens = not get_settings().auth_disabled and not os.environ.get(
+        "FIREBASE_AUTH_EMULATOR_HOST"
+    )
+    await start_http_client()
+    # Sign-outs on any instance, applied to the token cache before closing websockets
+    manager = get_connection_manager()
+    manager.listen(REVOCATION_TOPIC, get_token_cache().apply_revocation)
+    manager.listen(REVOCATION_TOPIC, websocket.close_revoked)
+    if verify_tokens:
+        await get_token_verifier().start()
+    try:
+        yield
+    finally:
+        if verify_tokens:
+            await get_token_verifier().stop()
+        await get_profile_cache().aclose()
+        # Cancel tasks first so their final status is published before the manager closes
+        await get_task_engine().aclose()
+        await get_connection_manager().aclose()
+        await close_http_client()
+
+
+async def circuit_open_handler(request: Request, exc: Exception) -> JSONResponse:
+    """Report a tripped outbound circuit breaker as 503 Service Unavailable."""
+    retry_after = exc.retry_after if isinstance(exc, CircuitOpenError) else 30
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(retry_after) + 1)},
+    )
+
+
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application."""
     app = FastAPI(
@@ -26,6 +74,8 @@ def create_app() -> FastAPI:
         docs_url="/api/docs",
         redoc_url="/api/redoc",
         openapi_url="/api/openapi.json",
+        lifespan=lifespan,
+        default_response_class=FastJSONResponse,
     )
 
     # Configure CORS
@@ -39,8 +89,14 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Page-Token"],
     )
 
+    # One identity map per request, so repeated document reads cost one RPC
+    app.add_middleware(IdentityMapMiddleware)
+
+    app.add_exception_handler(CircuitOpenError, circuit_open_handler)
+
     # Include routers
     app.include_router(auth.router, prefix="/api")
     app.include_router(health.router, prefix="/api")
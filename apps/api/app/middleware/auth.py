@@ -7,6 +7,8 @@ from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 from app.lib.config import get_settings
+from app.lib.http import CircuitOpenError
+from app.lib.token_cache import get_token_cache
 
 security = HTTPBearer(auto_error=False)
 
@@ -34,29 +36,50 @@ async def get_current_user(
     """
     Validate Firebase token and return current user.
 
+    Verified claims are cached until the token expires, so repeat requests
+    with the same token skip verification.
     When AUTH_DISABLED=true, returns a dev user without validation.
     """
+    return await authenticate(credentials.credentials if credentials else None)
+
+
+async def authenticate(token: str | None) -> AuthUser:
+    """Verify a bearer token and return its user, raising 401 if it is missing or invalid.
+
+    Shared by get_current_user and the websocket endpoint, which cannot use
+    the HTTPBearer dependency.
+    """
     settings = get_settings()
 
     # Dev bypass - skip auth validation
     if settings.auth_disabled:
         return AuthUser(uid="dev-user", email="dev@localhost")
 
-    if credentials is None:
+    if token is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Missing authentication token",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    token = credentials.credentials
+    token_cache = get_token_cache()
 
     try:
-        emulator_host = os.environ.get("FIREBASE_AUTH_EMULATOR_HOST")
-        if emulator_host:
-            decoded = await _verify_token_emulator(token, emulator_host)
-        else:
-            decoded = _verify_token_production(token)
+        decoded = token_cache.get(token)
+        if decoded is None:
+            emulator_host = os.environ.get("FIREBASE_AUTH_EMULATOR_HOST")
+            if emulator_host:
+                decoded = await _verify_token_emulator(token, emulator_host)
+            else:
+                decoded = await _verify_token_production(token)
+
+            if token_cache.is_revoked(token, decoded):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Token has been revoked",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            token_cache.put(token, decoded)
 
         return AuthUser(
             uid=decoded["uid"],
@@ -66,6 +89,9 @@ async def get_current_user(
         )
     except HTTPException:
         raise
+    except CircuitOpenError:
+        # Verification is unavailable, not failed: reported as 503 by the app's handler
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -74,47 +100,43 @@ async def get_current_user(
         ) from e
 
 
-def _verify_token_production(token: str) -> dict:
-    """Verify token using Firebase Admin SDK (production)."""
-    from firebase_admin import auth
-
-    from app.lib.firebase import _initialize_app
+async def _verify_token_production(token: str) -> dict:
+    """Verify token against Google's signing keys held in memory (production)."""
+    from app.lib.token_verifier import get_token_verifier
 
-    _initialize_app()
-    decoded = auth.verify_id_token(token)
-    return decoded
+    return await get_token_verifier().verify_async(token)
 
 
 async def _verify_token_emulator(token: str, emulator_host: str) -> dict:
     """Verify token against Firebase Auth emulator."""
-    import httpx
+    from app.lib.http import get_http_client
 
     url = f"http://{emulator_host}/identitytoolkit.googleapis.com/v1/accounts:lookup"
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            url,
-            json={"idToken": token},
-            params={"key": "fake-api-key"},
+    resp = await get_http_client().post(
+        url,
+        json={"idToken": token},
+        params={"key": "fake-api-key"},
+        idempotent=True,
+    )
+    if resp.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token",
+        )
+    data = resp.json()
+    users = data.get("users", [])
+    if not users:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
         )
-        if resp.status_code != 200:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token",
-            )
-        data = resp.json()
-        users = data.get("users", [])
-        if not users:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found",
-            )
-        user = users[0]
-        return {
-            "uid": user["localId"],
-            "email": user.get("email"),
-            "name": user.get("displayName"),
-            "picture": user.get("photoUrl"),
-        }
+    user = users[0]
+    return {
+        "uid": user["localId"],
+        "email": user.get("email"),
+        "name": user.get("displayName"),
+        "picture": user.get("photoUrl"),
+    }
 
 
 # Dependency for protected routes
@@ -1,13 +1,20 @@
 """Firestore document models."""
 
-from dataclasses import asdict, dataclass, field
+from dataclasses import dataclass, field
 from datetime import UTC, datetime
-from typing import Any, ClassVar
+from typing import Any, ClassVar, Self
 
+from app.models.codec import decoder_for, encoder_for
 
-@dataclass
+
+@dataclass(slots=True)
 class BaseDocument:
-    """Base class for all Firestore document models."""
+    """Base class for all Firestore document models.
+
+    Subclasses are declared with `@dataclass(slots=True)`. `to_dict` and
+    `from_dict` use encode/decode functions generated from the dataclass
+    fields (see app.models.codec), so subclasses do not hand-write them.
+    """
 
     COLLECTION: ClassVar[str] = ""
 
@@ -16,14 +23,18 @@ class BaseDocument:
     updated_at: datetime = field(default_factory=lambda: datetime.now(UTC))
 
     def to_dict(self) -> dict[str, Any]:
-        """Convert model to dictionary for Firestore storage."""
-        data = asdict(self)
-        # Remove id from dict (it's the document ID, not a field)
-        data.pop("id", None)
-        return data
+        """Convert model to dictionary for Firestore storage (without the id)."""
+        return encoder_for(type(self))(self)
+
+    def apply_update(self, data: dict[str, Any]) -> Self:
+        """Apply a partial update, as written to Firestore, to this instance."""
+        fields = self.__dataclass_fields__
+        for name, value in data.items():
+            if name != "id" and name in fields:
+                setattr(self, name, value)
+        return self
 
     @classmethod
-    def from_dict(cls, doc_id: str, data: dict[str, Any]) -> "BaseDocument":
+    def from_dict(cls, doc_id: str, data: dict[str, Any]) -> Self:
         """Create model instance from Firestore document data."""
-        data["id"] = doc_id
-        return cls(**data)
+        return decoder_for(cls)(doc_id, data)
@@ -0,0 +1,70 @@
+"""Generated encode/decode functions for document dataclasses.
+
+`dataclasses.asdict` walks and deep-copies every value on each call, and the
+hand-written `from_dict` methods evaluated `datetime.now(UTC)` defaults for
+every field on every hydrate. The functions here are generated once per
+class from its dataclass fields, the same way `dataclasses` builds
+`__init__`: encoding is a single dict literal of attribute reads, and
+decoding assigns slots directly, calling a default factory only when the
+field is missing from the stored data.
+
+Values are not copied, so mutable field values are shared between a model
+and its encoded dict. Document fields are scalars and datetimes.
+"""
+
+import dataclasses
+from collections.abc import Callable
+from functools import cache
+from typing import Any
+
+Encoder = Callable[[Any], dict[str, Any]]
+Decoder = Callable[[str, dict[str, Any]], Any]
+
+# Field holding the document ID; it is the key, not stored data
+ID_FIELD = "id"
+
+_MISSING = object()
+
+
+def _fields(cls: type) -> list[dataclasses.Field[Any]]:
+    return [f for f in dataclasses.fields(cls) if f.name != ID_FIELD]
+
+
+def _compile(name: str, source: str, namespace: dict[str, Any]) -> Any:
+    exec(compile(source, f"<codec {name}>", "exec"), namespace)
+    return namespace[name]
+
+
+@cache
+def encoder_for(cls: type) -> Encoder:
+    """Return a function mapping an instance of `cls` to its stored fields."""
+    items = "".join(f"{f.name!r}: self.{f.name}, " for f in _fields(cls))
+    source = f"def encode(self):\n    return {{{items}}}\n"
+    return _compile("encode", source, {})
+
+
+@cache
+def decoder_for(cls: type) -> Decoder:
+    """Return a function building an instance of `cls` from a document ID and stored data.
+
+    Missing fields take the dataclass default; unknown keys are ignored.
+    """
+    namespace: dict[str, Any] = {"_new": object.__new__, "_cls": cls, "_MISSING": _MISSING}
+    lines = [
+        "def decode(doc_id, data):",
+        "    self = _new(_cls)",
+        "    get = data.get",
+        f"    self.{ID_FIELD} = doc_id",
+    ]
+    for f in _fields(cls):
+        if f.default_factory is not dataclasses.MISSING:
+            namespace[f"_factory_{f.name}"] = f.default_factory
+            lines.append(f"    value = get({f.name!r}, _MISSING)")
+            lines.append(f"    self.{f.name} = _factory_{f.name}() if value is _MISSING else value")
+        elif f.default is not dataclasses.MISSING:
+            namespace[f"_default_{f.name}"] = f.default
+            lines.append(f"    self.{f.name} = get({f.name!r}, _default_{f.name})")
+        else:
+            lines.append(f"    self.{f.name} = data[{f.name!r}]")
+    lines.append("    return self")
+    return _compile("decode", "\n".join(lines) + "\n", namespace)
@@ -2,20 +2,32 @@
 
 from dataclasses import dataclass, field
 from datetime import UTC, datetime
-from typing import Any, ClassVar
+from typing import ClassVar
 
 from app.models import BaseDocument
 
 
-@dataclass
-class CredentialDocument(BaseDocument):
-    """Credential stored as a subcollection under users/{uid}/credentials."""
+@dataclass(slots=True)
+class CredentialSummary(BaseDocument):
+    """Masked view of a credential, without the encrypted key.
+
+    Read paths that only show metadata load this through a Firestore
+    projection, so the ciphertext is never fetched or held in memory.
+    """
 
     COLLECTION: ClassVar[str] = "credentials"
 
+    # Stored fields to request in a projection
+    FIELDS: ClassVar[tuple[str, ...]] = (
+        "provider",
+        "name",
+        "key_suffix",
+        "created_at",
+        "updated_at",
+    )
+
     provider: str = ""
     name: str = ""
-    encrypted_key: str = ""
     key_suffix: str = ""
 
     # Override base fields with defaults
@@ -23,15 +35,10 @@ class CredentialDocument(BaseDocument):
     created_at: datetime = field(default_factory=lambda: datetime.now(UTC))
     updated_at: datetime = field(default_factory=lambda: datetime.now(UTC))
 
-    @classmethod
-    def from_dict(cls, doc_id: str, data: dict[str, Any]) -> "CredentialDocument":
-        """Create CredentialDocument instance from Firestore document data."""
-        return cls(
-            id=doc_id,
-            provider=data.get("provider", ""),
-            name=data.get("name", ""),
-            encrypted_key=data.get("encrypted_key", ""),
-            key_suffix=data.get("key_suffix", ""),
-            created_at=data.get("created_at", datetime.now(UTC)),
-            updated_at=data.get("updated_at", datetime.now(UTC)),
-        )
+
+@dataclass(slots=True)
+class CredentialDocument(CredentialSummary):
+    """Credential stored as a subcollection under users/{uid}/credentials."""
+
+    # New writes store bytes (see app.lib.crypto); older documents hold base64 text
+    encrypted_key: bytes | str = ""
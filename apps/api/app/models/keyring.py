@@ -0,0 +1,31 @@
+"""Per-user data key (DEK) document model for envelope encryption."""
+
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import ClassVar
+
+from app.models import BaseDocument
+
+
+@dataclass(slots=True)
+class DataKey(BaseDocument):
+    """A user's credential data key, stored wrapped at users/{uid}/keyring/dek.
+
+    Rotating the master key only rewraps this document; credentials sealed
+    with the data key are left untouched.
+    """
+
+    COLLECTION: ClassVar[str] = "keyring"
+    DOC_ID: ClassVar[str] = "dek"
+
+    # Written into the prefix of every ciphertext sealed with this key
+    version: int = 1
+    # base64(nonce + AES-GCM(master key, data key)), see app.lib.crypto.wrap_data_key
+    wrapped_key: str = ""
+    # Version of the master key that wrapped it
+    master_version: int = 1
+
+    # Override base fields with defaults
+    id: str = ""
+    created_at: datetime = field(default_factory=lambda: datetime.now(UTC))
+    updated_at: datetime = field(default_factory=lambda: datetime.now(UTC))
@@ -0,0 +1 @@
+"""Real-time delivery to desktop clients over /api/ws."""
@@ -0,0 +1,317 @@
+"""Pub/sub backbone that carries websocket events between API instances.
+
+Each Cloud Run instance only holds its own websocket connections. Events are
+published to the backbone, which delivers them to every instance subscribed
+to the topic, including the publisher; each instance then fans them out to
+its local connections. An instance subscribes only to topics its own
+connections are subscribed to. Payloads cross the backbone as bytes,
+encoded once by the publisher.
+
+The backbone also numbers each topic's events (1, 2, 3, ...), so clients can
+tell which events they missed while disconnected, and records which user
+owns a topic, so every instance can check who may subscribe to it.
+"""
+
+import asyncio
+import contextlib
+import logging
+from collections.abc import Callable
+from typing import Any, Protocol
+
+logger = logging.getLogger(__name__)
+
+_CHANNEL_PREFIX = "mcontrol:ws:"
+_SEQUENCE_PREFIX = "mcontrol:ws-seq:"
+_OWNER_PREFIX = "mcontrol:ws-owner:"
+# Follows the sequence number of entity state updates
+_STATE_MARK = b" state"
+
+# Called with (topic, sequence number, payload, whether it is entity state) for every
+# event received for a subscribed topic; any return value is ignored
+Deliver = Callable[[str, int, bytes, bool], object]
+
+
+class Backbone(Protocol):
+    """Transport for published events between instances."""
+
+    def attach(self, deliver: Deliver) -> None:
+        """Set the callback that receives events for subscribed topics."""
+        ...
+
+    def subscribe(self, topic: str) -> None:
+        """Start receiving events for a topic (takes effect asynchronously)."""
+        ...
+
+    def unsubscribe(self, topic: str) -> None:
+        """Stop receiving events for a topic."""
+        ...
+
+    async def next_sequence(self, topic: str) -> int:
+        """Allocate the topic's next sequence number, or 0 if none could be allocated."""
+        ...
+
+    async def last_sequence(self, topic: str) -> int | None:
+        """The topic's most recently allocated sequence number, if known."""
+        ...
+
+    async def claim(self, topic: str, uid: str) -> bool:
+        """Record `uid` as the topic's owner unless another user already is; returns
+        whether `uid` owns it."""
+        ...
+
+    async def owner(self, topic: str) -> str | None:
+        """The UID recorded as the topic's owner, if known."""
+        ...
+
+    async def publish(self, topic: str, seq: int, payload: bytes, state: bool = False) -> None:
+        """Send an event, or with `state` an entity state update, to every instance
+        subscribed to the topic."""
+        ...
+
+    async def aclose(self) -> None: ...
+
+    def stats(self) -> dict[str, Any]: ...
+
+
+class LocalBackbone:
+    """In-process backbone for a single instance: publish delivers directly."""
+
+    def __init__(self) -> None:
+        self._deliver: Deliver | None = None
+        self._topics: set[str] = set()
+        self._sequences: dict[str, int] = {}
+        self._owners: dict[str, str] = {}
+        self.published = 0
+
+    def attach(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    def subscribe(self, topic: str) -> None:
+        self._topics.add(topic)
+
+    def unsubscribe(self, topic: str) -> None:
+        self._topics.discard(topic)
+
+    async def next_sequence(self, topic: str) -> int:
+        seq = self._sequences[topic] = self._sequences.get(topic, 0) + 1
+        return seq
+
+    async def last_sequence(self, topic: str) -> int | None:
+        return self._sequences.get(topic)
+
+    async def claim(self, topic: str, uid: str) -> bool:
+        return self._owners.setdefault(topic, uid) == uid
+
+    async def owner(self, topic: str) -> str | None:
+        return self._owners.get(topic)
+
+    async def publish(self, topic: str, seq: int, payload: bytes, state: bool = False) -> None:
+        self.published += 1
+        if self._deliver is not None and topic in self._topics:
+            self._deliver(topic, seq, payload, state)
+
+    async def aclose(self) -> None:
+        pass
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": "local", "topics": len(self._topics), "published": self.published}
+
+
+class RedisBackbone:
+    """Backbone on Redis pub/sub, one channel per topic.
+
+    Sequence numbers are per-topic INCR counters, expiring `sequence_ttl`
+    seconds after a topic's first event; owners are kept as long. Each message is the sequence
+    number, " state" for entity state updates, a newline, then the payload.
+
+    Subscription changes are applied by a background task, batched into one
+    SUBSCRIBE/UNSUBSCRIBE per round, on the event loop that first used the
+    backbone. If the connection drops, it reconnects after `retry_interval`
+    seconds and resubscribes; events published meanwhile are lost.
+    """
+
+    def __init__(
+        self,
+        url: str = "",
+        client: Any = None,
+        retry_interval: float = 1.0,
+        sequence_ttl: int = 86400,
+    ) -> None:
+        """Create a backbone for `url` (requires the optional `redis` package), or on an
+        existing redis.asyncio-compatible `client`."""
+        self.url = url
+        self.retry_interval = retry_interval
+        self.sequence_ttl = sequence_ttl
+        self._client = client
+        self._owns_client = client is None
+        self._deliver: Deliver | None = None
+        # Topics local connections want, and topics the pub/sub connection is subscribed to
+        self._wanted: set[str] = set()
+        self._active: set[str] = set()
+        self._changed = asyncio.Event()
+        self._subscribed = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task[None] | None = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    def _get_client(self) -> Any:
+        if self._client is None:
+            try:
+                import redis.asyncio as redis  # type: ignore[import-not-found]
+            except ImportError as e:
+                raise RuntimeError(
+                    'WS_PUBSUB_REDIS_URL is set but redis is not installed: pip install -e ".[redis]"'
+                ) from e
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # First use, or the previous loop is gone: start over on this one
+        if self._owns_client:
+            self._client = None
+        self._loop = loop
+        self._changed = asyncio.Event()
+        self._subscribed = asyncio.Event()
+        self._task = loop.create_task(self._run(), name="ws-backbone")
+
+    def attach(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    def subscribe(self, topic: str) -> None:
+        self._wanted.add(topic)
+        self._ensure_running()
+        self._changed.set()
+
+    def unsubscribe(self, topic: str) -> None:
+        self._wanted.discard(topic)
+        if self._loop is not None:
+            self._changed.set()
+
+    async def next_sequence(self, topic: str) -> int:
+        key = _SEQUENCE_PREFIX + topic
+        try:
+            client = self._get_client()
+            seq = int(await client.incr(key))
+            if seq == 1:
+                await client.expire(key, self.sequence_ttl)
+            return seq
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Websocket sequence allocation failed: %r", exc)
+            return 0
+
+    async def last_sequence(self, topic: str) -> int | None:
+        try:
+            value = await self._get_client().get(_SEQUENCE_PREFIX + topic)
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Websocket sequence lookup failed: %r", exc)
+            return None
+        return int(value) if value is not None else None
+
+    async def claim(self, topic: str, uid: str) -> bool:
+        key = _OWNER_PREFIX + topic
+        try:
+            client = self._get_client()
+            if await client.set(key, uid.encode(), ex=self.sequence_ttl, nx=True):
+                return True
+            return await client.get(key) == uid.encode()
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Websocket topic claim failed: %r", exc)
+            return False
+
+    async def owner(self, topic: str) -> str | None:
+        try:
+            value = await self._get_client().get(_OWNER_PREFIX + topic)
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Websocket topic owner lookup failed: %r", exc)
+            return None
+        return value.decode() if value is not None else None
+
+    async def publish(self, topic: str, seq: int, payload: bytes, state: bool = False) -> None:
+        header = b"%d%b\n" % (seq, _STATE_MARK if state else b"")
+        try:
+            await self._get_client().publish(_CHANNEL_PREFIX + topic, header + payload)
+            self.published += 1
+        except Exception as exc:
+            self.errors += 1
+            logger.warning("Websocket event publish failed: %r", exc)
+            # Still reach this instance's own subscribers
+            if self._deliver is not None and topic in self._wanted:
+                self._deliver(topic, seq, payload, state)
+
+    async def _run(self) -> None:
+        while True:
+            pubsub = self._get_client().pubsub()
+            self._active = set()
+            self._subscribed.clear()
+            self._changed.set()
+            try:
+                async with asyncio.TaskGroup() as group:
+                    group.create_task(self._sync(pubsub))
+                    group.create_task(self._read(pubsub))
+            except Exception as exc:
+                self.errors += 1
+                logger.warning("Websocket pub/sub connection failed: %r", exc)
+            finally:
+                with contextlib.suppress(Exception):
+                    await pubsub.aclose()
+            await asyncio.sleep(self.retry_interval)
+
+    async def _sync(self, pubsub: Any) -> None:
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            new = self._wanted - self._active
+            gone = self._active - self._wanted
+            if new:
+                await pubsub.subscribe(*(_CHANNEL_PREFIX + t for t in new))
+                self._active |= new
+                self._subscribed.set()
+            if gone:
+                await pubsub.unsubscribe(*(_CHANNEL_PREFIX + t for t in gone))
+                self._active -= gone
+
+    async def _read(self, pubsub: Any) -> None:
+        # The pub/sub connection is opened by the first SUBSCRIBE
+        await self._subscribed.wait()
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is None or message.get("type") != "message":
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            topic = channel.removeprefix(_CHANNEL_PREFIX)
+            header, _, payload = message["data"].partition(b"\n")
+            seq, _, kind = header.partition(b" ")
+            self.received += 1
+            if self._deliver is not None and topic in self._wanted:
+                self._deliver(topic, int(seq), payload, kind == _STATE_MARK[1:])
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self._loop = None
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "redis",
+            "topics": len(self._active),
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
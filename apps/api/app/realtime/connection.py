@@ -0,0 +1,171 @@
+"""One websocket client with its own bounded send queue and writer task.
+
+Messages are enqueued without blocking and written by a task dedicated to
+the connection, so a slow or dead client delays only itself. What happens
+when its queue is full is decided by a SlowConsumerPolicy.
+"""
+
+import asyncio
+import contextlib
+import enum
+import logging
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from app.lib.encoding import Encoded, dumps, packb
+from app.middleware.auth import AuthUser
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to a client dropped for falling behind ("try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class SlowConsumerPolicy(enum.StrEnum):
+    """What to do with a message for a connection whose send queue is full."""
+
+    # Discard the oldest queued message to make room (client sees the latest state)
+    DROP_OLDEST = "drop_oldest"
+    # Discard the new message
+    DROP_NEWEST = "drop_newest"
+    # Close the connection; the client reconnects and resynchronizes
+    DISCONNECT = "disconnect"
+
+
+class Connection:
+    """A websocket plus the queue and task that write to it.
+
+    All sends go through `send`; the socket itself is only written by the
+    writer task, so writes never interleave.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_queue: int = 256,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST,
+        send_timeout: float = 10.0,
+        on_close: Callable[["Connection"], None] | None = None,
+        user: AuthUser | None = None,
+        binary: bool = False,
+    ) -> None:
+        """Wrap an accepted websocket.
+
+        A single send taking longer than `send_timeout` seconds means the
+        peer is gone or hopelessly slow, and the connection is closed.
+        `on_close` is called once when the connection closes for any reason.
+        A `binary` connection (MessagePack subprotocol) is sent MessagePack
+        binary frames instead of JSON text frames.
+        """
+        self.websocket = websocket
+        self.user = user
+        self.binary = binary
+        # Topics this connection is subscribed to (maintained by ConnectionManager)
+        self.topics: set[str] = set()
+        # (topic, entity) -> state version the client acknowledged
+        self.acked: dict[tuple[str, str], int] = {}
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self._on_close = on_close
+        self._queue: deque[Any] = deque()
+        self._ready = asyncio.Event()
+        self._writer: asyncio.Task[None] | None = None
+        self._closer: asyncio.Task[None] | None = None
+        self.closed = False
+        # When a message was last received from the peer (HeartbeatScheduler's clock)
+        self.last_seen = 0.0
+        self.sent = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def start(self) -> None:
+        """Start the writer task."""
+        self._writer = asyncio.create_task(self._run(), name="ws-writer")
+
+    def send(self, message: Any) -> bool:
+        """Queue a message without waiting. Returns False if it was not queued.
+
+        An Encoded message is sent as-is, so an event encoded once can go to
+        many connections.
+        """
+        if self.closed:
+            return False
+        if len(self._queue) >= self.max_queue:
+            if self.policy is SlowConsumerPolicy.DROP_NEWEST:
+                self.dropped += 1
+                return False
+            if self.policy is SlowConsumerPolicy.DISCONNECT:
+                self.dropped += len(self._queue) + 1
+                self.close_soon(SLOW_CONSUMER_CLOSE_CODE)
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(message)
+        self._ready.set()
+        return True
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await self._ready.wait()
+                while self._queue:
+                    message = self._queue.popleft()
+                    async with asyncio.timeout(self.send_timeout):
+                        await self._write(message)
+                    self.sent += 1
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # Send timed out or the peer went away; nothing more can be delivered
+            logger.debug("Websocket writer stopped: %r", exc)
+            self._mark_closed()
+            code = SLOW_CONSUMER_CLOSE_CODE if isinstance(exc, TimeoutError) else 1011
+            await self._close_socket(code)
+
+    async def _write(self, message: Any) -> None:
+        if isinstance(message, Encoded):
+            # Already encoded, shared by every recipient
+            if self.binary:
+                await self.websocket.send_bytes(message.msgpack)
+            else:
+                await self.websocket.send_text(message.text)
+        elif self.binary:
+            await self.websocket.send_bytes(packb(message))
+        else:
+            await self.websocket.send_text(dumps(message).decode("utf-8"))
+
+    def _mark_closed(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        if self._on_close is not None:
+            self._on_close(self)
+
+    def close_soon(self, code: int) -> None:
+        """Close the connection without waiting for the socket to close."""
+        self._mark_closed()
+        if self._writer is not None:
+            self._writer.cancel()
+        self._closer = asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int) -> None:
+        if self.websocket.application_state is WebSocketState.CONNECTED:
+            with contextlib.suppress(Exception):
+                await self.websocket.close(code)
+
+    async def close(self) -> None:
+        """Stop the writer and forget queued messages (the peer already disconnected)."""
+        self._mark_closed()
+        if self._writer is not None:
+            self._writer.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._writer
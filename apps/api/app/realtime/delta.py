@@ -0,0 +1,60 @@
+"""JSON Patch (RFC 6902) deltas between two versions of an entity's state.
+
+Only the operations needed to turn one JSON object into another are
+produced: "add", "remove" and "replace", recursing into nested objects.
+Lists and other values are replaced whole.
+"""
+
+from typing import Any
+
+
+def _escape(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff(old: dict[str, Any], new: dict[str, Any], path: str = "") -> list[dict[str, Any]]:
+    """Patch operations that turn `old` into `new`."""
+    ops: list[dict[str, Any]] = []
+    for key in old:
+        if key not in new:
+            ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+    for key, value in new.items():
+        pointer = f"{path}/{_escape(key)}"
+        if key not in old:
+            ops.append({"op": "add", "path": pointer, "value": value})
+            continue
+        old_value = old[key]
+        if isinstance(old_value, dict) and isinstance(value, dict):
+            ops.extend(diff(old_value, value, pointer))
+        elif old_value != value or type(old_value) is not type(value):
+            ops.append({"op": "replace", "path": pointer, "value": value})
+    return ops
+
+
+def apply_patch(doc: dict[str, Any], ops: list[dict[str, Any]]) -> dict[str, Any]:
+    """Apply operations produced by `diff` to a copy of `doc`."""
+    result = _copy(doc)
+    for op in ops:
+        *parents, last = [_unescape(t) for t in op["path"].split("/")[1:]]
+        target = result
+        for token in parents:
+            target = target[token]
+        if op["op"] == "remove":
+            del target[last]
+        elif op["op"] in ("add", "replace"):
+            target[last] = op["value"]
+        else:
+            raise ValueError(f"Unsupported patch operation: {op['op']!r}")
+    return result
+
+
+def _copy(value: Any) -> Any:
+    # Objects are copied so patches never modify a shared state; other values are immutable
+    # as far as patches are concerned, since lists are replaced whole
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    return value
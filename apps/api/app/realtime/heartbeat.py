@@ -0,0 +1,134 @@
+"""One timing wheel that sends heartbeats to idle connections and reaps dead ones.
+
+A peer that is gone is found when the heartbeat cannot be written to it (the
+write fails or exceeds the connection's send timeout), and by the server's
+protocol-level pings. Closing connections that merely stay silent is opt-in
+(`timeout`), since listen-only clients never send anything.
+
+Replaces a timeout per receive in every connection's loop: receiving a
+message only records the time, and a single task visits each connection
+about once per heartbeat interval. The wheel has one slot per `resolution`
+seconds, covering the idle timeout; every tick handles the connections in
+the current slot and moves each one to the slot of its next check.
+"""
+
+import asyncio
+import contextlib
+import math
+import time
+from collections.abc import Callable
+from typing import Any
+
+from fastapi import status
+
+from app.lib.encoding import Encoded
+from app.realtime.connection import Connection
+
+# Sent to a connection that has been silent for a heartbeat interval
+HEARTBEAT = Encoded.of({"type": "heartbeat"})
+
+
+class HeartbeatScheduler:
+    """Timing wheel of connections, keyed by when each needs checking."""
+
+    def __init__(
+        self,
+        interval: float = 30.0,
+        timeout: float = 0.0,
+        resolution: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Heartbeat connections silent for `interval` seconds and close those silent
+        for `timeout` seconds (0 never closes them), checking every `resolution` seconds.
+        """
+        self.interval = interval
+        self.timeout = timeout
+        self.resolution = resolution
+        self.clock = clock
+        horizon = max(interval, timeout)
+        self._slots: list[set[Connection]] = [
+            set() for _ in range(math.ceil(horizon / resolution) + 1)
+        ]
+        self._slot_of: dict[Connection, int] = {}
+        self._cursor = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task[None] | None = None
+        self.heartbeats = 0
+        self.reaped = 0
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def add(self, connection: Connection) -> None:
+        """Start tracking a connection, as if a message had just been received from it."""
+        connection.last_seen = self.clock()
+        self._place(connection, self.interval)
+        self._ensure_running()
+
+    def remove(self, connection: Connection) -> None:
+        """Stop tracking a connection."""
+        slot = self._slot_of.pop(connection, None)
+        if slot is not None:
+            self._slots[slot].discard(connection)
+
+    def _place(self, connection: Connection, delay: float) -> None:
+        ticks = min(len(self._slots) - 1, max(1, math.ceil(delay / self.resolution)))
+        slot = (self._cursor + ticks) % len(self._slots)
+        self._slots[slot].add(connection)
+        self._slot_of[connection] = slot
+
+    def tick(self) -> None:
+        """Advance one slot, heartbeating or closing the connections due in it."""
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        due = self._slots[self._cursor]
+        if not due:
+            return
+        self._slots[self._cursor] = set()
+        now = self.clock()
+        for connection in due:
+            del self._slot_of[connection]
+            if connection.closed:
+                continue
+            idle = now - connection.last_seen
+            if self.timeout and idle >= self.timeout:
+                self.reaped += 1
+                connection.close_soon(status.WS_1001_GOING_AWAY)
+                continue
+            if idle >= self.interval - self.resolution / 2:
+                # The same encoded heartbeat is queued for every connection due this tick
+                connection.send(HEARTBEAT)
+                self.heartbeats += 1
+                delay = self.interval
+                if self.timeout:
+                    delay = min(delay, self.timeout - idle)
+            else:
+                delay = self.interval - idle
+            self._place(connection, delay)
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._task = loop.create_task(self._run(), name="ws-heartbeat")
+
+    async def _run(self) -> None:
+        # Paced by the loop's clock; a late tick is caught up rather than skipped
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.resolution
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            self.tick()
+
+    async def aclose(self) -> None:
+        """Stop the wheel's task."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self._loop = None
+
+    def stats(self) -> dict[str, Any]:
+        return {"tracked": len(self), "heartbeats": self.heartbeats, "reaped": self.reaped}
@@ -0,0 +1,493 @@
+"""Track websocket connections and route messages to them by topic."""
+
+import asyncio
+import logging
+from collections.abc import Callable
+from functools import lru_cache
+from typing import Any
+
+from fastapi import WebSocket
+
+from app.lib.config import get_settings
+from app.lib.encoding import Encoded, dumps, loads
+from app.middleware.auth import AuthUser
+from app.realtime.backbone import Backbone, LocalBackbone, RedisBackbone
+from app.realtime.connection import Connection, SlowConsumerPolicy
+from app.realtime.delta import diff
+from app.realtime.heartbeat import HeartbeatScheduler
+from app.realtime.replay import ReplayBuffer
+from app.realtime.state import Coalescer, EntityState
+
+logger = logging.getLogger(__name__)
+
+# Websocket subprotocol for MessagePack binary frames instead of JSON text
+MSGPACK_SUBPROTOCOL = "msgpack"
+# Websocket subprotocol for the default JSON text frames, for clients that must offer one
+JSON_SUBPROTOCOL = "json"
+
+# Called with a topic's id (e.g. "42" for "task:42"); returns entity -> current
+# state of the entities this instance knows for it
+StateSource = Callable[[str], dict[str, dict[str, Any]]]
+
+# Called with the data of each event published to a topic the instance listens to
+Listener = Callable[[Any], object]
+
+
+def _snapshot(topic: str, entity: str, state: EntityState) -> dict[str, Any]:
+    return {
+        "type": "snapshot",
+        "topic": topic,
+        "entity": entity,
+        "version": state.version,
+        "state": state.state,
+    }
+
+
+class ConnectionManager:
+    """Manage websocket connections, each with its own send queue (see Connection).
+
+    Connections are indexed by the topics they subscribe to, so delivering
+    an event touches only its subscribers. Events are published through the
+    backbone, which brings them back to every instance with subscribers;
+    this instance subscribes to a topic while any local connection is.
+
+    Published events carry the topic's sequence number, and the last
+    `replay_size` events of each topic are kept so a reconnecting client can
+    resume where it left off (see subscribe_resuming). A topic's history,
+    and its backbone subscription, outlive its last local subscriber by
+    `replay_linger` seconds so it still covers clients that reconnect.
+
+    Idle connections are sent heartbeats, and silent ones closed, by one
+    HeartbeatScheduler for all connections; call `seen` whenever a message
+    is received.
+
+    Entity state (e.g. a task's status and progress) is sent through
+    `update_state`. Updates to the same entity are merged for `state_tick`
+    seconds before publishing, and each subscriber is sent a patch against
+    the version it last acknowledged (see ack_state), or the full state if
+    it has not acknowledged one. A new subscriber is sent the state of each
+    entity this instance holds for the topic straight away; for a topic it
+    holds no state for yet, the state is taken from the topic kind's
+    state source (see add_state_source), e.g. the task engine.
+
+    Server-side code can also listen to a topic (see listen), e.g. to apply
+    token revocations made on other instances.
+
+    A topic can be claimed by a user (see claim); the claim is recorded on
+    the backbone, so every instance sees it for as long as the backbone
+    keeps the topic's sequence numbers.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 256,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST,
+        send_timeout: float = 10.0,
+        max_topics: int = 100,
+        backbone: Backbone | None = None,
+        replay_size: int = 100,
+        replay_linger: float = 120.0,
+        heartbeats: HeartbeatScheduler | None = None,
+        state_tick: float = 0.1,
+        state_history: int = 8,
+    ) -> None:
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.max_topics = max_topics
+        self.connections: dict[WebSocket, Connection] = {}
+        self.topics: dict[str, set[Connection]] = {}
+        self.replay_size = replay_size
+        self.replay_linger = replay_linger
+        # History of every topic this instance is subscribed to on the backbone
+        self._replay: dict[str, ReplayBuffer] = {}
+        # Topics with no local subscribers left, and when to drop them
+        self._lingering: dict[str, asyncio.TimerHandle] = {}
+        self._resumed = 0
+        self._resyncs = 0
+        # Totals for connections that have already closed
+        self._closed_sent = 0
+        self._closed_dropped = 0
+        self._published = 0
+        self._delivered = 0
+        self.backbone = backbone if backbone is not None else LocalBackbone()
+        self.backbone.attach(self.deliver)
+        self.heartbeats = heartbeats if heartbeats is not None else HeartbeatScheduler()
+        self.coalescer = Coalescer(self, tick=state_tick)
+        self.state_history = state_history
+        # Topic -> entity -> merged state, for topics this instance holds
+        self._states: dict[str, dict[str, EntityState]] = {}
+        # Topic kind -> where to find its entities' state before any was delivered
+        self._state_sources: dict[str, StateSource] = {}
+        self._snapshots = 0
+        self._patches = 0
+        self._listeners: dict[str, list[Listener]] = {}
+        # Claims still being recorded on the backbone: topic -> UID
+        self._claims: dict[str, str] = {}
+        self._claiming: set[asyncio.Task[None]] = set()
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        user: AuthUser | None = None,
+        subprotocol: str | None = None,
+    ) -> Connection:
+        """Accept and track a new connection and start its writer.
+
+        With the MessagePack `subprotocol`, the connection is sent binary frames.
+        """
+        await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(
+            websocket,
+            max_queue=self.max_queue,
+            policy=self.policy,
+            send_timeout=self.send_timeout,
+            on_close=self._closed,
+            user=user,
+            binary=subprotocol == MSGPACK_SUBPROTOCOL,
+        )
+        self.connections[websocket] = connection
+        connection.start()
+        self.heartbeats.add(connection)
+        return connection
+
+    def _closed(self, connection: Connection) -> None:
+        if self.connections.pop(connection.websocket, None) is not None:
+            self.heartbeats.remove(connection)
+            for topic in list(connection.topics):
+                self.unsubscribe(connection, topic)
+            self._closed_sent += connection.sent
+            self._closed_dropped += connection.dropped
+
+    def seen(self, connection: Connection) -> None:
+        """Record that a message was received from the connection's peer."""
+        connection.last_seen = self.heartbeats.clock()
+
+    async def disconnect(self, websocket: WebSocket) -> None:
+        """Stop tracking a connection whose peer disconnected."""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            await connection.close()
+
+    def subscribe(self, connection: Connection, topic: str) -> bool:
+        """Add a connection to a topic. Returns False if it is at its topic limit.
+
+        A new subscriber is queued a snapshot of each entity state held for
+        the topic. Callers check that the user may subscribe (see
+        topics.can_subscribe).
+        """
+        joined = topic not in connection.topics
+        if not self._add(connection, topic):
+            return False
+        if joined:
+            self._send_states(connection, topic)
+        return True
+
+    def _add(self, connection: Connection, topic: str) -> bool:
+        if connection.closed:
+            return False
+        if topic in connection.topics:
+            return True
+        if len(connection.topics) >= self.max_topics:
+            return False
+        connection.topics.add(topic)
+        subscribers = self.topics.get(topic)
+        if subscribers is None:
+            subscribers = self.topics[topic] = set()
+            lingering = self._lingering.pop(topic, None)
+            if lingering is not None:
+                lingering.cancel()
+            else:
+                self._replay[topic] = ReplayBuffer(self.replay_size)
+                self.backbone.subscribe(topic)
+        subscribers.add(connection)
+        return True
+
+    async def subscribe_resuming(self, connection: Connection, topic: str, after: int) -> bool:
+        """Subscribe a connection and first queue the topic's events after sequence
+        number `after`, the last one the client saw.
+
+        If they are no longer held, queues a "resync" message instead, telling
+        the client to refetch the topic's state. Returns False if the
+        subscription was refused (see subscribe).
+        """
+        replay = self._replay.get(topic)
+        latest = None
+        if replay is None or not replay.covers(after):
+            # Nothing held; if no event was published since, nothing was missed
+            latest = await self.backbone.last_sequence(topic)
+        # No awaits from here on, so replayed events are queued before live ones
+        joined = topic not in connection.topics
+        if not self._add(connection, topic):
+            return False
+        events = self._replay[topic].since(after)
+        if events is None and (latest or 0) == after:
+            events = []
+        if events is None:
+            self._resyncs += 1
+            connection.send({"type": "resync", "topic": topic, "seq": latest})
+        else:
+            self._resumed += 1
+            for event in events:
+                connection.send(event)
+        # After the replayed events, which may include older state updates
+        if joined:
+            self._send_states(connection, topic)
+        return True
+
+    def unsubscribe(self, connection: Connection, topic: str) -> None:
+        """Remove a connection from a topic."""
+        connection.topics.discard(topic)
+        for key in [k for k in connection.acked if k[0] == topic]:
+            del connection.acked[key]
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self.topics[topic]
+                if self.replay_linger > 0:
+                    loop = asyncio.get_running_loop()
+                    self._lingering[topic] = loop.call_later(
+                        self.replay_linger, self._drop_topic, topic
+                    )
+                else:
+                    self._drop_topic(topic)
+
+    def _drop_topic(self, topic: str) -> None:
+        self._lingering.pop(topic, None)
+        self._replay.pop(topic, None)
+        self._states.pop(topic, None)
+        self.backbone.unsubscribe(topic)
+
+    def listen(self, topic: str, listener: Listener) -> None:
+        """Call `listener` with the data of every event published to the topic, on any
+        instance, from now on. Kinds of topics listened to should have no
+        authorizer, so clients cannot subscribe to them (see topics.can_subscribe).
+        """
+        listeners = self._listeners.setdefault(topic, [])
+        if listener not in listeners:
+            listeners.append(listener)
+        self.backbone.subscribe(topic)
+
+    def claim(self, topic: str, uid: str) -> None:
+        """Record the user who owns a topic, unless another user already does.
+
+        Recorded on the backbone in the background; owner() on this instance
+        sees the claim straight away.
+        """
+        self._claims[topic] = uid
+        task = asyncio.get_running_loop().create_task(self._claim(topic, uid))
+        self._claiming.add(task)
+        task.add_done_callback(self._claiming.discard)
+
+    async def _claim(self, topic: str, uid: str) -> None:
+        try:
+            await self.backbone.claim(topic, uid)
+        finally:
+            if self._claims.get(topic) == uid:
+                del self._claims[topic]
+
+    async def owner(self, topic: str) -> str | None:
+        """The UID of the user who claimed the topic on any instance, if known."""
+        pending = self._claims.get(topic)
+        if pending is not None:
+            return pending
+        return await self.backbone.owner(topic)
+
+    async def publish(self, topic: str, message: dict[str, Any]) -> None:
+        """Send a message to the topic's subscribers on every instance.
+
+        Clients receive {"type": "event", "topic": ..., "seq": ..., "data": message}.
+        The event is encoded once here; delivery is asynchronous.
+        """
+        self._published += 1
+        seq = await self.backbone.next_sequence(topic)
+        event = {"type": "event", "topic": topic, "seq": seq, "data": message}
+        await self.backbone.publish(topic, seq, dumps(event))
+
+    def update_state(self, topic: str, entity: str, fields: dict[str, Any]) -> None:
+        """Queue fields of an entity; merged with other updates to it and
+        published within `state_tick` seconds.
+
+        An instance only knows the fields published while it holds the
+        topic, so publishers send the entity's full state, not just what
+        changed; subscribers are still sent only the changes (see ack_state).
+        """
+        self.coalescer.update(topic, entity, fields)
+
+    async def publish_state(self, topic: str, entity: str, fields: dict[str, Any]) -> None:
+        """Publish fields of an entity now (update_state coalesces first).
+
+        The event is {"type": "state", "topic", "seq", "entity", "fields"};
+        live subscribers receive it as a snapshot or patch, and clients
+        resuming from the replay buffer receive it as is.
+        """
+        self._published += 1
+        seq = await self.backbone.next_sequence(topic)
+        event = {"type": "state", "topic": topic, "seq": seq, "entity": entity, "fields": fields}
+        await self.backbone.publish(topic, seq, dumps(event), state=True)
+
+    def ack_state(self, connection: Connection, topic: str, entity: str, version: int) -> None:
+        """Record the version of an entity's state the client now holds."""
+        state = self._states.get(topic, {}).get(entity)
+        if state is None or state.at(version) is None or topic not in connection.topics:
+            return
+        key = (topic, entity)
+        if version > connection.acked.get(key, 0):
+            connection.acked[key] = version
+
+    def _deliver_state(self, topic: str, payload: bytes, subscribers: set[Connection]) -> int:
+        event = loads(payload)
+        entity = event["entity"]
+        states = self._states.setdefault(topic, {})
+        state = states.get(entity)
+        if state is None:
+            state = states[entity] = EntityState(self.state_history)
+        version = state.apply(event["fields"])
+
+        # Connections that acknowledged the same version get the same encoded patch
+        by_base: dict[int, list[Connection]] = {}
+        for connection in subscribers:
+            by_base.setdefault(connection.acked.get((topic, entity), 0), []).append(connection)
+        queued = 0
+        for base, connections in by_base.items():
+            base_state = state.at(base) if base else None
+            if base_state is None:
+                self._snapshots += 1
+                message = _snapshot(topic, entity, state)
+            else:
+                self._patches += 1
+                message = {
+                    "type": "patch",
+                    "topic": topic,
+                    "entity": entity,
+                    "base": base,
+                    "version": version,
+                    "ops": diff(base_state, state.state),
+                }
+            encoded = Encoded.of(message)
+            queued += sum(connection.send(encoded) for connection in connections)
+        return queued
+
+    def add_state_source(self, kind: str, source: StateSource) -> None:
+        """Look up the state of entities on topics of `kind` with `source` when a
+        client subscribes before this instance has received any."""
+        self._state_sources[kind] = source
+
+    def _seed_states(self, topic: str) -> dict[str, EntityState]:
+        kind, _, ident = topic.partition(":")
+        source = self._state_sources.get(kind)
+        if source is None:
+            return {}
+        states: dict[str, EntityState] = {}
+        for entity, fields in source(ident).items():
+            states[entity] = EntityState(self.state_history)
+            states[entity].apply(fields)
+        if states:
+            self._states[topic] = states
+        return states
+
+    def _send_states(self, connection: Connection, topic: str) -> None:
+        states = self._states.get(topic) or self._seed_states(topic)
+        for entity, state in states.items():
+            self._snapshots += 1
+            connection.send(_snapshot(topic, entity, state))
+
+    def deliver(self, topic: str, seq: int, payload: bytes, state: bool = False) -> int:
+        """Record an encoded event from the backbone and queue it for this
+        instance's subscribers; with `state`, it is an entity state update
+        (see publish_state), merged and sent as a snapshot or patch.
+
+        The same Encoded event is sent to every connection, so it is decoded
+        to text (or converted to MessagePack) at most once per instance.
+        Returns the number of connections it was queued for.
+        """
+        for listener in self._listeners.get(topic, ()):
+            try:
+                listener(loads(payload)["data"])
+            except Exception:
+                logger.exception("Listener for %s failed", topic)
+        replay = self._replay.get(topic)
+        if replay is None:
+            return 0
+        event = Encoded(payload)
+        replay.append(seq, event)
+        subscribers = self.topics.get(topic)
+        if state:
+            return self._deliver_state(topic, payload, subscribers or set())
+        if not subscribers:
+            return 0
+        self._delivered += 1
+        return sum(connection.send(event) for connection in list(subscribers))
+
+    async def broadcast(self, message: dict[str, Any]) -> int:
+        """Queue a message for every client connected to this instance, without
+        waiting for delivery. The message is encoded once for all of them.
+
+        Returns the number of connections it was queued for.
+        """
+        encoded = Encoded.of(message)
+        return sum(connection.send(encoded) for connection in list(self.connections.values()))
+
+    def stats(self) -> dict[str, Any]:
+        """Return connection and delivery counters for the metrics endpoint."""
+        live = self.connections.values()
+        return {
+            "connections": len(self.connections),
+            "topics": len(self.topics),
+            "subscriptions": sum(len(c.topics) for c in live),
+            "published": self._published,
+            "delivered": self._delivered,
+            "replay_topics": len(self._replay),
+            "resumed": self._resumed,
+            "resyncs": self._resyncs,
+            "queued": sum(len(c) for c in live),
+            "sent": self._closed_sent + sum(c.sent for c in live),
+            "dropped": self._closed_dropped + sum(c.dropped for c in live),
+            "policy": self.policy.value,
+            "backbone": self.backbone.stats(),
+            "heartbeat": self.heartbeats.stats(),
+            "state": {
+                "entities": sum(len(states) for states in self._states.values()),
+                "snapshots": self._snapshots,
+                "patches": self._patches,
+                **self.coalescer.stats(),
+            },
+        }
+
+    async def aclose(self) -> None:
+        """Publish pending state and claims, stop heartbeats, drop lingering topics and close
+        the backbone connection."""
+        await self.coalescer.aclose()
+        await asyncio.gather(*self._claiming, return_exceptions=True)
+        await self.heartbeats.aclose()
+        for topic in list(self._lingering):
+            self._lingering[topic].cancel()
+            self._drop_topic(topic)
+        await self.backbone.aclose()
+
+
+@lru_cache
+def get_connection_manager() -> ConnectionManager:
+    """Get the process-wide connection manager."""
+    s = get_settings()
+    backbone = (
+        RedisBackbone(s.ws_pubsub_redis_url, sequence_ttl=s.ws_sequence_ttl)
+        if s.ws_pubsub_redis_url
+        else None
+    )
+    return ConnectionManager(
+        max_queue=s.ws_send_queue_size,
+        policy=SlowConsumerPolicy(s.ws_slow_consumer_policy),
+        send_timeout=s.ws_send_timeout,
+        max_topics=s.ws_max_topics_per_connection,
+        backbone=backbone,
+        replay_size=s.ws_replay_buffer_size,
+        replay_linger=s.ws_replay_linger,
+        heartbeats=HeartbeatScheduler(
+            interval=s.ws_heartbeat_interval,
+            timeout=s.ws_idle_timeout,
+        ),
+        state_tick=s.ws_state_tick,
+        state_history=s.ws_state_history,
+    )
@@ -0,0 +1,74 @@
+"""Bounded per-topic history of recent events, for clients resuming after a reconnect."""
+
+from collections import deque
+
+from app.lib.encoding import Encoded
+
+
+class ReplayBuffer:
+    """The last `maxlen` events of one topic as (sequence number, encoded event).
+
+    The buffer only holds a contiguous run of sequence numbers: when an event
+    arrives after a gap (this instance missed some), older events are
+    discarded, since replaying them would hide the gap from the client.
+    """
+
+    def __init__(self, maxlen: int = 100) -> None:
+        self._events: deque[tuple[int, Encoded]] = deque(maxlen=maxlen)
+        # Highest sequence number seen, even if its event has been evicted
+        self.last_seq: int | None = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def append(self, seq: int, event: Encoded) -> None:
+        """Record an event. A sequence number of 0 marks an unsequenced event."""
+        if seq <= 0:
+            # Cannot tell what it follows; nothing before it can be replayed
+            self.reset()
+            return
+        last = self.last_seq
+        if last is None or seq == last + 1:
+            self._events.append((seq, event))
+            self.last_seq = seq
+        elif seq > last + 1:
+            self._events.clear()
+            self._events.append((seq, event))
+            self.last_seq = seq
+        else:
+            self._insert(seq, event)
+
+    def _insert(self, seq: int, event: Encoded) -> None:
+        # An earlier event arriving late (concurrent publishers on other instances)
+        events = self._events
+        if events and seq < events[0][0] - 1:
+            return
+        i = len(events)
+        while i > 0 and events[i - 1][0] > seq:
+            i -= 1
+        if i > 0 and events[i - 1][0] == seq:
+            return
+        if len(events) == events.maxlen:
+            if i == 0:
+                return
+            events.popleft()
+            i -= 1
+        events.insert(i, (seq, event))
+
+    def covers(self, after: int) -> bool:
+        """Whether every event after sequence number `after` is still held."""
+        if self.last_seq is None or after > self.last_seq:
+            return False
+        first = self._events[0][0] if self._events else self.last_seq + 1
+        return after >= first - 1
+
+    def since(self, after: int) -> list[Encoded] | None:
+        """Events after sequence number `after`, or None if some are no longer held."""
+        if not self.covers(after):
+            return None
+        return [event for seq, event in self._events if seq > after]
+
+    def reset(self) -> None:
+        """Forget all history."""
+        self._events.clear()
+        self.last_seq = None
@@ -0,0 +1,135 @@
+"""Entity state assembled from field updates, versioned for delta delivery.
+
+A state update carries only the fields that changed; the merged state of
+each entity is kept per instance, along with its last few versions so a
+patch can be computed against whichever version a client last
+acknowledged. Versions are local to the instance, like the connections
+that acknowledge them.
+"""
+
+import asyncio
+import contextlib
+import logging
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from app.realtime.manager import ConnectionManager
+
+logger = logging.getLogger(__name__)
+
+# Publish attempts for one entity's buffered update before it is dropped
+_MAX_PUBLISH_ATTEMPTS = 3
+
+
+class EntityState:
+    """Current state of one entity and its recent versions."""
+
+    def __init__(self, history: int = 8) -> None:
+        self.version = 0
+        self.state: dict[str, Any] = {}
+        self.history = history
+        self._versions: OrderedDict[int, dict[str, Any]] = OrderedDict()
+
+    def apply(self, fields: dict[str, Any]) -> int:
+        """Merge changed fields (last write wins per field) and return the new version."""
+        self.state = {**self.state, **fields}
+        self.version += 1
+        self._versions[self.version] = self.state
+        while len(self._versions) > self.history:
+            self._versions.popitem(last=False)
+        return self.version
+
+    def at(self, version: int) -> dict[str, Any] | None:
+        """The state as of `version`, if still held."""
+        return self._versions.get(version)
+
+
+class Coalescer:
+    """Merge rapid state updates to the same entity and publish them once per tick.
+
+    Updates are buffered per (topic, entity), merged field by field with the
+    last write winning, and published by ConnectionManager.publish_state
+    every `tick` seconds. An update that fails to publish is kept, under any
+    newer fields, and retried on the next tick, up to
+    `_MAX_PUBLISH_ATTEMPTS` times.
+    """
+
+    def __init__(self, manager: "ConnectionManager", tick: float = 0.1) -> None:
+        self.manager = manager
+        self.tick = tick
+        self._pending: dict[tuple[str, str], dict[str, Any]] = {}
+        # Failed publish attempts of entries still pending
+        self._attempts: dict[tuple[str, str], int] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task[None] | None = None
+        self.updates = 0
+        self.published = 0
+        self.failed = 0
+
+    def update(self, topic: str, entity: str, fields: dict[str, Any]) -> None:
+        """Buffer changed fields of an entity until the next tick."""
+        self.updates += 1
+        pending = self._pending.get((topic, entity))
+        if pending is None:
+            self._pending[(topic, entity)] = dict(fields)
+        else:
+            pending.update(fields)
+        self._ensure_running()
+
+    async def flush(self) -> int:
+        """Publish everything buffered now. Returns the number of updates published."""
+        pending, self._pending = self._pending, {}
+        published = 0
+        for key, fields in pending.items():
+            topic, entity = key
+            try:
+                await self.manager.publish_state(topic, entity, fields)
+            except Exception:
+                self.failed += 1
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= _MAX_PUBLISH_ATTEMPTS:
+                    self._attempts.pop(key, None)
+                    logger.exception("Dropping state update for %s %s", topic, entity)
+                    continue
+                logger.warning("Could not publish state for %s %s", topic, entity, exc_info=True)
+                self._attempts[key] = attempts
+                # Updates buffered meanwhile are newer
+                self._pending[key] = {**fields, **self._pending.get(key, {})}
+                continue
+            self._attempts.pop(key, None)
+            published += 1
+        self.published += published
+        return published
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._task = loop.create_task(self._run(), name="ws-coalescer")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            if self._pending:
+                await self.flush()
+
+    async def aclose(self) -> None:
+        """Stop the flush task and publish anything still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        self._loop = None
+        if self._pending:
+            await self.flush()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "updates": self.updates,
+            "published": self.published,
+            "failed": self.failed,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,63 @@
+"""Topic names for websocket subscriptions and who may subscribe to them.
+
+A topic is "<kind>:<id>", e.g. "user:abc123" or "task:42". Each kind has an
+authorizer deciding whether a user may subscribe; kinds without one are
+rejected.
+"""
+
+from collections.abc import Awaitable, Callable
+
+from app.middleware.auth import AuthUser
+from app.realtime.manager import get_connection_manager
+
+# Longest topic name accepted from a client
+MAX_TOPIC_LENGTH = 256
+
+
+class InvalidTopicError(ValueError):
+    """Raised for a topic name that is not "<kind>:<id>"."""
+
+
+def parse_topic(topic: str) -> tuple[str, str]:
+    """Split a topic into its kind and id."""
+    kind, sep, ident = topic.partition(":")
+    if not sep or not kind or not ident or len(topic) > MAX_TOPIC_LENGTH:
+        raise InvalidTopicError(f"Invalid topic: {topic[:MAX_TOPIC_LENGTH]!r}")
+    return kind, ident
+
+
+def user_topic(uid: str) -> str:
+    """Topic for events about one user."""
+    return f"user:{uid}"
+
+
+def task_topic(task_id: str) -> str:
+    """Topic for status changes of one task."""
+    return f"task:{task_id}"
+
+
+async def _own_user(user: AuthUser, uid: str) -> bool:
+    return uid == user.uid
+
+
+async def _own_task(user: AuthUser, task_id: str) -> bool:
+    # Task ids can be chosen by the submitter, so only the owner claimed when the
+    # task was submitted, on whichever instance, may follow it
+    return await get_connection_manager().owner(task_topic(task_id)) == user.uid
+
+
+# Topic kind -> check(user, id)
+AUTHORIZERS: dict[str, Callable[[AuthUser, str], Awaitable[bool]]] = {
+    "user": _own_user,
+    "task": _own_task,
+}
+
+
+async def can_subscribe(user: AuthUser, topic: str) -> bool:
+    """Return True if the user may subscribe to the topic."""
+    try:
+        kind, ident = parse_topic(topic)
+    except InvalidTopicError:
+        return False
+    authorize = AUTHORIZERS.get(kind)
+    return authorize is not None and await authorize(user, ident)
@@ -1,6 +1,17 @@
 """Repository layer for Firestore data access."""
 
-from app.repositories.base import BaseRepository
-from app.repositories.user import UserRepository
+from app.repositories.base import AsyncBaseRepository, BaseRepository
+from app.repositories.credential import AsyncCredentialRepository, CredentialRepository
+from app.repositories.pagination import InvalidPageTokenError, Page
+from app.repositories.user import AsyncUserRepository, UserRepository
 
-__all__ = ["BaseRepository", "UserRepository"]
+__all__ = [
+    "AsyncBaseRepository",
+    "AsyncCredentialRepository",
+    "AsyncUserRepository",
+    "BaseRepository",
+    "CredentialRepository",
+    "InvalidPageTokenError",
+    "Page",
+    "UserRepository",
+]
@@ -1,12 +1,57 @@
-"""Base repository with generic Firestore CRUD operations."""
+"""Base repositories with generic Firestore CRUD operations."""
 
+from collections.abc import AsyncIterator, Callable, Iterator
 from datetime import UTC, datetime
 from typing import TYPE_CHECKING, Any, cast
 
+from google.api_core.exceptions import FailedPrecondition, NotFound
+
 if TYPE_CHECKING:
-    from google.cloud.firestore_v1 import Client
+    from google.cloud.firestore_v1 import AsyncClient, Client
 
 from app.models import BaseDocument
+from app.repositories.identity import (
+    ABSENT,
+    forget,
+    recall,
+    recall_update_time,
+    remember,
+    was_written,
+)
+from app.repositories.pagination import Page, build_page, clamp_page_size, page_query
+from app.repositories.singleflight import get_single_flight
+
+
+async def load_model[M](
+    doc_ref: Any,
+    kind: type[M],
+    to_model: Callable[[str, dict[str, Any]], M],
+    field_paths: tuple[str, ...] | None = None,
+) -> M | None:
+    """Read one document as `kind`, at most once per request and once per moment.
+
+    A model already in the request's identity map is returned as is;
+    otherwise the read joins any identical read in flight (single-flight)
+    and the result, including "not found", is remembered for the request.
+    A path this request has written is always read afresh, since a read in
+    flight may have started before the write. The snapshot's update time is
+    remembered with the model, so that a later update can be conditional on it.
+    """
+    known = recall(doc_ref.path, kind)
+    if known is not ABSENT:
+        return known
+    if was_written(doc_ref.path):
+        snapshot = await doc_ref.get(field_paths=field_paths)
+    else:
+        snapshot = await get_single_flight().do(
+            (doc_ref.path, field_paths), lambda: doc_ref.get(field_paths=field_paths)
+        )
+    if not snapshot.exists:
+        remember(doc_ref.path, kind, None)
+        return None
+    model = to_model(snapshot.id, snapshot.to_dict() or {})
+    remember(doc_ref.path, kind, model, update_time=snapshot.update_time)
+    return model
 
 
 class BaseRepository[T: BaseDocument]:
@@ -39,27 +84,192 @@ class BaseRepository[T: BaseDocument]:
             return None
         return self._to_model(doc.id, doc.to_dict() or {})  # type: ignore[union-attr]
 
-    def update(self, doc_id: str, data: dict[str, Any]) -> T | None:
-        """Update a document with partial data."""
+    def update(
+        self,
+        doc_id: str,
+        data: dict[str, Any],
+        current: T | None = None,
+        last_update_time: datetime | None = None,
+    ) -> T | None:
+        """Update a document with partial data.
+
+        Firestore's implicit exists precondition replaces the read-before-write,
+        and `last_update_time` adds an optimistic-concurrency check
+        (FailedPrecondition on mismatch). The written fields are merged into
+        `current` rather than re-reading the document; when the caller does not
+        hold it, it is read first and the update is made conditional on that
+        read, so the merged model is what was stored. Returns None if the
+        document does not exist.
+        """
+        data["updated_at"] = datetime.now(UTC)
         doc_ref = self.collection.document(doc_id)
-        doc = doc_ref.get()  # type: ignore[union-attr]
-        if not doc.exists:  # type: ignore[union-attr]
+        if current is None:
+            snapshot = doc_ref.get()  # type: ignore[union-attr]
+            if not snapshot.exists:  # type: ignore[union-attr]
+                return None
+            current = self._to_model(snapshot.id, snapshot.to_dict() or {})  # type: ignore[union-attr]
+            if last_update_time is None:
+                last_update_time = snapshot.update_time  # type: ignore[union-attr]
+        option = None
+        if last_update_time is not None:
+            option = self.db.write_option(last_update_time=last_update_time)
+        try:
+            doc_ref.update(data, option=option)
+        except NotFound:
             return None
-        data["updated_at"] = datetime.now(UTC)
-        doc_ref.update(data)
-        updated_doc = doc_ref.get()  # type: ignore[union-attr]
-        return self._to_model(updated_doc.id, updated_doc.to_dict() or {})  # type: ignore[union-attr]
+        return cast(T, current.apply_update(data))
 
-    def delete(self, doc_id: str) -> bool:
-        """Delete a document by ID."""
-        doc_ref = self.collection.document(doc_id)
-        doc = doc_ref.get()  # type: ignore[union-attr]
-        if not doc.exists:  # type: ignore[union-attr]
+    def delete(self, doc_id: str, last_update_time: datetime | None = None) -> bool:
+        """Delete a document by ID.
+
+        Single RPC guarded by an exists precondition (or `last_update_time`).
+        Returns False if the document does not exist.
+        """
+        if last_update_time is not None:
+            option = self.db.write_option(last_update_time=last_update_time)
+        else:
+            option = self.db.write_option(exists=True)
+        try:
+            self.collection.document(doc_id).delete(option=option)
+        except NotFound:
             return False
-        doc_ref.delete()
         return True
 
     def list(self, limit: int = 100) -> list[T]:
-        """List documents in the collection."""
+        """List up to `limit` documents; use list_page or iter_all to see the rest."""
         docs = self.collection.limit(limit).stream()
         return [self._to_model(doc.id, doc.to_dict() or {}) for doc in docs]  # type: ignore[union-attr]
+
+    def list_page(self, limit: int = 100, page_token: str | None = None) -> Page[T]:
+        """List one page of documents ordered by ID.
+
+        Pass the returned `next_page_token` back to get the following page.
+        Raises InvalidPageTokenError for a token this repository did not issue.
+        """
+        limit = clamp_page_size(limit)
+        docs = list(page_query(self.collection, limit, page_token).stream())
+        return build_page(docs, limit, self._to_model)
+
+    def iter_all(self, page_size: int = 100) -> Iterator[T]:
+        """Yield every document in the collection, fetching one page at a time."""
+        page_token = None
+        while True:
+            page = self.list_page(page_size, page_token)
+            yield from page.items
+            if page.next_page_token is None:
+                return
+            page_token = page.next_page_token
+
+
+class AsyncBaseRepository[T: BaseDocument]:
+    """Generic repository built on the async Firestore client.
+
+    Mirrors BaseRepository but awaits every RPC, so a slow Firestore call
+    does not block the event loop for other requests and websockets.
+    """
+
+    def __init__(self, db: "AsyncClient", model_class: type[T]):
+        """Initialize repository with async Firestore client and model class."""
+        self.db = db
+        self.model_class = model_class
+        self.collection = db.collection(model_class.COLLECTION)
+
+    def _to_model(self, doc_id: str, data: dict[str, Any]) -> T:
+        """Convert Firestore document data to model instance."""
+        return cast(T, self.model_class.from_dict(doc_id, data))
+
+    async def create(self, doc_id: str, model: T) -> T:
+        """Create a new document."""
+        now = datetime.now(UTC)
+        model.created_at = now
+        model.updated_at = now
+        data = model.to_dict()
+        doc_ref = self.collection.document(doc_id)
+        await doc_ref.set(data)
+        model.id = doc_id
+        remember(doc_ref.path, self.model_class, model, written=True)
+        return model
+
+    async def get(self, doc_id: str) -> T | None:
+        """Get a document by ID (deduplicated per request, see load_model)."""
+        return await load_model(self.collection.document(doc_id), self.model_class, self._to_model)
+
+    async def update(
+        self,
+        doc_id: str,
+        data: dict[str, Any],
+        current: T | None = None,
+        last_update_time: datetime | None = None,
+    ) -> T | None:
+        """Update a document with partial data (see BaseRepository.update).
+
+        A document already loaded in this request is used as `current`, and
+        the update is made conditional on the version it was loaded from.
+        """
+        data["updated_at"] = datetime.now(UTC)
+        doc_ref = self.collection.document(doc_id)
+        if current is None:
+            known = recall(doc_ref.path, self.model_class)
+            current = known if known is not ABSENT else None
+        if current is None:
+            snapshot = await doc_ref.get()
+            if not snapshot.exists:
+                remember(doc_ref.path, self.model_class, None)
+                return None
+            current = self._to_model(snapshot.id, snapshot.to_dict() or {})
+            if last_update_time is None:
+                last_update_time = snapshot.update_time
+        elif last_update_time is None:
+            last_update_time = recall_update_time(doc_ref.path, current)
+        option = None
+        if last_update_time is not None:
+            option = self.db.write_option(last_update_time=last_update_time)
+        try:
+            result = await doc_ref.update(data, option=option)
+        except NotFound:
+            remember(doc_ref.path, self.model_class, None, written=True)
+            return None
+        except FailedPrecondition:
+            forget(doc_ref.path)
+            raise
+        updated = cast(T, current.apply_update(data))
+        remember(doc_ref.path, type(updated), updated, written=True, update_time=result.update_time)
+        return updated
+
+    async def delete(self, doc_id: str, last_update_time: datetime | None = None) -> bool:
+        """Delete a document by ID (see BaseRepository.delete)."""
+        if last_update_time is not None:
+            option = self.db.write_option(last_update_time=last_update_time)
+        else:
+            option = self.db.write_option(exists=True)
+        doc_ref = self.collection.document(doc_id)
+        forget(doc_ref.path)
+        try:
+            await doc_ref.delete(option=option)
+        except NotFound:
+            return False
+        return True
+
+    async def list(self, limit: int = 100) -> list[T]:
+        """List up to `limit` documents; use list_page or iter_all to see the rest."""
+        return [
+            self._to_model(doc.id, doc.to_dict() or {})
+            async for doc in self.collection.limit(limit).stream()
+        ]
+
+    async def list_page(self, limit: int = 100, page_token: str | None = None) -> Page[T]:
+        """List one page of documents ordered by ID (see BaseRepository.list_page)."""
+        limit = clamp_page_size(limit)
+        docs = [doc async for doc in page_query(self.collection, limit, page_token).stream()]
+        return build_page(docs, limit, self._to_model)
+
+    async def iter_all(self, page_size: int = 100) -> AsyncIterator[T]:
+        """Yield every document in the collection, fetching one page at a time."""
+        page_token = None
+        while True:
+            page = await self.list_page(page_size, page_token)
+            for item in page.items:
+                yield item
+            if page.next_page_token is None:
+                return
+            page_token = page.next_page_token
@@ -1,12 +1,34 @@
 """Credential repository for user-scoped Firestore subcollection."""
 
+import asyncio
+from collections.abc import AsyncIterator, Iterator, Sequence
 from datetime import UTC, datetime
 from typing import TYPE_CHECKING, Any, cast
 
+from google.api_core.exceptions import FailedPrecondition, GoogleAPICallError, NotFound
+
 if TYPE_CHECKING:
-    from google.cloud.firestore_v1 import Client
+    from google.cloud.firestore_v1 import AsyncClient, Client
+
+from app.models.credential import CredentialDocument, CredentialSummary
+from app.repositories.base import load_model
+from app.repositories.identity import ABSENT, forget, recall, recall_update_time, remember
+from app.repositories.pagination import Page, build_page, clamp_page_size, page_query
+
+# Firestore's limit on writes in a single commit
+MAX_BATCH_WRITES = 500
 
-from app.models.credential import CredentialDocument
+
+def _chunks[T](items: Sequence[T], size: int) -> list[Sequence[T]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def _stamp(models: Sequence[tuple[str, CredentialDocument]]) -> None:
+    now = datetime.now(UTC)
+    for doc_id, model in models:
+        model.id = doc_id
+        model.created_at = now
+        model.updated_at = now
 
 
 class CredentialRepository:
@@ -21,6 +43,10 @@ class CredentialRepository:
         """Convert Firestore document data to model instance."""
         return cast(CredentialDocument, CredentialDocument.from_dict(doc_id, data))
 
+    def _to_summary(self, doc_id: str, data: dict[str, Any]) -> CredentialSummary:
+        """Convert projected Firestore document data to a summary."""
+        return CredentialSummary.from_dict(doc_id, data)
+
     def create(self, doc_id: str, model: CredentialDocument) -> CredentialDocument:
         """Create a new credential document."""
         now = datetime.now(UTC)
@@ -38,27 +64,427 @@ class CredentialRepository:
             return None
         return self._to_model(doc.id, doc.to_dict() or {})  # type: ignore[union-attr]
 
+    def get_summary(self, doc_id: str) -> CredentialSummary | None:
+        """Get a credential's masked metadata, without fetching the encrypted key."""
+        doc = self.collection.document(doc_id).get(field_paths=CredentialSummary.FIELDS)  # type: ignore[union-attr]
+        if not doc.exists:  # type: ignore[union-attr]
+            return None
+        return self._to_summary(doc.id, doc.to_dict() or {})  # type: ignore[union-attr]
+
     def list(self, limit: int = 50) -> list[CredentialDocument]:
-        """List all credentials for this user."""
+        """List up to `limit` credentials; use list_page or iter_all to see the rest."""
         docs = self.collection.limit(limit).stream()
         return [self._to_model(doc.id, doc.to_dict() or {}) for doc in docs]  # type: ignore[union-attr]
 
-    def update(self, doc_id: str, data: dict[str, Any]) -> CredentialDocument | None:
-        """Update a credential with partial data."""
+    def list_page(self, limit: int = 50, page_token: str | None = None) -> Page[CredentialDocument]:
+        """List one page of credentials ordered by ID (see BaseRepository.list_page)."""
+        limit = clamp_page_size(limit)
+        docs = list(page_query(self.collection, limit, page_token).stream())
+        return build_page(docs, limit, self._to_model)
+
+    def iter_all(self, page_size: int = 100) -> Iterator[CredentialDocument]:
+        """Yield every credential for this user, fetching one page at a time."""
+        page_token = None
+        while True:
+            page = self.list_page(page_size, page_token)
+            yield from page.items
+            if page.next_page_token is None:
+                return
+            page_token = page.next_page_token
+
+    def list_summary_page(
+        self, limit: int = 50, page_token: str | None = None
+    ) -> Page[CredentialSummary]:
+        """List one page of credential summaries, projected to skip the encrypted key."""
+        limit = clamp_page_size(limit)
+        query = page_query(self.collection, limit, page_token, CredentialSummary.FIELDS)
+        return build_page(list(query.stream()), limit, self._to_summary)
+
+    def iter_summaries(self, page_size: int = 100) -> Iterator[CredentialSummary]:
+        """Yield a summary of every credential for this user, one page at a time."""
+        page_token = None
+        while True:
+            page = self.list_summary_page(page_size, page_token)
+            yield from page.items
+            if page.next_page_token is None:
+                return
+            page_token = page.next_page_token
+
+    def update(
+        self,
+        doc_id: str,
+        data: dict[str, Any],
+        current: CredentialSummary | None = None,
+        last_update_time: datetime | None = None,
+    ) -> CredentialSummary | None:
+        """Update a credential with partial data (see BaseRepository.update).
+
+        `current` may be a summary, which is returned updated; without it the
+        summary is read first and the update is made conditional on that read.
+        Returns None if the credential does not exist.
+        """
+        data["updated_at"] = datetime.now(UTC)
         doc_ref = self.collection.document(doc_id)
-        doc = doc_ref.get()  # type: ignore[union-attr]
-        if not doc.exists:  # type: ignore[union-attr]
+        if current is None:
+            snapshot = doc_ref.get(field_paths=CredentialSummary.FIELDS)  # type: ignore[union-attr]
+            if not snapshot.exists:  # type: ignore[union-attr]
+                return None
+            current = self._to_summary(snapshot.id, snapshot.to_dict() or {})  # type: ignore[union-attr]
+            if last_update_time is None:
+                last_update_time = snapshot.update_time  # type: ignore[union-attr]
+        option = None
+        if last_update_time is not None:
+            option = self.db.write_option(last_update_time=last_update_time)
+        try:
+            doc_ref.update(data, option=option)
+        except NotFound:
             return None
-        data["updated_at"] = datetime.now(UTC)
-        doc_ref.update(data)
-        updated_doc = doc_ref.get()  # type: ignore[union-attr]
-        return self._to_model(updated_doc.id, updated_doc.to_dict() or {})  # type: ignore[union-attr]
+        return cast(CredentialSummary, current.apply_update(data))
 
-    def delete(self, doc_id: str) -> bool:
-        """Delete a credential by ID."""
+    def delete(self, doc_id: str, last_update_time: datetime | None = None) -> bool:
+        """Delete a credential by ID in a single RPC.
+
+        Returns False if the credential does not exist.
+        """
+        if last_update_time is not None:
+            option = self.db.write_option(last_update_time=last_update_time)
+        else:
+            option = self.db.write_option(exists=True)
+        try:
+            self.collection.document(doc_id).delete(option=option)
+        except NotFound:
+            return False
+        return True
+
+    def scrub_and_delete(self, doc_id: str) -> bool:
+        """Blank the encrypted key, then delete the credential.
+
+        The overwrite is committed on its own before the delete; in one
+        commit it would never be stored. Its implicit exists precondition
+        makes this return False, after one round trip, if the credential
+        does not exist.
+        """
         doc_ref = self.collection.document(doc_id)
-        doc = doc_ref.get()  # type: ignore[union-attr]
-        if not doc.exists:  # type: ignore[union-attr]
+        try:
+            doc_ref.update({"encrypted_key": ""})
+        except NotFound:
             return False
         doc_ref.delete()
         return True
+
+    def create_many(
+        self, models: Sequence[tuple[str, CredentialDocument]]
+    ) -> Sequence[CredentialDocument | GoogleAPICallError]:
+        """Create many credentials with batched commits of up to MAX_BATCH_WRITES.
+
+        Returns one entry per input, in order: the created document, or the
+        error that failed its batch (a batch commits or fails as a whole).
+        """
+        _stamp(models)
+        results: list[CredentialDocument | GoogleAPICallError] = []
+        for chunk in _chunks(models, MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for doc_id, model in chunk:
+                batch.set(self.collection.document(doc_id), model.to_dict())
+            try:
+                batch.commit()
+            except GoogleAPICallError as e:
+                results.extend(e for _ in chunk)
+            else:
+                results.extend(model for _, model in chunk)
+        return results
+
+    def scrub_and_delete_many(self, doc_ids: Sequence[str]) -> Sequence[bool | GoogleAPICallError]:
+        """Scrub and delete many credentials with one read and batched commits.
+
+        Each batch of up to MAX_BATCH_WRITES credentials is two commits: the
+        overwrites, then the deletes. A credential deleted after the read is
+        skipped, not recreated. Returns one entry per input, in order:
+        True if it was deleted, False if it did not exist, or the error that
+        failed its batch.
+        """
+        unique = list(dict.fromkeys(doc_ids))
+        refs = [self.collection.document(doc_id) for doc_id in unique]
+        snapshots = self.db.get_all(refs, field_paths=["key_suffix"])
+        existing = [snap.id for snap in snapshots if snap.exists]  # type: ignore[union-attr]
+
+        outcome: dict[str, bool | GoogleAPICallError] = dict.fromkeys(unique, False)
+        for chunk in _chunks(existing, MAX_BATCH_WRITES):
+            try:
+                outcome.update(dict.fromkeys(self._scrub_and_delete_chunk(chunk), True))
+            except GoogleAPICallError as e:
+                outcome.update(dict.fromkeys(chunk, e))
+        return [outcome[doc_id] for doc_id in doc_ids]
+
+    def _scrub_and_delete_chunk(self, doc_ids: Sequence[str]) -> Sequence[str]:
+        """Scrub, then delete, existing credentials in two commits; returns the IDs
+        deleted.
+
+        The overwrites' exists preconditions fail the whole batch if any of
+        the credentials was deleted meanwhile; it is then retried without
+        them, rather than recreating them as scrubbed documents.
+        """
+        while doc_ids:
+            scrub, delete = self.db.batch(), self.db.batch()
+            for doc_id in doc_ids:
+                doc_ref = self.collection.document(doc_id)
+                scrub.update(doc_ref, {"encrypted_key": ""})
+                delete.delete(doc_ref)
+            try:
+                scrub.commit()
+            except NotFound:
+                refs = [self.collection.document(doc_id) for doc_id in doc_ids]
+                snapshots = self.db.get_all(refs, field_paths=["key_suffix"])
+                remaining = [snap.id for snap in snapshots if snap.exists]  # type: ignore[union-attr]
+                if len(remaining) == len(doc_ids):
+                    raise
+                doc_ids = remaining
+                continue
+            delete.commit()
+            return doc_ids
+        return []
+
+
+class AsyncCredentialRepository:
+    """Async repository for credentials stored under users/{uid}/credentials."""
+
+    def __init__(self, db: "AsyncClient", user_id: str):
+        """Initialize with async Firestore client and the owning user's UID."""
+        self.db = db
+        self.collection = db.collection("users").document(user_id).collection("credentials")
+
+    def _to_model(self, doc_id: str, data: dict[str, Any]) -> CredentialDocument:
+        """Convert Firestore document data to model instance."""
+        return cast(CredentialDocument, CredentialDocument.from_dict(doc_id, data))
+
+    def _to_summary(self, doc_id: str, data: dict[str, Any]) -> CredentialSummary:
+        """Convert projected Firestore document data to a summary."""
+        return CredentialSummary.from_dict(doc_id, data)
+
+    async def create(self, doc_id: str, model: CredentialDocument) -> CredentialDocument:
+        """Create a new credential document."""
+        now = datetime.now(UTC)
+        model.created_at = now
+        model.updated_at = now
+        data = model.to_dict()
+        doc_ref = self.collection.document(doc_id)
+        await doc_ref.set(data)
+        model.id = doc_id
+        remember(doc_ref.path, CredentialDocument, model, written=True)
+        return model
+
+    async def get(self, doc_id: str) -> CredentialDocument | None:
+        """Get a credential by ID (deduplicated per request, see load_model)."""
+        return await load_model(
+            self.collection.document(doc_id), CredentialDocument, self._to_model
+        )
+
+    async def get_summary(self, doc_id: str) -> CredentialSummary | None:
+        """Get a credential's masked metadata, without fetching the encrypted key."""
+        return await load_model(
+            self.collection.document(doc_id),
+            CredentialSummary,
+            self._to_summary,
+            CredentialSummary.FIELDS,
+        )
+
+    async def list(self, limit: int = 50) -> list[CredentialDocument]:
+        """List up to `limit` credentials; use list_page or iter_all to see the rest."""
+        return [
+            self._to_model(doc.id, doc.to_dict() or {})
+            async for doc in self.collection.limit(limit).stream()
+        ]
+
+    async def list_page(
+        self, limit: int = 50, page_token: str | None = None
+    ) -> Page[CredentialDocument]:
+        """List one page of credentials ordered by ID (see BaseRepository.list_page)."""
+        limit = clamp_page_size(limit)
+        docs = [doc async for doc in page_query(self.collection, limit, page_token).stream()]
+        return build_page(docs, limit, self._to_model)
+
+    async def iter_all(self, page_size: int = 100) -> AsyncIterator[CredentialDocument]:
+        """Yield every credential for this user, fetching one page at a time."""
+        page_token = None
+        while True:
+            page = await self.list_page(page_size, page_token)
+            for item in page.items:
+                yield item
+            if page.next_page_token is None:
+                return
+            page_token = page.next_page_token
+
+    async def list_summary_page(
+        self, limit: int = 50, page_token: str | None = None
+    ) -> Page[CredentialSummary]:
+        """List one page of credential summaries, projected to skip the encrypted key."""
+        limit = clamp_page_size(limit)
+        query = page_query(self.collection, limit, page_token, CredentialSummary.FIELDS)
+        return build_page([doc async for doc in query.stream()], limit, self._to_summary)
+
+    async def iter_summaries(self, page_size: int = 100) -> AsyncIterator[CredentialSummary]:
+        """Yield a summary of every credential for this user, one page at a time."""
+        page_token = None
+        while True:
+            page = await self.list_summary_page(page_size, page_token)
+            for item in page.items:
+                yield item
+            if page.next_page_token is None:
+                return
+            page_token = page.next_page_token
+
+    async def update(
+        self,
+        doc_id: str,
+        data: dict[str, Any],
+        current: CredentialSummary | None = None,
+        last_update_time: datetime | None = None,
+    ) -> CredentialSummary | None:
+        """Update a credential with partial data (see BaseRepository.update).
+
+        `current` may be a summary, which is returned updated. A credential
+        already loaded in this request is used as `current`, and the update is
+        made conditional on the version it was loaded from; otherwise the
+        summary is read first. Returns None if the credential does not exist.
+        """
+        data["updated_at"] = datetime.now(UTC)
+        doc_ref = self.collection.document(doc_id)
+        if current is None:
+            known = recall(doc_ref.path, CredentialDocument)
+            current = known if known is not ABSENT else None
+        if current is None:
+            snapshot = await doc_ref.get(field_paths=CredentialSummary.FIELDS)
+            if not snapshot.exists:
+                remember(doc_ref.path, CredentialSummary, None)
+                return None
+            current = self._to_summary(snapshot.id, snapshot.to_dict() or {})
+            if last_update_time is None:
+                last_update_time = snapshot.update_time
+        elif last_update_time is None:
+            last_update_time = recall_update_time(doc_ref.path, current)
+        option = None
+        if last_update_time is not None:
+            option = self.db.write_option(last_update_time=last_update_time)
+        try:
+            result = await doc_ref.update(data, option=option)
+        except NotFound:
+            forget(doc_ref.path)
+            return None
+        except FailedPrecondition:
+            forget(doc_ref.path)
+            raise
+        updated = cast(CredentialSummary, current.apply_update(data))
+        remember(doc_ref.path, type(updated), updated, written=True, update_time=result.update_time)
+        return updated
+
+    async def delete(self, doc_id: str, last_update_time: datetime | None = None) -> bool:
+        """Delete a credential by ID in a single RPC.
+
+        Returns False if the credential does not exist.
+        """
+        if last_update_time is not None:
+            option = self.db.write_option(last_update_time=last_update_time)
+        else:
+            option = self.db.write_option(exists=True)
+        doc_ref = self.collection.document(doc_id)
+        forget(doc_ref.path)
+        try:
+            await doc_ref.delete(option=option)
+        except NotFound:
+            return False
+        return True
+
+    async def scrub_and_delete(self, doc_id: str) -> bool:
+        """Blank the encrypted key, then delete the credential (see
+        CredentialRepository.scrub_and_delete)."""
+        doc_ref = self.collection.document(doc_id)
+        forget(doc_ref.path)
+        try:
+            await doc_ref.update({"encrypted_key": ""})
+        except NotFound:
+            return False
+        await doc_ref.delete()
+        return True
+
+    async def create_many(
+        self, models: Sequence[tuple[str, CredentialDocument]]
+    ) -> Sequence[CredentialDocument | GoogleAPICallError]:
+        """Create many credentials with batched commits (see CredentialRepository.create_many).
+
+        The batches are committed concurrently.
+        """
+        _stamp(models)
+        forget(*(self.collection.document(doc_id).path for doc_id, _ in models))
+        chunks = _chunks(models, MAX_BATCH_WRITES)
+
+        async def commit(chunk: Sequence[tuple[str, CredentialDocument]]) -> None:
+            batch = self.db.batch()
+            for doc_id, model in chunk:
+                batch.set(self.collection.document(doc_id), model.to_dict())
+            await batch.commit()
+
+        outcomes = await asyncio.gather(*(commit(c) for c in chunks), return_exceptions=True)
+        results: list[CredentialDocument | GoogleAPICallError] = []
+        for chunk, outcome in zip(chunks, outcomes, strict=True):
+            if isinstance(outcome, GoogleAPICallError):
+                results.extend(outcome for _ in chunk)
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                results.extend(model for _, model in chunk)
+        return results
+
+    async def scrub_and_delete_many(
+        self, doc_ids: Sequence[str]
+    ) -> Sequence[bool | GoogleAPICallError]:
+        """Scrub and delete many credentials (see CredentialRepository.scrub_and_delete_many).
+
+        The batches are committed concurrently.
+        """
+        unique = list(dict.fromkeys(doc_ids))
+        refs = [self.collection.document(doc_id) for doc_id in unique]
+        forget(*(ref.path for ref in refs))
+        existing = [
+            snap.id
+            async for snap in self.db.get_all(refs, field_paths=["key_suffix"])
+            if snap.exists
+        ]
+        chunks = _chunks(existing, MAX_BATCH_WRITES)
+        outcomes = await asyncio.gather(
+            *(self._scrub_and_delete_chunk(c) for c in chunks), return_exceptions=True
+        )
+        outcome_by_id: dict[str, bool | GoogleAPICallError] = dict.fromkeys(unique, False)
+        for chunk, outcome in zip(chunks, outcomes, strict=True):
+            if isinstance(outcome, GoogleAPICallError):
+                outcome_by_id.update(dict.fromkeys(chunk, outcome))
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                outcome_by_id.update(dict.fromkeys(outcome, True))
+        return [outcome_by_id[doc_id] for doc_id in doc_ids]
+
+    async def _scrub_and_delete_chunk(self, doc_ids: Sequence[str]) -> Sequence[str]:
+        """Scrub, then delete, existing credentials; returns the IDs deleted (see
+        CredentialRepository._scrub_and_delete_chunk)."""
+        while doc_ids:
+            scrub, delete = self.db.batch(), self.db.batch()
+            for doc_id in doc_ids:
+                doc_ref = self.collection.document(doc_id)
+                scrub.update(doc_ref, {"encrypted_key": ""})
+                delete.delete(doc_ref)
+            try:
+                await scrub.commit()
+            except NotFound:
+                refs = [self.collection.document(doc_id) for doc_id in doc_ids]
+                remaining = [
+                    snap.id
+                    async for snap in self.db.get_all(refs, field_paths=["key_suffix"])
+                    if snap.exists
+                ]
+                if len(remaining) == len(doc_ids):
+                    raise
+                doc_ids = remaining
+                continue
+            await delete.commit()
+            return doc_ids
+        return []
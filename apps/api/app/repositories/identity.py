@@ -0,0 +1,154 @@
+"""Request-scoped identity map for documents loaded through the repositories.
+
+Within one request, the first read of a document path is remembered, so
+later reads of the same path (including "not found") return the same model
+without another RPC, and writes through the repositories keep the map in
+step. Paths written in the request are also marked, so that a later read
+of them does not join a read another request started before the write.
+The stored version (update time) of each remembered model is kept too, so
+an update can be made conditional on the document not having changed since.
+The map lives in a context variable that `IdentityMapMiddleware`
+sets for each HTTP request; outside a scope (jobs, websockets, tests that
+call repositories directly) every helper here is a no-op.
+"""
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class _Absent:
+    """Marker for "not in the map" (as opposed to a remembered None)."""
+
+
+ABSENT = _Absent()
+
+
+class IdentityMap:
+    """Models loaded in the current request, keyed by document path and model class.
+
+    The model class is part of the key because the same document can be
+    loaded in different shapes (e.g. a projected CredentialSummary and a
+    full CredentialDocument).
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[str, dict[type, Any]] = {}
+        # Path -> update time of the stored version the entries reflect, if known
+        self._update_times: dict[str, Any] = {}
+        self._written: set[str] = set()
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return sum(len(kinds) for kinds in self._entries.values())
+
+    def get(self, path: str, kind: type) -> Any:
+        """Return the remembered model (or None if known missing), else ABSENT."""
+        kinds = self._entries.get(path)
+        if kinds is None or kind not in kinds:
+            return ABSENT
+        self.hits += 1
+        return kinds[kind]
+
+    def put(
+        self, path: str, kind: type, model: Any, written: bool = False, update_time: Any = None
+    ) -> None:
+        """Remember `model` (None for a missing document) as the only shape of `path`,
+        stored as of `update_time` if known."""
+        self._entries[path] = {kind: model}
+        if update_time is not None:
+            self._update_times[path] = update_time
+        else:
+            self._update_times.pop(path, None)
+        if written:
+            self._written.add(path)
+
+    def discard(self, *paths: str) -> None:
+        """Forget every shape of the given paths after writing them."""
+        for path in paths:
+            self._entries.pop(path, None)
+            self._update_times.pop(path, None)
+        self._written.update(paths)
+
+    def update_time(self, path: str, model: Any) -> Any:
+        """The update time of the stored version of `path`, if `model` is the model
+        remembered for it and the time is known."""
+        if self._entries.get(path, {}).get(type(model)) is not model:
+            return None
+        return self._update_times.get(path)
+
+    def written(self, path: str) -> bool:
+        """Whether this request has written (or tried to write) `path`."""
+        return path in self._written
+
+
+_current: ContextVar[IdentityMap | None] = ContextVar("identity_map", default=None)
+
+
+def current_identity_map() -> IdentityMap | None:
+    """Return the identity map for the current request, if one is active."""
+    return _current.get()
+
+
+@contextmanager
+def identity_scope() -> Iterator[IdentityMap]:
+    """Run the enclosed code with a fresh identity map."""
+    identity = IdentityMap()
+    token = _current.set(identity)
+    try:
+        yield identity
+    finally:
+        _current.reset(token)
+
+
+def recall(path: str, kind: type) -> Any:
+    """Look up `path` in the active identity map; ABSENT if unknown or no scope."""
+    identity = _current.get()
+    return identity.get(path, kind) if identity is not None else ABSENT
+
+
+def remember(
+    path: str, kind: type, model: Any, written: bool = False, update_time: Any = None
+) -> None:
+    """Record a loaded model, or with `written` a model just stored, in the active map,
+    with the update time of the stored version if known."""
+    identity = _current.get()
+    if identity is not None:
+        identity.put(path, kind, model, written, update_time)
+
+
+def recall_update_time(path: str, model: Any) -> Any:
+    """The update time of the stored version `model` was loaded from, if it is the
+    model remembered for `path`; None otherwise or outside a scope."""
+    identity = _current.get()
+    return identity.update_time(path, model) if identity is not None else None
+
+
+def was_written(path: str) -> bool:
+    """Whether the current request has written `path`; False outside a scope."""
+    identity = _current.get()
+    return identity is not None and identity.written(path)
+
+
+def forget(*paths: str) -> None:
+    """Drop written paths whose stored state is no longer known from the active map."""
+    identity = _current.get()
+    if identity is not None:
+        identity.discard(*paths)
+
+
+class IdentityMapMiddleware:
+    """ASGI middleware giving each HTTP request its own identity map."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with identity_scope():
+            await self.app(scope, receive, send)
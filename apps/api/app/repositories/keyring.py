@@ -0,0 +1,85 @@
+"""Repository for a user's wrapped data key at users/{uid}/keyring/dek."""
+
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, Any
+
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+if TYPE_CHECKING:
+    from google.cloud.firestore_v1 import AsyncClient
+
+from app.models.keyring import DataKey
+from app.repositories.base import load_model
+from app.repositories.identity import forget, remember
+
+
+class AsyncKeyringRepository:
+    """Async repository for the data key that seals one user's credentials."""
+
+    def __init__(self, db: "AsyncClient", user_id: str):
+        """Initialize with async Firestore client and the owning user's UID."""
+        self.db = db
+        self.doc_ref = (
+            db.collection("users")
+            .document(user_id)
+            .collection(DataKey.COLLECTION)
+            .document(DataKey.DOC_ID)
+        )
+
+    def _to_model(self, doc_id: str, data: dict[str, Any]) -> DataKey:
+        """Convert Firestore document data to model instance."""
+        return DataKey.from_dict(doc_id, data)
+
+    async def get(self) -> DataKey | None:
+        """Get the user's data key, if one was created (see load_model)."""
+        return await load_model(self.doc_ref, DataKey, self._to_model)
+
+    async def read(self) -> DataKey | None:
+        """Read the data key from Firestore, bypassing the identity map and single-flight.
+
+        Used after losing a creation race, when a coalesced read may predate
+        the winner's write.
+        """
+        snapshot = await self.doc_ref.get()
+        model = self._to_model(snapshot.id, snapshot.to_dict() or {}) if snapshot.exists else None
+        remember(self.doc_ref.path, DataKey, model)
+        return model
+
+    async def create(self, model: DataKey) -> DataKey | None:
+        """Store a new data key unless the user already has one.
+
+        Returns None when another request created the key first; the caller
+        should read and use that one instead.
+        """
+        now = datetime.now(UTC)
+        model.created_at = now
+        model.updated_at = now
+        try:
+            await self.doc_ref.create(model.to_dict())
+        except AlreadyExists:
+            forget(self.doc_ref.path)
+            return None
+        model.id = DataKey.DOC_ID
+        remember(self.doc_ref.path, DataKey, model, written=True)
+        return model
+
+    async def rewrap(
+        self, current: DataKey, wrapped_key: str, master_version: int
+    ) -> DataKey | None:
+        """Replace the wrapped key after wrapping the same data key with another master key.
+
+        Returns None if the key document no longer exists.
+        """
+        data = {
+            "wrapped_key": wrapped_key,
+            "master_version": master_version,
+            "updated_at": datetime.now(UTC),
+        }
+        try:
+            await self.doc_ref.update(data)
+        except NotFound:
+            forget(self.doc_ref.path)
+            return None
+        updated = current.apply_update(data)
+        remember(self.doc_ref.path, DataKey, updated, written=True)
+        return updated
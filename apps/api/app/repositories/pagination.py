@@ -0,0 +1,91 @@
+"""Cursor pagination helpers shared by the Firestore repositories.
+
+Pages are ordered by document ID, which is unique and stable, and resume
+with `start_after` on the last ID returned. The cursor travels to clients as
+an opaque, URL-safe page token so the ordering can change without breaking
+the API.
+"""
+
+import base64
+import binascii
+import json
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+from google.cloud.firestore_v1.field_path import FieldPath
+
+# Field path Firestore uses for ordering by document ID
+DOCUMENT_ID = FieldPath.document_id()
+
+# Upper bound on a single page, whatever the caller asks for
+MAX_PAGE_SIZE = 500
+
+_TOKEN_VERSION = 1
+
+
+class InvalidPageTokenError(ValueError):
+    """Raised when a page token cannot be decoded."""
+
+
+@dataclass
+class Page[T]:
+    """One page of results plus the token for the next one (None on the last page)."""
+
+    items: list[T] = field(default_factory=list)
+    next_page_token: str | None = None
+
+
+def encode_page_token(last_id: str) -> str:
+    """Encode the ID of the last document on a page as an opaque token."""
+    raw = json.dumps({"v": _TOKEN_VERSION, "after": last_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_page_token(token: str) -> str:
+    """Decode a page token back to the document ID to resume after."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidPageTokenError("Malformed page token") from e
+    if (
+        not isinstance(payload, dict)
+        or payload.get("v") != _TOKEN_VERSION
+        or not isinstance(payload.get("after"), str)
+        or not payload["after"]
+    ):
+        raise InvalidPageTokenError("Malformed page token")
+    return payload["after"]
+
+
+def clamp_page_size(limit: int) -> int:
+    """Keep a requested page size within [1, MAX_PAGE_SIZE]."""
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def page_query(
+    collection: Any,
+    limit: int,
+    page_token: str | None,
+    field_paths: Iterable[str] | None = None,
+) -> Any:
+    """Build the query for one page, fetching one extra row to detect a next page.
+
+    `field_paths` projects the query so only those fields are returned.
+    """
+    query = collection.order_by(DOCUMENT_ID)
+    if field_paths is not None:
+        query = query.select(list(field_paths))
+    if page_token:
+        query = query.start_after({DOCUMENT_ID: decode_page_token(page_token)})
+    return query.limit(limit + 1)
+
+
+def build_page[T](
+    docs: list[Any], limit: int, to_model: Callable[[str, dict[str, Any]], T]
+) -> Page[T]:
+    """Turn the snapshots from `page_query` into a Page."""
+    items = [to_model(doc.id, doc.to_dict() or {}) for doc in docs[:limit]]
+    next_token = encode_page_token(docs[limit - 1].id) if len(docs) > limit else None
+    return Page(items=items, next_page_token=next_token)
@@ -0,0 +1,58 @@
+"""Coalesce concurrent identical reads into a single Firestore RPC.
+
+When several requests (e.g. multiple desktop windows for the same user) read
+the same document at the same moment, the first caller issues the RPC and the
+rest await its result. Only reads in flight together are shared; nothing is
+cached after the RPC completes.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from functools import lru_cache
+from typing import Any
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome with every caller."""
+
+    def __init__(self) -> None:
+        self._inflight: dict[Hashable, asyncio.Task[Any]] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do[T](self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return the result of `fn()`, joining a call already in flight for `key`.
+
+        The call runs in its own task, so a caller being cancelled does not
+        cancel it for the others.
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task[Any]) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller was cancelled
+            task.exception()
+
+    def stats(self) -> dict[str, Any]:
+        """Return call counters for the metrics endpoint."""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+@lru_cache
+def get_single_flight() -> SingleFlight:
+    """Get the process-wide single-flight group for repository reads."""
+    return SingleFlight()
@@ -1,12 +1,26 @@
 """User repository for Firestore operations."""
 
-from typing import TYPE_CHECKING
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, Any
+
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
 
 if TYPE_CHECKING:
-    from google.cloud.firestore_v1 import Client
+    from google.cloud.firestore_v1 import AsyncClient, Client
+
+    from app.lib.profile_cache import ProfileCache
 
 from app.models.user import User
-from app.repositories.base import BaseRepository
+from app.repositories.base import AsyncBaseRepository, BaseRepository
+from app.repositories.identity import remember
+
+# Attempts before giving up when concurrent sign-ins keep racing the upsert
+_UPSERT_ATTEMPTS = 3
+
+
+def _profile_changes(existing: User, profile: dict[str, Any]) -> dict[str, Any]:
+    """Return the profile fields whose values differ from the stored user."""
+    return {k: v for k, v in profile.items() if getattr(existing, k) != v}
 
 
 class UserRepository(BaseRepository[User]):
@@ -28,6 +42,52 @@ class UserRepository(BaseRepository[User]):
             return self._to_model(doc.id, doc.to_dict() or {})
         return None
 
+    def upsert(
+        self,
+        firebase_uid: str,
+        email: str,
+        display_name: str | None = None,
+        avatar_url: str | None = None,
+    ) -> User:
+        """Create or update a user's profile, writing only when it changed.
+
+        One read, then: nothing if the profile is unchanged, a single
+        merge-style update of the changed fields (guarded by the read's
+        update_time so a concurrent write is never clobbered), or a create
+        guarded by an exists=False precondition for a new user. The returned
+        User is built locally, never re-read.
+
+        The read stays because a blind set(..., merge=True) could neither
+        skip unchanged profiles nor return created_at without a re-read.
+        AsyncUserRepository.upsert avoids it when the profile cache holds
+        the user.
+        """
+        profile = {"email": email, "display_name": display_name, "avatar_url": avatar_url}
+        doc_ref = self.collection.document(firebase_uid)
+        for attempt in range(_UPSERT_ATTEMPTS):
+            snapshot = doc_ref.get()
+            now = datetime.now(UTC)
+            try:
+                if snapshot.exists:
+                    existing = self._to_model(snapshot.id, snapshot.to_dict() or {})
+                    changes = _profile_changes(existing, profile)
+                    if not changes:
+                        return existing
+                    changes["updated_at"] = now
+                    option = self.db.write_option(last_update_time=snapshot.update_time)
+                    doc_ref.update(changes, option=option)
+                    return existing.apply_update(changes)
+
+                user = User(id=firebase_uid, firebase_uid=firebase_uid, **profile)
+                user.created_at = user.updated_at = now
+                doc_ref.create(user.to_dict())
+                return user
+            except (AlreadyExists, FailedPrecondition):
+                # Another sign-in for the same user won the race; re-read and retry
+                if attempt == _UPSERT_ATTEMPTS - 1:
+                    raise
+        raise AssertionError("unreachable")
+
     def create_or_update(
         self,
         firebase_uid: str,
@@ -35,24 +95,119 @@ class UserRepository(BaseRepository[User]):
         display_name: str | None = None,
         avatar_url: str | None = None,
     ) -> User:
-        """Create or update a user by Firebase UID."""
-        existing = self.get(firebase_uid)
-        if existing:
-            return (
-                self.update(
-                    firebase_uid,
-                    {
-                        "email": email,
-                        "display_name": display_name,
-                        "avatar_url": avatar_url,
-                    },
-                )
-                or existing
-            )
-        user = User(
-            firebase_uid=firebase_uid,
-            email=email,
-            display_name=display_name,
-            avatar_url=avatar_url,
-        )
-        return self.create(firebase_uid, user)
+        """Create or update a user by Firebase UID (alias of upsert)."""
+        return self.upsert(firebase_uid, email, display_name, avatar_url)
+
+
+class AsyncUserRepository(AsyncBaseRepository[User]):
+    """Async repository for User document operations.
+
+    With a `cache`, profile reads by Firebase UID are served from it and
+    every write through this repository refreshes or invalidates it.
+    """
+
+    def __init__(self, db: "AsyncClient", cache: "ProfileCache | None" = None):
+        """Initialize user repository, optionally backed by a profile cache."""
+        super().__init__(db, User)
+        self.cache = cache
+
+    async def get_by_firebase_uid(self, firebase_uid: str) -> User | None:
+        """Get a user by Firebase UID, reading through the profile cache."""
+        if self.cache is not None:
+            cached = await self.cache.get(firebase_uid)
+            if cached is not None:
+                return cached
+        # Firebase UID is used as document ID
+        user = await self.get(firebase_uid)
+        if user is not None and self.cache is not None:
+            await self.cache.put(user)
+        return user
+
+    async def update(
+        self,
+        doc_id: str,
+        data: dict[str, Any],
+        current: User | None = None,
+        last_update_time: datetime | None = None,
+    ) -> User | None:
+        """Update a user (see AsyncBaseRepository.update) and refresh the cache."""
+        user = await super().update(doc_id, data, current, last_update_time)
+        if self.cache is not None:
+            if user is not None:
+                await self.cache.put(user)
+            else:
+                await self.cache.invalidate(doc_id)
+        return user
+
+    async def delete(self, doc_id: str, last_update_time: datetime | None = None) -> bool:
+        """Delete a user (see AsyncBaseRepository.delete) and drop it from the cache."""
+        deleted = await super().delete(doc_id, last_update_time)
+        if self.cache is not None:
+            await self.cache.invalidate(doc_id)
+        return deleted
+
+    async def get_by_email(self, email: str) -> User | None:
+        """Get a user by email address."""
+        async for doc in self.collection.where("email", "==", email).limit(1).stream():
+            return self._to_model(doc.id, doc.to_dict() or {})
+        return None
+
+    async def upsert(
+        self,
+        firebase_uid: str,
+        email: str,
+        display_name: str | None = None,
+        avatar_url: str | None = None,
+    ) -> User:
+        """Create or update a user's profile, writing only when it changed.
+
+        When the profile cache holds the user, nothing is read: an unchanged
+        profile costs no RPC and a changed one a single merge-style update of
+        the changed fields. Its exists precondition sends a user deleted
+        since it was cached down the uncached path, which is
+        UserRepository.upsert: one read, then at most one write.
+        """
+        profile = {"email": email, "display_name": display_name, "avatar_url": avatar_url}
+        doc_ref = self.collection.document(firebase_uid)
+        known = await self.cache.get(firebase_uid) if self.cache is not None else None
+        for attempt in range(_UPSERT_ATTEMPTS):
+            option = None
+            try:
+                if known is None:
+                    snapshot = await doc_ref.get()
+                    if not snapshot.exists:
+                        user = User(id=firebase_uid, firebase_uid=firebase_uid, **profile)
+                        user.created_at = user.updated_at = datetime.now(UTC)
+                        await doc_ref.create(user.to_dict())
+                        return await self._cached(user)
+                    known = self._to_model(snapshot.id, snapshot.to_dict() or {})
+                    option = self.db.write_option(last_update_time=snapshot.update_time)
+                changes = _profile_changes(known, profile)
+                if not changes:
+                    return await self._cached(known)
+                changes["updated_at"] = datetime.now(UTC)
+                await doc_ref.update(changes, option=option)
+                return await self._cached(known.apply_update(changes))
+            except (AlreadyExists, FailedPrecondition, NotFound):
+                # Another sign-in won the race, or the cached user is gone; re-read and retry
+                known = None
+                if attempt == _UPSERT_ATTEMPTS - 1:
+                    raise
+        raise AssertionError("unreachable")
+
+    async def _cached(self, user: User) -> User:
+        """Write a freshly stored profile through to the identity map and cache."""
+        remember(self.collection.document(user.id).path, User, user, written=True)
+        if self.cache is not None:
+            await self.cache.put(user)
+        return user
+
+    async def create_or_update(
+        self,
+        firebase_uid: str,
+        email: str,
+        display_name: str | None = None,
+        avatar_url: str | None = None,
+    ) -> User:
+        """Create or update a user by Firebase UID (alias of upsert)."""
+        return await self.upsert(firebase_uid, email, display_name, avatar_url)
@@ -2,15 +2,20 @@
 
 import logging
 import os
+from typing import Annotated
 
-import httpx
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
 from pydantic import BaseModel
 
 from app.lib.config import get_settings
-from app.lib.firebase import get_firestore_client
-from app.middleware.auth import CurrentUser
-from app.repositories.user import UserRepository
+from app.lib.firebase import get_async_firestore_client
+from app.lib.http import get_http_client
+from app.lib.profile_cache import get_profile_cache
+from app.lib.token_cache import REVOCATION_TOPIC, get_token_cache
+from app.middleware.auth import CurrentUser, security
+from app.realtime.manager import get_connection_manager
+from app.repositories.user import AsyncUserRepository
 
 logger = logging.getLogger(__name__)
 
@@ -66,29 +71,29 @@ async def exchange_google_auth_code(body: GoogleExchangeRequest) -> AuthTokenRes
     )
 
     # Exchange authorization code for Google tokens
-    async with httpx.AsyncClient() as client:
-        token_resp = await client.post(
-            "https://oauth2.googleapis.com/token",
-            data={
-                "code": body.code,
-                "client_id": settings.google_client_id,
-                "client_secret": settings.google_client_secret,
-                "redirect_uri": body.redirect_uri,
-                "grant_type": "authorization_code",
-            },
+    client = get_http_client()
+    token_resp = await client.post(
+        "https://oauth2.googleapis.com/token",
+        data={
+            "code": body.code,
+            "client_id": settings.google_client_id,
+            "client_secret": settings.google_client_secret,
+            "redirect_uri": body.redirect_uri,
+            "grant_type": "authorization_code",
+        },
+    )
+    if token_resp.status_code != 200:
+        logger.error(
+            "Google token exchange failed (status=%s): %s",
+            token_resp.status_code,
+            token_resp.text,
+        )
+        raise HTTPException(
+            status_code=400,
+            detail=f"Google token exchange failed: {token_resp.text}",
         )
-        if token_resp.status_code != 200:
-            logger.error(
-                "Google token exchange failed (status=%s): %s",
-                token_resp.status_code,
-                token_resp.text,
-            )
-            raise HTTPException(
-                status_code=400,
-                detail=f"Google token exchange failed: {token_resp.text}",
-            )
-        logger.info("Google token exchange succeeded")
-        google_tokens = token_resp.json()
+    logger.info("Google token exchange succeeded")
+    google_tokens = token_resp.json()
 
     # Exchange Google credential for Firebase auth tokens
     firebase_result = await _sign_in_with_google_credential(
@@ -97,9 +102,8 @@ async def exchange_google_auth_code(body: GoogleExchangeRequest) -> AuthTokenRes
     )
 
     # Create or update user in Firestore
-    db = get_firestore_client()
-    user_repo = UserRepository(db)
-    user = user_repo.create_or_update(
+    user_repo = _get_user_repo()
+    user = await user_repo.upsert(
         firebase_uid=firebase_result["localId"],
         email=firebase_result.get("email", ""),
         display_name=firebase_result.get("displayName"),
@@ -132,39 +136,38 @@ async def dev_sign_in(body: DevSignInRequest) -> AuthTokenResponse:
 
     display_name = body.display_name or body.email.split("@")[0]
 
-    async with httpx.AsyncClient() as client:
-        # Try sign-up first; fall back to sign-in if user already exists
-        signup_resp = await client.post(
-            f"http://{emulator_host}/identitytoolkit.googleapis.com/v1/accounts:signUp",
+    client = get_http_client()
+    # Try sign-up first; fall back to sign-in if user already exists
+    signup_resp = await client.post(
+        f"http://{emulator_host}/identitytoolkit.googleapis.com/v1/accounts:signUp",
+        json={
+            "email": body.email,
+            "password": "dev-password-123",
+            "displayName": display_name,
+            "returnSecureToken": True,
+        },
+        params={"key": "fake-api-key"},
+    )
+
+    if signup_resp.status_code == 200:
+        data = signup_resp.json()
+    else:
+        signin_resp = await client.post(
+            f"http://{emulator_host}/identitytoolkit.googleapis.com/v1/accounts:signInWithPassword",
             json={
                 "email": body.email,
                 "password": "dev-password-123",
-                "displayName": display_name,
                 "returnSecureToken": True,
             },
             params={"key": "fake-api-key"},
         )
-
-        if signup_resp.status_code == 200:
-            data = signup_resp.json()
-        else:
-            signin_resp = await client.post(
-                f"http://{emulator_host}/identitytoolkit.googleapis.com/v1/accounts:signInWithPassword",
-                json={
-                    "email": body.email,
-                    "password": "dev-password-123",
-                    "returnSecureToken": True,
-                },
-                params={"key": "fake-api-key"},
-            )
-            if signin_resp.status_code != 200:
-                raise HTTPException(status_code=400, detail="Emulator auth failed")
-            data = signin_resp.json()
+        if signin_resp.status_code != 200:
+            raise HTTPException(status_code=400, detail="Emulator auth failed")
+        data = signin_resp.json()
 
     # Create or update user in Firestore
-    db = get_firestore_client()
-    user_repo = UserRepository(db)
-    user = user_repo.create_or_update(
+    user_repo = _get_user_repo()
+    user = await user_repo.upsert(
         firebase_uid=data["localId"],
         email=body.email,
         display_name=display_name,
@@ -189,10 +192,9 @@ async def dev_sign_in(body: DevSignInRequest) -> AuthTokenResponse:
 
 @router.get("/auth/me")
 async def get_me(current_user: CurrentUser) -> UserProfile:
-    """Return the authenticated user's profile from Firestore."""
-    db = get_firestore_client()
-    user_repo = UserRepository(db)
-    db_user = user_repo.get_by_firebase_uid(current_user.uid)
+    """Return the authenticated user's profile (cached, see app.lib.profile_cache)."""
+    user_repo = _get_user_repo()
+    db_user = await user_repo.get_by_firebase_uid(current_user.uid)
 
     if db_user:
         return UserProfile(
@@ -205,11 +207,36 @@ async def get_me(current_user: CurrentUser) -> UserProfile:
     return UserProfile(uid=current_user.uid, email=current_user.email or "")
 
 
+@router.post("/auth/signout", status_code=status.HTTP_204_NO_CONTENT)
+async def sign_out(
+    current_user: CurrentUser,
+    credentials: Annotated[HTTPAuthorizationCredentials | None, Depends(security)],
+    all_sessions: bool = False,
+) -> None:
+    """Reject the caller's ID token from now until it expires.
+
+    With `all_sessions`, every token issued to the user so far is rejected.
+    The revocation is applied here and broadcast to every other instance.
+    """
+    cache = get_token_cache()
+    if all_sessions:
+        revocation = cache.revoke_user(current_user.uid)
+    elif credentials is not None:
+        revocation = cache.revoke(credentials.credentials)
+    else:
+        return
+    await get_connection_manager().publish(REVOCATION_TOPIC, revocation)
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
 
+def _get_user_repo() -> AsyncUserRepository:
+    return AsyncUserRepository(get_async_firestore_client(), cache=get_profile_cache())
+
+
 async def _sign_in_with_google_credential(
     google_id_token: str,
     access_token: str | None,
@@ -227,25 +254,25 @@ async def _sign_in_with_google_credential(
     if access_token:
         post_body += f"&access_token={access_token}"
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            f"{base_url}/v1/accounts:signInWithIdp",
-            json={
-                "postBody": post_body,
-                "requestUri": settings.api_base_url,
-                "returnIdpCredential": True,
-                "returnSecureToken": True,
-            },
-            params={"key": settings.firebase_api_key or settings.google_client_id},
+    client = get_http_client()
+    resp = await client.post(
+        f"{base_url}/v1/accounts:signInWithIdp",
+        json={
+            "postBody": post_body,
+            "requestUri": settings.api_base_url,
+            "returnIdpCredential": True,
+            "returnSecureToken": True,
+        },
+        params={"key": settings.firebase_api_key or settings.google_client_id},
+    )
+    if resp.status_code != 200:
+        logger.error(
+            "Firebase signInWithIdp failed (status=%s): %s",
+            resp.status_code,
+            resp.text,
+        )
+        raise HTTPException(
+            status_code=400,
+            detail=f"Firebase signInWithIdp failed: {resp.text}",
         )
-        if resp.status_code != 200:
-            logger.error(
-                "Firebase signInWithIdp failed (status=%s): %s",
-                resp.status_code,
-                resp.text,
-            )
-            raise HTTPException(
-                status_code=400,
-                detail=f"Firebase signInWithIdp failed: {resp.text}",
-            )
-        return resp.json()
+    return resp.json()
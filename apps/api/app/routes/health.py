@@ -2,7 +2,7 @@
 
 import os
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 
 router = APIRouter(tags=["health"])
 
@@ -24,13 +24,14 @@ async def health_check() -> dict:
 @router.get("/health/ready")
 async def readiness_check() -> dict:
     """Check if all services are ready (including Firestore)."""
-    from app.lib.firebase import get_firestore_client
+    from app.lib.firebase import get_async_firestore_client
 
     firestore_status = "ok"
     firestore_error = None
     try:
-        db = get_firestore_client()
-        list(db.collections())
+        db = get_async_firestore_client()
+        async for _ in db.collections():
+            break
     except Exception as e:
         firestore_status = "error"
         firestore_error = str(e)
@@ -52,3 +53,31 @@ async def readiness_check() -> dict:
         }
 
     return result
+
+
+@router.get("/health/metrics")
+async def metrics() -> dict:
+    """Return in-process cache and pool counters for this instance.
+
+    Unauthenticated, so only served with METRICS_ENABLED; 404 otherwise.
+    """
+    from app.lib.config import get_settings
+    from app.lib.http import get_http_metrics
+    from app.lib.keyring import get_keyring
+    from app.lib.profile_cache import get_profile_cache
+    from app.lib.token_cache import get_token_cache
+    from app.realtime.manager import get_connection_manager
+    from app.repositories.singleflight import get_single_flight
+    from app.tasks.engine import get_task_engine
+
+    if not get_settings().metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return {
+        "token_cache": get_token_cache().stats(),
+        "profile_cache": get_profile_cache().stats(),
+        "firestore_reads": get_single_flight().stats(),
+        "keyring": get_keyring().stats(),
+        "http": get_http_metrics(),
+        "websocket": get_connection_manager().stats(),
+        "tasks": get_task_engine().stats(),
+    }
@@ -1,19 +1,37 @@
 """API routes for encrypted credential (API key) management."""
 
+import logging
 import uuid
+from collections.abc import AsyncIterator
 
-from fastapi import APIRouter, HTTPException, status
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from google.api_core.exceptions import FailedPrecondition, GoogleAPICallError
+from pydantic import BaseModel, Field
 
 from app.lib.config import get_settings
-from app.lib.crypto import encrypt, mask_key
-from app.lib.firebase import get_firestore_client
+from app.lib.crypto import mask_key
+from app.lib.firebase import get_async_firestore_client
+from app.lib.keyring import get_keyring
 from app.middleware.auth import CurrentUser
-from app.models.credential import CredentialDocument
-from app.repositories.credential import CredentialRepository
+from app.models.credential import CredentialDocument, CredentialSummary
+from app.repositories.credential import AsyncCredentialRepository
+from app.repositories.pagination import MAX_PAGE_SIZE, InvalidPageTokenError
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["keys"])
 
+# Most credentials accepted by one batch request
+MAX_BATCH_ITEMS = 1000
+
+MIN_KEY_LENGTH = 8
+
+NEXT_PAGE_TOKEN_HEADER = "X-Next-Page-Token"
+
+# Page size used when walking every credential for a full or streamed listing
+_LIST_ALL_PAGE_SIZE = 100
+
 
 # ---------------------------------------------------------------------------
 # Request / Response schemas
@@ -40,6 +58,35 @@ class KeyResponse(BaseModel):
     updated_at: str
 
 
+class BatchCreateKeysRequest(BaseModel):
+    keys: list[CreateKeyRequest] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+
+class BatchCreateResult(BaseModel):
+    index: int
+    status: int
+    key: KeyResponse | None = None
+    error: str | None = None
+
+
+class BatchCreateKeysResponse(BaseModel):
+    results: list[BatchCreateResult]
+
+
+class BatchDeleteKeysRequest(BaseModel):
+    ids: list[str] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+
+class BatchDeleteResult(BaseModel):
+    id: str
+    status: int
+    error: str | None = None
+
+
+class BatchDeleteKeysResponse(BaseModel):
+    results: list[BatchDeleteResult]
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
@@ -54,8 +101,8 @@ def _ensure_encryption_configured() -> None:
         )
 
 
-def _to_response(doc: CredentialDocument) -> KeyResponse:
-    """Convert a CredentialDocument to the API response model."""
+def _to_response(doc: CredentialSummary) -> KeyResponse:
+    """Convert a credential (summary or full document) to the API response model."""
     return KeyResponse(
         id=doc.id,
         provider=doc.provider,
@@ -70,9 +117,21 @@ def _to_response(doc: CredentialDocument) -> KeyResponse:
     )
 
 
-def _get_repo(user_uid: str) -> CredentialRepository:
-    db = get_firestore_client()
-    return CredentialRepository(db, user_uid)
+def _get_repo(user_uid: str) -> AsyncCredentialRepository:
+    db = get_async_firestore_client()
+    return AsyncCredentialRepository(db, user_uid)
+
+
+async def _stream_key_array(repo: AsyncCredentialRepository) -> AsyncIterator[bytes]:
+    """Serialize every credential as a JSON array, one element at a time."""
+    yield b"["
+    first = True
+    async for doc in repo.iter_summaries(_LIST_ALL_PAGE_SIZE):
+        if not first:
+            yield b","
+        first = False
+        yield _to_response(doc).model_dump_json().encode()
+    yield b"]"
 
 
 # ---------------------------------------------------------------------------
@@ -85,13 +144,13 @@ async def create_key(body: CreateKeyRequest, current_user: CurrentUser) -> KeyRe
     """Create a new encrypted API key credential."""
     _ensure_encryption_configured()
 
-    if not body.key or len(body.key) < 8:
+    if not body.key or len(body.key) < MIN_KEY_LENGTH:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail="API key must be at least 8 characters",
         )
 
-    encrypted = encrypt(body.key)
+    encrypted = await get_keyring().encrypt(current_user.uid, body.key)
     suffix = mask_key(body.key)
     doc_id = str(uuid.uuid4())
 
@@ -103,23 +162,49 @@ async def create_key(body: CreateKeyRequest, current_user: CurrentUser) -> KeyRe
     )
 
     repo = _get_repo(current_user.uid)
-    created = repo.create(doc_id, doc)
+    created = await repo.create(doc_id, doc)
     return _to_response(created)
 
 
-@router.get("/keys")
-async def list_keys(current_user: CurrentUser) -> list[KeyResponse]:
-    """List all credentials for the authenticated user (masked, never decrypted)."""
+@router.get("/keys", response_model=list[KeyResponse])
+async def list_keys(
+    current_user: CurrentUser,
+    response: Response,
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    page_token: str | None = None,
+    stream: bool = False,
+) -> list[KeyResponse] | StreamingResponse:
+    """List credentials for the authenticated user (masked, never decrypted).
+
+    Without `limit` or `page_token` every credential is returned. With them,
+    one page is returned and the token for the next page, if any, is sent in
+    the X-Next-Page-Token header. `stream=true` returns every credential as a
+    JSON array written incrementally instead of built in memory.
+    """
     repo = _get_repo(current_user.uid)
-    docs = repo.list()
-    return [_to_response(doc) for doc in docs]
+
+    if stream:
+        return StreamingResponse(_stream_key_array(repo), media_type="application/json")
+
+    if limit is None and page_token is None:
+        return [_to_response(doc) async for doc in repo.iter_summaries(_LIST_ALL_PAGE_SIZE)]
+
+    try:
+        page = await repo.list_summary_page(limit or _LIST_ALL_PAGE_SIZE, page_token)
+    except InvalidPageTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid page token"
+        ) from None
+    if page.next_page_token:
+        response.headers[NEXT_PAGE_TOKEN_HEADER] = page.next_page_token
+    return [_to_response(doc) for doc in page.items]
 
 
 @router.get("/keys/{key_id}")
 async def get_key(key_id: str, current_user: CurrentUser) -> KeyResponse:
     """Get a single credential by ID (masked)."""
     repo = _get_repo(current_user.uid)
-    doc = repo.get(key_id)
+    doc = await repo.get_summary(key_id)
     if not doc:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Credential not found")
     return _to_response(doc)
@@ -129,7 +214,7 @@ async def get_key(key_id: str, current_user: CurrentUser) -> KeyResponse:
 async def update_key(key_id: str, body: UpdateKeyRequest, current_user: CurrentUser) -> KeyResponse:
     """Update a credential's name and/or re-encrypt its key."""
     repo = _get_repo(current_user.uid)
-    existing = repo.get(key_id)
+    existing = await repo.get_summary(key_id)
     if not existing:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Credential not found")
 
@@ -140,15 +225,20 @@ async def update_key(key_id: str, body: UpdateKeyRequest, current_user: CurrentU
 
     if body.key is not None:
         _ensure_encryption_configured()
-        if len(body.key) < 8:
+        if len(body.key) < MIN_KEY_LENGTH:
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail="API key must be at least 8 characters",
             )
-        update_data["encrypted_key"] = encrypt(body.key)
+        update_data["encrypted_key"] = await get_keyring().encrypt(current_user.uid, body.key)
         update_data["key_suffix"] = mask_key(body.key)
 
-    updated = repo.update(key_id, update_data)
+    try:
+        updated = await repo.update(key_id, update_data, current=existing)
+    except FailedPrecondition:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Credential was modified concurrently"
+        ) from None
     if not updated:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Credential not found")
     return _to_response(updated)
@@ -158,10 +248,98 @@ async def update_key(key_id: str, body: UpdateKeyRequest, current_user: CurrentU
 async def delete_key(key_id: str, current_user: CurrentUser) -> None:
     """Delete a credential. Overwrites the encrypted blob before removal."""
     repo = _get_repo(current_user.uid)
-    existing = repo.get(key_id)
-    if not existing:
+    # Overwrite the encrypted key, then delete (a missing key costs one round trip)
+    deleted = await repo.scrub_and_delete(key_id)
+    if not deleted:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Credential not found")
 
-    # Overwrite the encrypted key before deletion
-    repo.update(key_id, {"encrypted_key": ""})
-    repo.delete(key_id)
+
+@router.post("/keys:batch")
+async def batch_create_keys(
+    body: BatchCreateKeysRequest, current_user: CurrentUser
+) -> BatchCreateKeysResponse:
+    """Create up to MAX_BATCH_ITEMS credentials in a few batched commits.
+
+    Each item gets its own result: 201 with the created key, or an error
+    status. Invalid items are reported without failing the rest.
+    """
+    _ensure_encryption_configured()
+
+    results: list[BatchCreateResult | None] = [None] * len(body.keys)
+    valid: list[int] = []
+    for index, item in enumerate(body.keys):
+        if len(item.key) < MIN_KEY_LENGTH:
+            results[index] = BatchCreateResult(
+                index=index,
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                error=f"API key must be at least {MIN_KEY_LENGTH} characters",
+            )
+        else:
+            valid.append(index)
+
+    # Seal the whole batch with the user's data key, off the event loop
+    plaintexts = [body.keys[i].key for i in valid]
+    encrypted_keys = await get_keyring().encrypt_many(current_user.uid, plaintexts)
+    sealed = zip(encrypted_keys, map(mask_key, plaintexts), strict=True)
+    docs = [
+        (
+            str(uuid.uuid4()),
+            CredentialDocument(
+                provider=body.keys[index].provider,
+                name=body.keys[index].name,
+                encrypted_key=encrypted,
+                key_suffix=suffix,
+            ),
+        )
+        for index, (encrypted, suffix) in zip(valid, sealed, strict=True)
+    ]
+
+    repo = _get_repo(current_user.uid)
+    created = await repo.create_many(docs) if docs else []
+    for index, outcome in zip(valid, created, strict=True):
+        if isinstance(outcome, GoogleAPICallError):
+            logger.error("Batch credential write failed: %s", outcome)
+            results[index] = BatchCreateResult(
+                index=index,
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                error="Failed to store credential",
+            )
+        else:
+            results[index] = BatchCreateResult(
+                index=index, status=status.HTTP_201_CREATED, key=_to_response(outcome)
+            )
+
+    return BatchCreateKeysResponse(results=[r for r in results if r is not None])
+
+
+@router.delete("/keys:batch")
+async def batch_delete_keys(
+    body: BatchDeleteKeysRequest, current_user: CurrentUser
+) -> BatchDeleteKeysResponse:
+    """Delete up to MAX_BATCH_ITEMS credentials, scrubbing each encrypted blob first.
+
+    Each id gets its own result: 204 if deleted, 404 if it did not exist.
+    """
+    repo = _get_repo(current_user.uid)
+    outcomes = await repo.scrub_and_delete_many(body.ids)
+
+    results: list[BatchDeleteResult] = []
+    for key_id, outcome in zip(body.ids, outcomes, strict=True):
+        if isinstance(outcome, GoogleAPICallError):
+            logger.error("Batch credential delete failed: %s", outcome)
+            results.append(
+                BatchDeleteResult(
+                    id=key_id,
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    error="Failed to delete credential",
+                )
+            )
+        elif outcome:
+            results.append(BatchDeleteResult(id=key_id, status=status.HTTP_204_NO_CONTENT))
+        else:
+            results.append(
+                BatchDeleteResult(
+                    id=key_id, status=status.HTTP_404_NOT_FOUND, error="Credential not found"
+                )
+            )
+    return BatchDeleteKeysResponse(results=results)
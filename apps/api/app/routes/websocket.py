@@ -1,56 +1,177 @@
 """WebSocket endpoint for real-time communication."""
 
 import asyncio
+import time
 from typing import Any
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
 
-router = APIRouter(tags=["websocket"])
-
-
-class ConnectionManager:
-    """Manage WebSocket connections."""
-
-    def __init__(self) -> None:
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket) -> None:
-        """Accept and track a new connection."""
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket) -> None:
-        """Remove a connection from tracking."""
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: dict[str, Any]) -> None:
-        """Send a message to all connected clients."""
-        for connection in self.active_connections:
-            await connection.send_json(message)
+from app.lib.encoding import loads, msgpack_available, unpackb
+from app.lib.token_cache import get_token_cache, peek_claims
+from app.middleware.auth import AuthUser, authenticate
+from app.realtime.connection import Connection
+from app.realtime.manager import (
+    JSON_SUBPROTOCOL,
+    MSGPACK_SUBPROTOCOL,
+    ConnectionManager,
+    get_connection_manager,
+)
+from app.realtime.topics import can_subscribe, user_topic
 
+router = APIRouter(tags=["websocket"])
 
-manager = ConnectionManager()
+# Subprotocol prefix carrying the ID token, for clients that cannot set handshake headers
+BEARER_SUBPROTOCOL_PREFIX = "bearer."
+
+# Open connections on this instance and the tokens they were opened with
+_sessions: dict[Connection, str] = {}
+
+
+def _bearer_token(websocket: WebSocket) -> str | None:
+    """Token from the Authorization header, or from a `bearer.<token>` subprotocol
+    for clients that cannot set headers on a websocket handshake."""
+    scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token
+    for offered in websocket.scope.get("subprotocols", []):
+        if offered.startswith(BEARER_SUBPROTOCOL_PREFIX):
+            return offered.removeprefix(BEARER_SUBPROTOCOL_PREFIX) or None
+    return None
+
+
+def _subprotocol(websocket: WebSocket) -> str | None:
+    """MessagePack if the client offers it and it is installed; otherwise JSON.
+
+    The token subprotocol is never selected, so the token is not echoed back.
+    """
+    offered = websocket.scope.get("subprotocols", [])
+    if MSGPACK_SUBPROTOCOL in offered and msgpack_available():
+        return MSGPACK_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON_SUBPROTOCOL
+    return None
+
+
+def _claims(user: AuthUser, token: str) -> dict[str, Any]:
+    # The token was verified on connect, so its unverified payload can be trusted
+    return {**peek_claims(token), "uid": user.uid}
+
+
+def close_revoked(revocation: Any) -> None:
+    """Close connections whose token has been revoked.
+
+    Listens to token revocations from every instance, after the token cache
+    has applied them (see VerifiedTokenCache.apply_revocation).
+    """
+    cache = get_token_cache()
+    for connection, token in list(_sessions.items()):
+        if connection.user is not None and cache.is_revoked(token, _claims(connection.user, token)):
+            connection.close_soon(status.WS_1008_POLICY_VIOLATION)
+
+
+async def _receive(websocket: WebSocket, binary: bool) -> Any:
+    """Receive one message: JSON in text or binary frames, or MessagePack on binary
+    connections."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    if message.get("bytes") is not None:
+        return unpackb(message["bytes"]) if binary else loads(message["bytes"])
+    return loads(message["text"])
+
+
+def _requested_topics(data: dict[str, Any]) -> list[str]:
+    topics = data.get("topics", [])
+    if not isinstance(topics, list):
+        return []
+    return [t for t in topics if isinstance(t, str)]
+
+
+def _resume_points(data: dict[str, Any]) -> dict[str, int]:
+    """Last sequence number seen per topic, from the optional `resume_from` map."""
+    points = data.get("resume_from")
+    if not isinstance(points, dict):
+        return {}
+    return {
+        topic: seq
+        for topic, seq in points.items()
+        if isinstance(seq, int) and not isinstance(seq, bool) and seq >= 0
+    }
+
+
+async def _subscribe(
+    manager: ConnectionManager, connection: Connection, user: AuthUser, data: dict[str, Any]
+) -> dict[str, Any]:
+    resume = _resume_points(data)
+    accepted, rejected = [], []
+    for topic in _requested_topics(data):
+        if not await can_subscribe(user, topic):
+            ok = False
+        elif topic in resume:
+            ok = await manager.subscribe_resuming(connection, topic, resume[topic])
+        else:
+            ok = manager.subscribe(connection, topic)
+        (accepted if ok else rejected).append(topic)
+    return {"type": "subscribed", "topics": accepted, "rejected": rejected}
 
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket) -> None:
-    """WebSocket endpoint with heartbeat support."""
-    await manager.connect(websocket)
+    """Authenticated WebSocket endpoint with topic subscriptions.
+
+    Heartbeats and idle timeouts are handled by the manager's HeartbeatScheduler.
+    The connection is closed when its token expires or is revoked.
+    """
+    token = _bearer_token(websocket)
+    try:
+        user = await authenticate(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    manager = get_connection_manager()
+    connection = await manager.connect(websocket, user, _subprotocol(websocket))
+    expiry = None
+    if token is not None:
+        _sessions[connection] = token
+        exp = _claims(user, token).get("exp")
+        if isinstance(exp, int | float):
+            expiry = asyncio.get_running_loop().call_later(
+                max(exp - time.time(), 0.0),
+                connection.close_soon,
+                status.WS_1008_POLICY_VIOLATION,
+            )
+    manager.subscribe(connection, user_topic(user.uid))
     try:
         while True:
-            try:
-                data = await asyncio.wait_for(websocket.receive_json(), timeout=30.0)
-
-                # Handle ping/pong heartbeat
-                if data.get("type") == "ping":
-                    await websocket.send_json({"type": "pong"})
-                else:
-                    # Echo back for now - will be extended for agent communication
-                    await websocket.send_json({"type": "ack", "data": data})
-
-            except TimeoutError:
-                # Send heartbeat on timeout
-                await websocket.send_json({"type": "heartbeat"})
+            data = await _receive(websocket, connection.binary)
+            manager.seen(connection)
+            if not isinstance(data, dict):
+                data = {"data": data}
+            kind = data.get("type")
+
+            # Handle ping/pong heartbeat
+            if kind == "ping":
+                connection.send({"type": "pong"})
+            elif kind == "subscribe":
+                connection.send(await _subscribe(manager, connection, user, data))
+            elif kind == "state_ack":
+                topic, entity, version = data.get("topic"), data.get("entity"), data.get("version")
+                if isinstance(topic, str) and isinstance(entity, str) and isinstance(version, int):
+                    manager.ack_state(connection, topic, entity, version)
+            elif kind == "unsubscribe":
+                topics = _requested_topics(data)
+                for topic in topics:
+                    manager.unsubscribe(connection, topic)
+                connection.send({"type": "unsubscribed", "topics": topics})
+            else:
+                # Echo back for now - will be extended for agent communication
+                connection.send({"type": "ack", "data": data})
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        if expiry is not None:
+            expiry.cancel()
+        _sessions.pop(connection, None)
+        await manager.disconnect(websocket)
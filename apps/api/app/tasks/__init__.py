@@ -0,0 +1 @@
+"""In-process execution of agent tasks (see app.tasks.engine)."""
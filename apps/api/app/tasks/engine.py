@@ -0,0 +1,468 @@
+"""Run agent tasks in-process with priorities and concurrency limits.
+
+A task is an async function taking a TaskContext. Submitted tasks wait in a
+priority queue (higher priority first, then submission order) and at most
+`max_workers` run at once. A task also needs a free slot for its team
+member and for its provider; one that does not get them waits on that
+member or provider, out of the main queue, until a running task releases
+a slot, so it never holds up tasks behind it.
+
+Status changes follow the transitions in app.tasks.status and are
+published as entity state on the task's websocket topic (see
+ConnectionManager.update_state), with fields named as in the shared Task
+schema. Every update carries the task's full state, so an instance that
+starts holding the topic late still sends subscribers complete snapshots;
+a client subscribing on the instance running the task gets a snapshot
+straight away, even if the task's state has not changed since.
+
+Pause and cancel are cooperative for running tasks: they take effect when
+the task next calls `TaskContext.checkpoint()`. A task paused at a
+checkpoint gives up its slots until it is resumed and scheduled again.
+Pending and paused tasks are paused or cancelled immediately.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import uuid
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any
+
+from app.lib.config import get_settings
+from app.realtime.topics import task_topic
+from app.tasks.status import TaskStatus, check_transition
+
+if TYPE_CHECKING:
+    from app.realtime.manager import ConnectionManager
+
+logger = logging.getLogger(__name__)
+
+TaskFunction = Callable[["TaskContext"], Awaitable[Any]]
+
+# (-priority, entry number, run); the entry number breaks ties in submission order
+_Entry = tuple[int, int, "TaskRun"]
+
+
+class TaskCancelledError(Exception):
+    """Raised from TaskContext.checkpoint() in a task that has been cancelled.
+
+    Let it propagate; the task is then recorded as cancelled.
+    """
+
+
+class TaskRun:
+    """A submitted task: what to run, where it is scheduled and how it ended."""
+
+    def __init__(
+        self,
+        fn: TaskFunction,
+        task_id: str,
+        name: str,
+        team_member_id: str,
+        provider: str,
+        priority: int = 0,
+        metadata: dict[str, Any] | None = None,
+        owner: str | None = None,
+    ) -> None:
+        self.fn = fn
+        self.id = task_id
+        self.name = name
+        self.team_member_id = team_member_id
+        self.provider = provider
+        self.priority = priority
+        self.metadata = metadata
+        # UID of the user who may follow the task on its websocket topic
+        self.owner = owner
+        self.status = TaskStatus.PENDING
+        self.created_at = self.updated_at = datetime.now(UTC)
+        self.started_at: datetime | None = None
+        self.completed_at: datetime | None = None
+        self.result: Any = None
+        self.error: str | None = None
+        # Number of this run's live queue entry; 0 while it is not queued
+        self._entry = 0
+        self._holding = False
+        self._pause_requested = False
+        self._cancel_requested = False
+        # While a started task is paused at a checkpoint: resolved when it may continue
+        self._wakeup: asyncio.Future[None] | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._done = asyncio.Event()
+        # Every field published so far, merged
+        self._published: dict[str, Any] = {}
+
+    async def wait(self) -> TaskStatus:
+        """Wait until the task has completed, failed or been cancelled."""
+        await self._done.wait()
+        return self.status
+
+    def state(self) -> dict[str, Any]:
+        """The fields published for this task, named as in the shared Task schema."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status.value,
+            "teamMemberId": self.team_member_id,
+            "provider": self.provider,
+            "priority": self.priority,
+            "createdAt": self.created_at.isoformat(),
+            "updatedAt": self.updated_at.isoformat(),
+            "metadata": self.metadata,
+        }
+
+
+class TaskContext:
+    """Handed to a running task to check for pause/cancel and report progress."""
+
+    def __init__(self, engine: "TaskEngine", run: TaskRun) -> None:
+        self.engine = engine
+        self.run = run
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the task has been asked to stop."""
+        return self.run._cancel_requested
+
+    async def checkpoint(self) -> None:
+        """Let other tasks run, then raise TaskCancelledError if this task was
+        cancelled, or wait here while it is paused."""
+        await self.engine._checkpoint(self.run)
+
+    def progress(self, **fields: Any) -> None:
+        """Publish extra state fields for the task, e.g. progress=0.5."""
+        self.engine._publish(self.run, fields)
+
+
+class TaskEngine:
+    """Schedule submitted tasks onto a bounded number of concurrent workers.
+
+    `member_limit` and `provider_limit` cap how many tasks of one team
+    member or one provider run at once; `provider_limits` overrides the cap
+    for named providers. A limit of 0 means no limit. Status changes are
+    sent through `manager`, if given.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 32,
+        member_limit: int = 4,
+        provider_limit: int = 16,
+        provider_limits: dict[str, int] | None = None,
+        manager: "ConnectionManager | None" = None,
+    ) -> None:
+        self.max_workers = max_workers
+        self.member_limit = member_limit
+        self.provider_limit = provider_limit
+        self.provider_limits = provider_limits or {}
+        self.manager = manager
+        # Unfinished tasks by id
+        self.runs: dict[str, TaskRun] = {}
+        self.running = 0
+        self._ready: list[_Entry] = []
+        # Tasks held back by a member or provider limit, keyed ("member", id) or ("provider", name)
+        self._waiting: dict[tuple[str, str], list[_Entry]] = {}
+        self._entries = itertools.count(1)
+        self._members: dict[str, int] = {}
+        self._providers: dict[str, int] = {}
+        self._closed = False
+        self.submitted = 0
+        self._finished: Counter[TaskStatus] = Counter()
+        if manager is not None:
+            manager.add_state_source("task", self._live_state)
+
+    def submit(
+        self,
+        fn: TaskFunction,
+        *,
+        name: str,
+        team_member_id: str,
+        provider: str,
+        priority: int = 0,
+        task_id: str | None = None,
+        metadata: dict[str, Any] | None = None,
+        owner: str | None = None,
+    ) -> TaskRun:
+        """Queue a task and return its run; it starts as soon as it is scheduled.
+
+        Only the `owner` (a user's UID) may subscribe to the task's topic, on any
+        instance and after the task has finished; a task id first claimed by
+        another user stays theirs.
+        """
+        if self._closed:
+            raise RuntimeError("Task engine is closed")
+        run = TaskRun(
+            fn,
+            task_id or str(uuid.uuid4()),
+            name,
+            team_member_id,
+            provider,
+            priority=priority,
+            metadata=metadata,
+            owner=owner,
+        )
+        if run.id in self.runs:
+            raise ValueError(f"Task {run.id} is already scheduled")
+        self.runs[run.id] = run
+        self.submitted += 1
+        if self.manager is not None:
+            if owner is not None:
+                self.manager.claim(task_topic(run.id), owner)
+            self._publish(run, run.state())
+        self._enqueue(run)
+        self._dispatch()
+        return run
+
+    def _live_state(self, task_id: str) -> dict[str, dict[str, Any]]:
+        # Lets a new subscriber see a task that has not changed since it subscribed
+        run = self.runs.get(task_id)
+        return {run.id: dict(run._published)} if run is not None and run._published else {}
+
+    def get(self, task_id: str) -> TaskRun | None:
+        """An unfinished task by id."""
+        return self.runs.get(task_id)
+
+    def _get(self, task_id: str) -> TaskRun:
+        run = self.runs.get(task_id)
+        if run is None:
+            raise KeyError(f"No unfinished task {task_id}")
+        return run
+
+    def pause(self, task_id: str) -> None:
+        """Pause a pending task now, or a running one at its next checkpoint."""
+        run = self._get(task_id)
+        if run.status is TaskStatus.RUNNING:
+            run._pause_requested = True
+            return
+        self._transition(run, TaskStatus.PAUSED)
+        run._entry = 0
+
+    def resume(self, task_id: str) -> None:
+        """Queue a paused task again, or withdraw a pause not yet taken."""
+        run = self._get(task_id)
+        if run.status is TaskStatus.RUNNING and run._pause_requested:
+            run._pause_requested = False
+            return
+        self._transition(run, TaskStatus.PENDING)
+        self._enqueue(run)
+        self._dispatch()
+
+    def cancel(self, task_id: str) -> None:
+        """Cancel a pending or paused task now, or a running one at its next checkpoint."""
+        run = self._get(task_id)
+        if run.status is TaskStatus.RUNNING:
+            run._cancel_requested = True
+            return
+        self._transition(run, TaskStatus.CANCELLED)
+        run._entry = 0
+        if run._wakeup is not None:
+            # Started before: unwind it from the checkpoint it is paused at
+            wakeup, run._wakeup = run._wakeup, None
+            wakeup.set_exception(TaskCancelledError(run.id))
+
+    def _enqueue(self, run: TaskRun) -> None:
+        run._entry = next(self._entries)
+        heapq.heappush(self._ready, (-run.priority, run._entry, run))
+
+    def _blocked_on(self, run: TaskRun) -> tuple[str, str] | None:
+        if self.member_limit and self._members.get(run.team_member_id, 0) >= self.member_limit:
+            return ("member", run.team_member_id)
+        limit = self.provider_limits.get(run.provider, self.provider_limit)
+        if limit and self._providers.get(run.provider, 0) >= limit:
+            return ("provider", run.provider)
+        return None
+
+    def _take(self) -> TaskRun | None:
+        """Pop the most urgent task whose member and provider have a free slot."""
+        while self._ready:
+            entry = heapq.heappop(self._ready)
+            run = entry[2]
+            if entry[1] != run._entry:
+                # Paused or cancelled since it was queued
+                continue
+            blocked = self._blocked_on(run)
+            if blocked is not None:
+                heapq.heappush(self._waiting.setdefault(blocked, []), entry)
+                continue
+            run._entry = 0
+            return run
+        return None
+
+    def _dispatch(self) -> None:
+        """Start queued tasks while there are free workers."""
+        while not self._closed and self.running < self.max_workers:
+            run = self._take()
+            if run is None:
+                return
+            self._acquire(run)
+            self._transition(run, TaskStatus.RUNNING)
+            if run._wakeup is not None:
+                wakeup, run._wakeup = run._wakeup, None
+                wakeup.set_result(None)
+            else:
+                run._task = asyncio.get_running_loop().create_task(
+                    self._execute(run), name=f"task-{run.id}"
+                )
+
+    def _acquire(self, run: TaskRun) -> None:
+        run._holding = True
+        self.running += 1
+        self._members[run.team_member_id] = self._members.get(run.team_member_id, 0) + 1
+        self._providers[run.provider] = self._providers.get(run.provider, 0) + 1
+
+    def _release(self, run: TaskRun) -> None:
+        """Free the task's slots and requeue the next task waiting on each of them."""
+        run._holding = False
+        self.running -= 1
+        for counts, key in (
+            (self._members, run.team_member_id),
+            (self._providers, run.provider),
+        ):
+            counts[key] -= 1
+            if not counts[key]:
+                del counts[key]
+        for key in (("member", run.team_member_id), ("provider", run.provider)):
+            waiting = self._waiting.get(key)
+            while waiting:
+                entry = heapq.heappop(waiting)
+                if entry[1] == entry[2]._entry:
+                    heapq.heappush(self._ready, entry)
+                    break
+            if not waiting:
+                self._waiting.pop(key, None)
+
+    def _transition(self, run: TaskRun, target: TaskStatus) -> None:
+        check_transition(run.status, target)
+        now = datetime.now(UTC)
+        run.status = target
+        run.updated_at = now
+        started = target is TaskStatus.RUNNING and run.started_at is None
+        if started:
+            run.started_at = now
+        elif target.final:
+            run.completed_at = now
+            self.runs.pop(run.id, None)
+            self._finished[target] += 1
+            run._done.set()
+        if self.manager is None:
+            return
+        # Timestamps are formatted only when there is somewhere to send them
+        stamp = now.isoformat()
+        fields: dict[str, Any] = {"status": target.value, "updatedAt": stamp}
+        if started:
+            fields["startedAt"] = stamp
+        elif target.final:
+            fields["completedAt"] = stamp
+            if run.error is not None:
+                fields["error"] = run.error
+        self._publish(run, fields)
+
+    def _publish(self, run: TaskRun, fields: dict[str, Any]) -> None:
+        if self.manager is not None:
+            run._published.update(fields)
+            # The coalescer copies what it buffers
+            self.manager.update_state(task_topic(run.id), run.id, run._published)
+
+    async def _checkpoint(self, run: TaskRun) -> None:
+        await asyncio.sleep(0)
+        if run._cancel_requested:
+            raise TaskCancelledError(run.id)
+        if not run._pause_requested:
+            return
+        run._pause_requested = False
+        self._release(run)
+        self._transition(run, TaskStatus.PAUSED)
+        run._wakeup = asyncio.get_running_loop().create_future()
+        self._dispatch()
+        await run._wakeup
+        if run._cancel_requested:
+            raise TaskCancelledError(run.id)
+
+    async def _execute(self, run: TaskRun) -> None:
+        try:
+            run.result = await run.fn(TaskContext(self, run))
+            status = TaskStatus.COMPLETED
+        except TaskCancelledError:
+            status = TaskStatus.CANCELLED
+        except asyncio.CancelledError:
+            # Engine shutting down
+            self._end(run, TaskStatus.CANCELLED)
+            raise
+        except Exception as e:
+            logger.exception("Task %s failed", run.id)
+            run.error = str(e) or type(e).__name__
+            status = TaskStatus.FAILED
+        self._end(run, status)
+
+    def _end(self, run: TaskRun, status: TaskStatus) -> None:
+        if run._holding:
+            self._release(run)
+        # A task cancelled while paused is already final
+        if not run.status.final:
+            self._transition(run, status)
+        self._dispatch()
+
+    def stats(self) -> dict[str, Any]:
+        """Return queue and outcome counters for the metrics endpoint."""
+        statuses = Counter(run.status for run in self.runs.values())
+        return {
+            "submitted": self.submitted,
+            "pending": statuses[TaskStatus.PENDING],
+            "running": self.running,
+            "paused": statuses[TaskStatus.PAUSED],
+            "waiting_on_limits": sum(len(w) for w in self._waiting.values()),
+            "completed": self._finished[TaskStatus.COMPLETED],
+            "failed": self._finished[TaskStatus.FAILED],
+            "cancelled": self._finished[TaskStatus.CANCELLED],
+            "max_workers": self.max_workers,
+        }
+
+    async def aclose(self) -> None:
+        """Cancel every unfinished task and wait for running ones to unwind.
+
+        Tasks submitted afterwards run as usual, e.g. in the next app lifespan.
+        """
+        self._closed = True
+        tasks = []
+        for run in list(self.runs.values()):
+            if run._task is None:
+                self._transition(run, TaskStatus.CANCELLED)
+            else:
+                run._task.cancel()
+                tasks.append(run._task)
+        with contextlib.suppress(asyncio.CancelledError):
+            await asyncio.gather(*tasks, return_exceptions=True)
+        # Tasks cancelled before their first step never reached _execute
+        for run in list(self.runs.values()):
+            self._end(run, TaskStatus.CANCELLED)
+        self._ready.clear()
+        self._waiting.clear()
+        self._closed = False
+
+
+def parse_limits(value: str) -> dict[str, int]:
+    """Parse "name:limit" pairs separated by commas, e.g. "anthropic:8,openai:16"."""
+    limits: dict[str, int] = {}
+    for entry in filter(None, (e.strip() for e in value.split(","))):
+        name, _, limit = entry.partition(":")
+        limits[name.strip()] = int(limit)
+    return limits
+
+
+@lru_cache
+def get_task_engine() -> TaskEngine:
+    """Get the process-wide task engine, publishing through the connection manager."""
+    from app.realtime.manager import get_connection_manager
+
+    s = get_settings()
+    return TaskEngine(
+        max_workers=s.tasks_max_workers,
+        member_limit=s.tasks_max_per_member,
+        provider_limit=s.tasks_max_per_provider,
+        provider_limits=parse_limits(s.tasks_provider_limits),
+        manager=get_connection_manager(),
+    )
@@ -0,0 +1,60 @@
+"""Task lifecycle states and the transitions allowed between them.
+
+The values match TaskStatus in packages/shared (schemas.py and enums.ts),
+which is not installed alongside the API.
+
+    pending -> running -> completed | failed
+       |  ^       |
+       v  |       v
+      paused <----+          any non-final state -> cancelled
+
+A paused task is resumed by returning it to pending; it runs again once
+the scheduler has a slot for it.
+"""
+
+from enum import StrEnum
+
+
+class TaskStatus(StrEnum):
+    """Task execution status."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    PAUSED = "paused"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    @property
+    def final(self) -> bool:
+        """Whether the task has finished and can change no further."""
+        return not TRANSITIONS[self]
+
+
+TRANSITIONS: dict[TaskStatus, frozenset[TaskStatus]] = {
+    TaskStatus.PENDING: frozenset(
+        {TaskStatus.RUNNING, TaskStatus.PAUSED, TaskStatus.CANCELLED},
+    ),
+    TaskStatus.RUNNING: frozenset(
+        {TaskStatus.PAUSED, TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED},
+    ),
+    TaskStatus.PAUSED: frozenset({TaskStatus.PENDING, TaskStatus.CANCELLED}),
+    TaskStatus.COMPLETED: frozenset(),
+    TaskStatus.FAILED: frozenset(),
+    TaskStatus.CANCELLED: frozenset(),
+}
+
+
+class InvalidTransitionError(ValueError):
+    """Raised when a task is moved to a status it cannot reach from its current one."""
+
+    def __init__(self, current: TaskStatus, target: TaskStatus) -> None:
+        super().__init__(f"Task cannot go from {current.value} to {target.value}")
+        self.current = current
+        self.target = target
+
+
+def check_transition(current: TaskStatus, target: TaskStatus) -> None:
+    """Raise InvalidTransitionError unless `current` may move to `target`."""
+    if target not in TRANSITIONS[current]:
+        raise InvalidTransitionError(current, target)
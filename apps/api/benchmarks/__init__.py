@@ -0,0 +1,4 @@
+"""Micro-benchmarks for hot paths. Run a module with `python -m benchmarks.<name>`.
+
+Benchmarks only use in-process stand-ins or the local Firebase emulator.
+"""
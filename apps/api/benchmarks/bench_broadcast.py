@@ -0,0 +1,93 @@
+"""Measure broadcast latency to many websocket clients when a few are slow.
+
+Compares the previous broadcast, which awaited each client's send in turn,
+with per-connection send queues. Reports how long broadcast() blocks the
+caller and how long until every fast client has received the message.
+Clients are in-memory fakes; a send to a slow client takes --slow-delay seconds.
+
+Usage: python -m benchmarks.bench_broadcast [--clients N] [--slow K] [--slow-delay S]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from starlette.websockets import WebSocketState
+
+from app.realtime.manager import ConnectionManager
+
+
+class _FakeWebSocket:
+    def __init__(self, delay: float, received: asyncio.Event | None) -> None:
+        self.application_state = WebSocketState.CONNECTED
+        self.delay = delay
+        self.received = received
+
+    async def accept(self, subprotocol: str | None = None) -> None:
+        pass
+
+    async def send_text(self, message: str) -> None:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            await asyncio.sleep(0)
+        if self.received is not None:
+            self.received.set()
+
+    async def close(self, code: int = 1000) -> None:
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+def _clients(n: int, slow: int, delay: float) -> tuple[list[_FakeWebSocket], list[asyncio.Event]]:
+    events = [asyncio.Event() for _ in range(n - slow)]
+    fast = [_FakeWebSocket(0.0, event) for event in events]
+    # Spread slow clients through the list so the sequential broadcast hits them early
+    sockets: list[_FakeWebSocket] = [_FakeWebSocket(delay, None) for _ in range(slow)]
+    step = max(1, len(fast) // max(1, slow))
+    for i, ws in enumerate(fast):
+        sockets.insert(min(len(sockets), (i // step) + i), ws)
+    return sockets, events
+
+
+async def _sequential(n: int, slow: int, delay: float) -> tuple[float, float]:
+    """The previous ConnectionManager.broadcast."""
+    sockets, events = _clients(n, slow, delay)
+    start = time.perf_counter()
+    for ws in sockets:
+        await ws.send_text(json.dumps({"type": "update"}))
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*(e.wait() for e in events))
+    return elapsed, time.perf_counter() - start
+
+
+async def _queued(n: int, slow: int, delay: float) -> tuple[float, float]:
+    sockets, events = _clients(n, slow, delay)
+    manager = ConnectionManager(send_timeout=delay * 10)
+    for ws in sockets:
+        await manager.connect(ws)  # type: ignore[arg-type]
+    start = time.perf_counter()
+    await manager.broadcast({"type": "update"})
+    blocked = time.perf_counter() - start
+    await asyncio.gather(*(e.wait() for e in events))
+    delivered = time.perf_counter() - start
+    for ws in sockets:
+        await manager.disconnect(ws)  # type: ignore[arg-type]
+    return blocked, delivered
+
+
+async def main(n: int, slow: int, delay: float) -> None:
+    print(f"{n:,} clients, {slow} slow ({delay * 1000:.0f} ms per send)")
+    print("                 broadcast blocks   all fast clients have it")
+    for label, run in (("sequential", _sequential), ("send queues", _queued)):
+        blocked, delivered = await run(n, slow, delay)
+        print(f"{label:<16} {blocked * 1000:>12.1f} ms   {delivered * 1000:>14.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=5_000)
+    parser.add_argument("--slow", type=int, default=5)
+    parser.add_argument("--slow-delay", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(main(args.clients, args.slow, args.slow_delay))
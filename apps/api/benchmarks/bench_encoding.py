@@ -0,0 +1,113 @@
+"""Measure the cost of encoding websocket events and REST responses.
+
+Compares Starlette's send_json path (stdlib json, once per socket) with
+encoding an event once and sharing it across sockets, and reports the
+per-message cost of each encoder: stdlib json, app.lib.encoding.dumps
+(orjson when installed) and the MessagePack form. Also renders a
+keys-list-sized REST payload with JSONResponse and FastJSONResponse.
+
+Usage: python -m benchmarks.bench_encoding [--messages N] [--sockets S] [--repeat R]
+"""
+
+import argparse
+import json
+import time
+from collections.abc import Callable
+
+from fastapi.responses import JSONResponse
+
+from app.lib import encoding
+from app.lib.encoding import Encoded, FastJSONResponse
+
+_EVENT = {
+    "type": "event",
+    "topic": "task:7f3c2a9e",
+    "seq": 1842,
+    "data": {
+        "id": "7f3c2a9e",
+        "status": "running",
+        "progress": 0.42,
+        "step": "Applying patch to src/app/routes/keys.py",
+        "assignee": {"id": "m-12", "name": "Reviewer", "provider": "anthropic"},
+        "tokens": {"input": 18231, "output": 2210},
+        "updated_at": "2026-10-17T09:21:44.512Z",
+    },
+}
+
+_KEYS_PAGE = {
+    "keys": [
+        {
+            "id": f"key-{i:04d}",
+            "provider": "openai",
+            "label": f"Project key {i}",
+            "masked_key": "sk-...abcd",
+            "created_at": "2026-10-17T09:21:44.512Z",
+            "updated_at": "2026-10-17T09:21:44.512Z",
+        }
+        for i in range(100)
+    ]
+}
+
+
+def _stdlib(obj: object) -> str:
+    """What WebSocket.send_json does for every socket."""
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _best_of(repeat: int, fn: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(n_messages: int, n_sockets: int, repeat: int) -> None:
+    encoded = Encoded.of(_EVENT)
+    print(f"Encoder backend: {encoding.BACKEND}; event is {len(encoded.json)} bytes")
+
+    per_message: list[tuple[str, Callable[[], object]]] = [
+        ("stdlib json.dumps", lambda: [_stdlib(_EVENT) for _ in range(n_messages)]),
+        ("encoding.dumps", lambda: [encoding.dumps(_EVENT) for _ in range(n_messages)]),
+        ("dumps + text", lambda: [Encoded.of(_EVENT).text for _ in range(n_messages)]),
+    ]
+    if encoding.msgpack_available():
+        per_message.append(
+            ("json -> msgpack", lambda: [Encoded(encoded.json).msgpack for _ in range(n_messages)])
+        )
+    print(f"\nPer message ({n_messages:,} messages, best of {repeat})")
+    for label, fn in per_message:
+        elapsed = _best_of(repeat, fn)
+        print(f"{label:<20} {elapsed / n_messages * 1e6:>8.2f} us")
+
+    fanout: list[tuple[str, Callable[[], object]]] = [
+        ("send_json per socket", lambda: [_stdlib(_EVENT) for _ in range(n_sockets)]),
+        ("encode once, share", lambda: [Encoded.of(_EVENT).text] * n_sockets),
+    ]
+    print(f"\nOne event to {n_sockets:,} sockets (encode cost only)")
+    for label, fn in fanout:
+        elapsed = _best_of(repeat, fn)
+        print(f"{label:<20} {elapsed * 1e3:>8.3f} ms")
+
+    rest: list[tuple[str, Callable[[], object]]] = [
+        ("JSONResponse", lambda: [JSONResponse(_KEYS_PAGE) for _ in range(n_messages // 100)]),
+        (
+            "FastJSONResponse",
+            lambda: [FastJSONResponse(_KEYS_PAGE) for _ in range(n_messages // 100)],
+        ),
+    ]
+    size = len(encoding.dumps(_KEYS_PAGE))
+    print(f"\nREST: 100-key page ({size:,} bytes)")
+    for label, fn in rest:
+        elapsed = _best_of(repeat, fn)
+        print(f"{label:<20} {elapsed / (n_messages // 100) * 1e6:>8.1f} us/response")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--sockets", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.messages, args.sockets, args.repeat)
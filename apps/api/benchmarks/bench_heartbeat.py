@@ -0,0 +1,108 @@
+"""Measure heartbeat overhead for many mostly idle websocket connections.
+
+Compares the previous receive loop, which wrapped every receive in
+asyncio.wait_for(..., timeout=30) (one timer created and cancelled per
+message), with a plain receive plus the shared HeartbeatScheduler. Each
+connection is an in-memory queue; every round delivers one message to
+every connection. Also times one wheel tick that heartbeats every
+connection at once.
+
+Usage: python -m benchmarks.bench_heartbeat [--connections N] [--rounds R]
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.realtime.connection import Connection
+from app.realtime.heartbeat import HeartbeatScheduler
+
+
+class _FakeWebSocket:
+    async def send_text(self, text: str) -> None:
+        pass
+
+
+async def _old_loop(queue: asyncio.Queue[int], done: asyncio.Event, rounds: int) -> None:
+    for _ in range(rounds):
+        try:
+            await asyncio.wait_for(queue.get(), timeout=30.0)
+        except TimeoutError:
+            pass
+    done.set()
+
+
+async def _new_loop(
+    queue: asyncio.Queue[int],
+    done: asyncio.Event,
+    rounds: int,
+    connection: Connection,
+    scheduler: HeartbeatScheduler,
+) -> None:
+    for _ in range(rounds):
+        await queue.get()
+        connection.last_seen = scheduler.clock()
+    done.set()
+
+
+async def _run(n: int, rounds: int, scheduled: bool) -> float:
+    queues: list[asyncio.Queue[int]] = [asyncio.Queue() for _ in range(n)]
+    events = [asyncio.Event() for _ in range(n)]
+    scheduler = HeartbeatScheduler()
+    if scheduled:
+        tasks = []
+        for queue, done in zip(queues, events, strict=True):
+            connection = Connection(_FakeWebSocket())  # type: ignore[arg-type]
+            scheduler.add(connection)
+            tasks.append(asyncio.create_task(_new_loop(queue, done, rounds, connection, scheduler)))
+    else:
+        tasks = [
+            asyncio.create_task(_old_loop(queue, done, rounds))
+            for queue, done in zip(queues, events, strict=True)
+        ]
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for queue in queues:
+            queue.put_nowait(0)
+        await asyncio.sleep(0)
+    await asyncio.gather(*(e.wait() for e in events))
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*tasks)
+    await scheduler.aclose()
+    return elapsed
+
+
+async def _tick_cost(n: int) -> float:
+    now = [0.0]
+    scheduler = HeartbeatScheduler(interval=30, timeout=90, resolution=1, clock=lambda: now[0])
+    for _ in range(n):
+        scheduler.add(Connection(_FakeWebSocket()))  # type: ignore[arg-type]
+    for _ in range(29):
+        now[0] += 1
+        scheduler.tick()
+    now[0] += 1
+    start = time.perf_counter()
+    scheduler.tick()
+    elapsed = time.perf_counter() - start
+    assert scheduler.heartbeats == n
+    await scheduler.aclose()
+    return elapsed
+
+
+async def main(n: int, rounds: int) -> None:
+    messages = n * rounds
+    print(f"{n:,} connections, {rounds} messages each")
+    for label, scheduled in (("wait_for per receive", False), ("heartbeat wheel", True)):
+        elapsed = await _run(n, rounds, scheduled)
+        print(f"{label:<22} {elapsed * 1e3:>8.1f} ms   {elapsed / messages * 1e6:>6.2f} us/message")
+    print(f"wheel tick heartbeating all {n:,}: {await _tick_cost(n) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connections", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.connections, args.rounds))
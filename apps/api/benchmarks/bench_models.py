@@ -0,0 +1,123 @@
+"""Compare the generated model codecs with the previous asdict/from_dict codec.
+
+Hydrates and encodes a list of credential documents with both codecs and
+reports throughput and peak memory. The previous codec is reproduced here as
+a plain (non-slots) dataclass with `asdict` and a hand-written `from_dict`.
+
+Usage: python -m benchmarks.bench_models [--docs N] [--repeat R]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from typing import Any
+
+from app.models.credential import CredentialDocument
+
+
+@dataclass
+class LegacyCredentialDocument:
+    """CredentialDocument as it was before the generated codecs."""
+
+    provider: str = ""
+    name: str = ""
+    encrypted_key: str = ""
+    key_suffix: str = ""
+    id: str = ""
+    created_at: datetime = field(default_factory=lambda: datetime.now(UTC))
+    updated_at: datetime = field(default_factory=lambda: datetime.now(UTC))
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        data.pop("id", None)
+        return data
+
+    @classmethod
+    def from_dict(cls, doc_id: str, data: dict[str, Any]) -> "LegacyCredentialDocument":
+        return cls(
+            id=doc_id,
+            provider=data.get("provider", ""),
+            name=data.get("name", ""),
+            encrypted_key=data.get("encrypted_key", ""),
+            key_suffix=data.get("key_suffix", ""),
+            created_at=data.get("created_at", datetime.now(UTC)),
+            updated_at=data.get("updated_at", datetime.now(UTC)),
+        )
+
+
+def _rows(n: int) -> list[tuple[str, dict[str, Any]]]:
+    now = datetime.now(UTC)
+    return [
+        (
+            f"key-{i}",
+            {
+                "provider": "openai",
+                "name": f"Key {i}",
+                "encrypted_key": "A" * 64,
+                "key_suffix": "sk-...abcd",
+                "created_at": now,
+                "updated_at": now,
+            },
+        )
+        for i in range(n)
+    ]
+
+
+def _best_of(repeat: int, fn: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak_memory(fn: Callable[[], object]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main(n_docs: int, repeat: int) -> None:
+    rows = _rows(n_docs)
+    codecs: list[tuple[str, Any]] = [
+        ("asdict", LegacyCredentialDocument),
+        ("generated", CredentialDocument),
+    ]
+
+    print(f"{n_docs:,} documents, best of {repeat}")
+    for label, model in codecs:
+
+        def hydrate(model: Any = model) -> list[Any]:
+            return [model.from_dict(doc_id, data) for doc_id, data in rows]
+
+        docs = hydrate()
+
+        def encode(docs: list[Any] = docs) -> list[dict[str, Any]]:
+            return [doc.to_dict() for doc in docs]
+
+        hydrate_s = _best_of(repeat, hydrate)
+        encode_s = _best_of(repeat, encode)
+        peak = _peak_memory(hydrate)
+        print(
+            f"{label:<10} hydrate {n_docs / hydrate_s:>12,.0f} docs/s"
+            f"  encode {n_docs / encode_s:>12,.0f} docs/s"
+            f"  hydrate peak {peak / 1024 / 1024:6.2f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.docs, args.repeat)
@@ -0,0 +1,84 @@
+"""Compare sync vs async repository throughput under concurrent requests.
+
+Simulates N concurrent handlers each reading a credential. The sync
+repository blocks the event loop for every RPC, so the handlers run one at a
+time; the async repository overlaps them.
+
+Requires the Firestore emulator:
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m benchmarks.bench_repositories
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+from app.lib.firebase import get_async_firestore_client, get_firestore_client
+from app.models.credential import CredentialDocument
+from app.repositories import AsyncCredentialRepository, CredentialRepository
+
+
+async def _loop_lag_probe(stop: asyncio.Event) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - start - 0.001)
+    return worst
+
+
+async def _run(label: str, handler, concurrency: int) -> None:  # type: ignore[no-untyped-def]
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_loop_lag_probe(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(handler(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lag = await probe
+    print(
+        f"{label:<6} {concurrency} concurrent gets: {elapsed * 1000:8.1f} ms "
+        f"({concurrency / elapsed:,.0f} req/s, max loop lag {lag * 1000:.1f} ms)"
+    )
+
+
+async def main(docs: int, concurrency: int) -> None:
+    user_id = f"bench-{uuid.uuid4()}"
+    sync_repo = CredentialRepository(get_firestore_client(), user_id)
+    async_repo = AsyncCredentialRepository(get_async_firestore_client(), user_id)
+
+    ids = [str(uuid.uuid4()) for _ in range(docs)]
+    await asyncio.gather(
+        *(
+            async_repo.create(
+                doc_id, CredentialDocument(provider="openai", name=doc_id, encrypted_key="x")
+            )
+            for doc_id in ids
+        )
+    )
+
+    async def sync_handler(i: int) -> None:
+        sync_repo.get(ids[i % docs])
+
+    async def async_handler(i: int) -> None:
+        await async_repo.get(ids[i % docs])
+
+    # Warm up both channels
+    await sync_handler(0)
+    await async_handler(0)
+
+    await _run("sync", sync_handler, concurrency)
+    await _run("async", async_handler, concurrency)
+
+    await asyncio.gather(*(async_repo.delete(doc_id) for doc_id in ids))
+
+
+if __name__ == "__main__":
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("Set FIRESTORE_EMULATOR_HOST to run this benchmark against the emulator")
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.docs, args.concurrency))
@@ -0,0 +1,82 @@
+"""Compare the binary and base64 text formats for stored credentials.
+
+For a few typical key lengths, reports the stored size (Firestore counts a
+string as its UTF-8 length + 1 and a bytes value as its length + 1), the
+encoded protobuf Value size sent on the wire, and the time to seal and open
+one credential in each format. The text format is the "v1:" + base64
+envelope written before the binary format.
+
+Usage: python -m benchmarks.bench_storage [--ops N] [--repeat R]
+"""
+
+import argparse
+import base64
+import time
+from collections.abc import Callable
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from google.cloud.firestore_v1._helpers import encode_value
+
+from app.lib import crypto
+
+# OpenAI legacy, Anthropic and OpenAI project key lengths
+_KEY_LENGTHS = (51, 108, 164)
+
+
+def _seal_text(cipher: AESGCM, plaintext: str) -> str:
+    """seal() as it was before the binary format."""
+    binary = crypto.seal(cipher, 1, plaintext)
+    return "v1:" + base64.b64encode(binary[1:]).decode("ascii")
+
+
+def _wire_size(value: str | bytes) -> int:
+    """Size of the value as serialized in a Firestore write or read."""
+    encoded = encode_value(value)
+    return len(type(encoded).serialize(encoded))
+
+
+def _best_of(repeat: int, fn: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(n_ops: int, repeat: int) -> None:
+    cipher = AESGCM(crypto.generate_data_key())
+
+    print("key chars   stored text/binary   wire text/binary   saved")
+    for length in _KEY_LENGTHS:
+        plaintext = "k" * length
+        text = _seal_text(cipher, plaintext)
+        binary = crypto.seal(cipher, 1, plaintext)
+        stored_text, stored_binary = len(text.encode()) + 1, len(binary) + 1
+        wire_text, wire_binary = _wire_size(text), _wire_size(binary)
+        print(
+            f"{length:>9}   {stored_text:>6} / {stored_binary:<6}      "
+            f"{wire_text:>5} / {wire_binary:<5}    {1 - stored_binary / stored_text:.0%}"
+        )
+
+    plaintext = "k" * 108
+    text = _seal_text(cipher, plaintext)
+    binary = crypto.seal(cipher, 1, plaintext)
+    cases: list[tuple[str, Callable[[], object]]] = [
+        ("seal text", lambda: [_seal_text(cipher, plaintext) for _ in range(n_ops)]),
+        ("seal binary", lambda: [crypto.seal(cipher, 1, plaintext) for _ in range(n_ops)]),
+        ("open text", lambda: [crypto.unseal(cipher, text) for _ in range(n_ops)]),
+        ("open binary", lambda: [crypto.unseal(cipher, binary) for _ in range(n_ops)]),
+    ]
+    print(f"\n108-char key, {n_ops:,} ops, best of {repeat}")
+    for label, fn in cases:
+        elapsed = _best_of(repeat, fn)
+        print(f"{label:<12} {elapsed / n_ops * 1e6:>7.2f} us/op")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.ops, args.repeat)
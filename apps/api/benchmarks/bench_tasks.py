@@ -0,0 +1,92 @@
+"""Measure task engine scheduling overhead and throughput for many short tasks.
+
+Each task does one checkpoint (a yield to the event loop) and returns. The
+baseline runs the same work as plain asyncio tasks bounded by a semaphore;
+the engine adds the priority queue, member and provider limits, status
+transitions and, optionally, status publishing through a ConnectionManager
+with no subscribers. Tasks are spread over --members team members and
+three providers, with random priorities. Each figure is the best of
+--repeat runs.
+
+Usage: python -m benchmarks.bench_tasks [--tasks N] [--workers W] [--members M] [--repeat R]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from app.realtime.manager import ConnectionManager
+from app.tasks.engine import TaskContext, TaskEngine
+from app.tasks.status import TaskStatus
+
+_PROVIDERS = ("anthropic", "openai", "google")
+
+
+async def _work(ctx: TaskContext) -> None:
+    await ctx.checkpoint()
+
+
+async def _baseline(n: int, workers: int) -> float:
+    semaphore = asyncio.Semaphore(workers)
+
+    async def one() -> None:
+        async with semaphore:
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(asyncio.create_task(one()) for _ in range(n)))
+    return time.perf_counter() - start
+
+
+async def _engine(n: int, workers: int, members: int, publish: bool) -> tuple[float, float]:
+    manager = ConnectionManager(state_tick=0.1) if publish else None
+    engine = TaskEngine(
+        max_workers=workers,
+        member_limit=4,
+        provider_limit=workers,
+        manager=manager,
+    )
+    rng = random.Random(0)
+    jobs = [
+        (str(rng.randrange(members)), _PROVIDERS[i % len(_PROVIDERS)], rng.randrange(10))
+        for i in range(n)
+    ]
+
+    start = time.perf_counter()
+    runs = [
+        engine.submit(_work, name="bench", team_member_id=m, provider=p, priority=prio)
+        for m, p, prio in jobs
+    ]
+    submitted = time.perf_counter() - start
+    statuses = [await run.wait() for run in runs]
+    elapsed = time.perf_counter() - start
+    assert statuses == [TaskStatus.COMPLETED] * n
+    if manager is not None:
+        await manager.aclose()
+    return elapsed, submitted
+
+
+async def main(n: int, workers: int, members: int, repeat: int) -> None:
+    print(f"{n:,} tasks, {workers} workers, {members} team members, {len(_PROVIDERS)} providers")
+    base = min([await _baseline(n, workers) for _ in range(repeat)])
+    print(f"{'asyncio + semaphore':<24} {base * 1e3:>8.1f} ms   {n / base:>9,.0f} tasks/s")
+    for label, publish in (("engine", False), ("engine + status events", True)):
+        elapsed, submitted = min(
+            [await _engine(n, workers, members, publish) for _ in range(repeat)]
+        )
+        overhead = (elapsed - base) / n * 1e6
+        print(
+            f"{label:<24} {elapsed * 1e3:>8.1f} ms   {n / elapsed:>9,.0f} tasks/s   "
+            f"submit {submitted / n * 1e6:.1f} us/task   overhead {overhead:.1f} us/task"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--members", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.tasks, args.workers, args.members, args.repeat))
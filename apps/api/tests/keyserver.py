@@ -0,0 +1,109 @@
+"""Stand-in for Google's secure token certificate endpoint.
+
+Generates RSA signing keys with self-signed certificates, serves them the way
+`securetoken@system.gserviceaccount.com` does (JSON of kid -> PEM with a
+Cache-Control max-age) over an in-process httpx transport, and mints ID
+tokens signed by the current key. Nothing touches the network.
+"""
+
+import asyncio
+import base64
+import datetime
+import json
+import time
+import uuid
+from typing import Any
+
+import httpx
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class LocalKeyServer:
+    """In-process certificate server and token minter."""
+
+    def __init__(self, project_id: str, max_age: int = 3600, latency: float = 0.0) -> None:
+        """Create a server with one signing key.
+
+        `latency` delays each certificate response to simulate a slow fetch.
+        """
+        self.project_id = project_id
+        self.max_age = max_age
+        self.latency = latency
+        self.fetch_count = 0
+        self._keys: dict[str, rsa.RSAPrivateKey] = {}
+        self._certs: dict[str, str] = {}
+        self.current_kid = ""
+        self.rotate()
+
+    def rotate(self, keep_previous: bool = True) -> str:
+        """Add a new signing key and make it current. Returns its key ID."""
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.local")])
+        now = datetime.datetime.now(datetime.UTC)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256())
+        )
+        kid = uuid.uuid4().hex
+        if not keep_previous:
+            self._keys.clear()
+            self._certs.clear()
+        self._keys[kid] = key
+        self._certs[kid] = cert.public_bytes(serialization.Encoding.PEM).decode("ascii")
+        self.current_kid = kid
+        return kid
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.fetch_count += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return httpx.Response(
+            200,
+            json=dict(self._certs),
+            headers={"Cache-Control": f"public, max-age={self.max_age}, must-revalidate"},
+        )
+
+    @property
+    def transport(self) -> httpx.AsyncBaseTransport:
+        """An httpx transport that answers every request with the cert JSON."""
+        return httpx.MockTransport(self._handle)
+
+    def client(self) -> httpx.AsyncClient:
+        """An httpx client wired to this server."""
+        return httpx.AsyncClient(transport=self.transport)
+
+    def issue_token(self, uid: str, kid: str | None = None, **overrides: Any) -> str:
+        """Mint an RS256 ID token for `uid`. Claims can be overridden."""
+        now = int(time.time())
+        kid = kid or self.current_kid
+        claims: dict[str, Any] = {
+            "iss": f"https://securetoken.google.com/{self.project_id}",
+            "aud": self.project_id,
+            "auth_time": now,
+            "sub": uid,
+            "iat": now,
+            "exp": now + 3600,
+            "email": f"{uid}@example.com",
+        }
+        claims.update(overrides)
+        header = {"alg": "RS256", "kid": kid, "typ": "JWT"}
+        signing_input = (
+            f"{_b64encode(json.dumps(header).encode())}.{_b64encode(json.dumps(claims).encode())}"
+        )
+        signature = self._keys[kid].sign(
+            signing_input.encode("ascii"), padding.PKCS1v15(), hashes.SHA256()
+        )
+        return f"{signing_input}.{_b64encode(signature)}"
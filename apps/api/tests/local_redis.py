@@ -0,0 +1,131 @@
+"""In-memory stand-in for the subset of redis.asyncio.Redis the API uses."""
+
+import asyncio
+import time
+from collections.abc import Callable
+from typing import Any
+
+
+class LocalRedis:
+    """Async key-value store with per-key expiry, shared by everything holding it.
+
+    Pass one instance to several caches to simulate multiple API instances
+    sharing a Redis server. Set `available = False` to make every call fail
+    like an unreachable server.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        """Create an empty store; expiry is measured on `clock`."""
+        self.clock = clock
+        self.commands = 0
+        self._data: dict[str, tuple[bytes, float | None]] = {}
+        self._pubsubs: set[LocalPubSub] = set()
+        self._available = True
+
+    @property
+    def available(self) -> bool:
+        return self._available
+
+    @available.setter
+    def available(self, value: bool) -> None:
+        self._available = value
+        if not value:
+            # Wake pending reads so they fail like a dropped connection
+            for pubsub in self._pubsubs:
+                pubsub.queue.put_nowait(None)
+
+    def _check(self) -> None:
+        self.commands += 1
+        if not self.available:
+            raise ConnectionError("LocalRedis is unavailable")
+
+    async def get(self, name: str) -> bytes | None:
+        self._check()
+        entry = self._data.get(name)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= self.clock():
+            del self._data[name]
+            return None
+        return value
+
+    async def set(
+        self, name: str, value: bytes, ex: int | None = None, nx: bool = False
+    ) -> bool | None:
+        if nx and await self.get(name) is not None:
+            return None
+        self._check()
+        self._data[name] = (value, self.clock() + ex if ex is not None else None)
+        return True
+
+    async def delete(self, *names: str) -> int:
+        self._check()
+        return sum(self._data.pop(name, None) is not None for name in names)
+
+    async def incr(self, name: str) -> int:
+        value = int(await self.get(name) or 0) + 1
+        expires_at = self._data[name][1] if name in self._data else None
+        self._data[name] = (str(value).encode(), expires_at)
+        return value
+
+    async def expire(self, name: str, time: int) -> bool:
+        self._check()
+        if name not in self._data:
+            return False
+        self._data[name] = (self._data[name][0], self.clock() + time)
+        return True
+
+    async def aclose(self) -> None:
+        pass
+
+    async def publish(self, channel: str, message: bytes) -> int:
+        self._check()
+        receivers = [p for p in self._pubsubs if channel in p.channels]
+        for pubsub in receivers:
+            pubsub.queue.put_nowait(
+                {"type": "message", "pattern": None, "channel": channel.encode(), "data": message}
+            )
+        return len(receivers)
+
+    def pubsub(self) -> "LocalPubSub":
+        pubsub = LocalPubSub(self)
+        self._pubsubs.add(pubsub)
+        return pubsub
+
+    def subscribers(self, channel: str) -> int:
+        """Number of pub/sub connections subscribed to a channel."""
+        return sum(channel in p.channels for p in self._pubsubs)
+
+
+class LocalPubSub:
+    """The subset of redis.asyncio.client.PubSub the API uses, on a LocalRedis."""
+
+    def __init__(self, redis: LocalRedis) -> None:
+        self.redis = redis
+        self.channels: set[str] = set()
+        self.queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+
+    async def subscribe(self, *channels: str) -> None:
+        self.redis._check()
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        self.redis._check()
+        self.channels.difference_update(channels)
+
+    async def get_message(
+        self, ignore_subscribe_messages: bool = False, timeout: float | None = 0.0
+    ) -> dict[str, Any] | None:
+        if not self.redis.available:
+            raise ConnectionError("LocalRedis is unavailable")
+        try:
+            message = await asyncio.wait_for(self.queue.get(), timeout)
+        except TimeoutError:
+            return None
+        if message is None:
+            raise ConnectionError("LocalRedis is unavailable")
+        return message
+
+    async def aclose(self) -> None:
+        self.redis._pubsubs.discard(self)
@@ -0,0 +1,75 @@
+"""Tests for the fast JSON / MessagePack encoding layer."""
+
+import json
+import math
+from datetime import UTC, datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.lib import encoding
+from app.lib.encoding import Encoded, FastJSONResponse, dumps, loads
+
+
+class TestDumps:
+    @pytest.mark.parametrize(
+        "value",
+        [
+            {"a": 1, "b": [1, 2.5, None, True], "c": {"d": "x"}},
+            {"text": "héllo ✓ 日本"},
+            [],
+            "plain",
+        ],
+    )
+    def test_matches_stdlib_output(self, value: object) -> None:
+        expected = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+        assert dumps(value) == expected
+        assert loads(dumps(value)) == value
+
+    def test_stdlib_fallback_matches(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(encoding, "orjson", None)
+        value = {"text": "héllo", "n": [1, 2]}
+        assert dumps(value) == '{"text":"héllo","n":[1,2]}'.encode()
+        assert loads(dumps(value)) == value
+
+    def test_fallback_rejects_nan(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(encoding, "orjson", None)
+        with pytest.raises(ValueError):
+            dumps({"x": math.nan})
+
+
+class TestEncoded:
+    def test_forms_are_derived_once(self) -> None:
+        encoded = Encoded.of({"type": "event", "seq": 1})
+        assert encoded.text == '{"type":"event","seq":1}'
+        assert encoded.text is encoded.text
+
+    def test_msgpack(self) -> None:
+        msgpack = pytest.importorskip("msgpack")
+        encoded = Encoded.of({"type": "event", "seq": 1})
+        assert msgpack.unpackb(encoded.msgpack) == {"type": "event", "seq": 1}
+        assert encoded.msgpack is encoded.msgpack
+
+    def test_msgpack_missing(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(encoding, "msgpack", None)
+        with pytest.raises(RuntimeError, match="msgpack"):
+            Encoded.of({}).msgpack
+
+
+class TestFastJSONResponse:
+    def test_renders_compact_json(self) -> None:
+        response = FastJSONResponse({"a": [1, 2], "when": "now"})
+        assert response.body == b'{"a":[1,2],"when":"now"}'
+        assert response.media_type == "application/json"
+
+    def test_is_app_default(self, client: TestClient) -> None:
+        response = client.get("/api/health")
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == dumps({"status": "ok", "version": "0.0.1"})
+
+    def test_datetimes_are_encoded_by_fastapi_first(self) -> None:
+        from fastapi.encoders import jsonable_encoder
+
+        when = datetime(2026, 1, 2, 3, 4, 5, tzinfo=UTC)
+        response = FastJSONResponse(jsonable_encoder({"when": when}))
+        assert loads(bytes(response.body)) == {"when": "2026-01-02T03:04:05+00:00"}
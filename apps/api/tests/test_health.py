@@ -1,7 +1,10 @@
 """Tests for health endpoint."""
 
+import pytest
 from fastapi.testclient import TestClient
 
+from app.lib.config import get_settings
+
 
 def test_health_check(client: TestClient) -> None:
     """Test health endpoint returns ok status."""
@@ -26,3 +29,14 @@ def test_readiness_check(client: TestClient) -> None:
     )
     assert data["version"] == "0.0.1"
     assert "firestore" in data["services"]
+
+
+def test_metrics_are_off_by_default(client: TestClient) -> None:
+    assert client.get("/api/health/metrics").status_code == 404
+
+
+def test_metrics_when_enabled(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(get_settings(), "metrics_enabled", True)
+    response = client.get("/api/health/metrics")
+    assert response.status_code == 200
+    assert "token_cache" in response.json()
@@ -0,0 +1,176 @@
+"""Tests for the shared outbound HTTP client pool."""
+
+import asyncio
+
+import httpx
+import pytest
+
+import app.lib.http as http_mod
+from app.lib.http import (
+    BreakerState,
+    CircuitBreaker,
+    CircuitOpenError,
+    HttpClientPool,
+    RetryBudget,
+    close_http_client,
+    get_http_client,
+    start_http_client,
+)
+
+
+def _pool(handler, **kwargs) -> HttpClientPool:  # type: ignore[no-untyped-def]
+    kwargs.setdefault("retry_backoff", 0)
+    return HttpClientPool(transport=httpx.MockTransport(handler), **kwargs)
+
+
+class TestRetries:
+    async def test_idempotent_request_retried_on_503(self) -> None:
+        statuses = [503, 503, 200]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(statuses.pop(0))
+
+        pool = _pool(handler, retry_attempts=2)
+        resp = await pool.get("https://example.test/x")
+        assert resp.status_code == 200
+        assert pool.metrics()["retries"] == 2
+
+    async def test_post_not_retried_after_send(self) -> None:
+        calls = 0
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal calls
+            calls += 1
+            return httpx.Response(503)
+
+        pool = _pool(handler)
+        resp = await pool.post("https://example.test/token")
+        assert resp.status_code == 503
+        assert calls == 1
+
+    async def test_post_retried_when_never_sent(self) -> None:
+        calls = 0
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(200)
+
+        pool = _pool(handler)
+        resp = await pool.post("https://example.test/token")
+        assert resp.status_code == 200
+        assert calls == 2
+
+    async def test_retry_budget_caps_retries(self) -> None:
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(503)
+
+        pool = _pool(handler, retry_budget=RetryBudget(ratio=0, min_tokens=1), breaker_threshold=99)
+        await pool.get("https://example.test/a")
+        await pool.get("https://example.test/b")
+        metrics = pool.metrics()
+        assert metrics["retries"] == 1
+        assert metrics["retry_budget_exhausted"] >= 1
+
+
+class TestCircuitBreaker:
+    def test_opens_and_half_opens(self) -> None:
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        breaker.before_call("h")
+        breaker.record_failure()
+        assert breaker.state is BreakerState.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call("h")
+
+        now[0] = 11
+        breaker.before_call("h")  # trial call allowed
+        assert breaker.state is BreakerState.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call("h")  # only one trial at a time
+        breaker.record_success()
+        assert breaker.state is BreakerState.CLOSED
+
+    async def test_pool_short_circuits_failing_host(self) -> None:
+        calls = 0
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal calls
+            calls += 1
+            return httpx.Response(502)
+
+        pool = _pool(handler, retry_attempts=0, breaker_threshold=3)
+        for _ in range(3):
+            await pool.get("https://flaky.test/")
+        with pytest.raises(CircuitOpenError):
+            await pool.get("https://flaky.test/")
+        assert calls == 3
+        assert pool.metrics()["hosts"]["https://flaky.test"]["breaker"] == "open"
+
+
+class TestLimitsAndMetrics:
+    async def test_per_host_concurrency_limit(self) -> None:
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(0.01)
+            return httpx.Response(200)
+
+        pool = _pool(handler, max_connections_per_host=3)
+        await asyncio.gather(*(pool.get("https://busy.test/") for _ in range(10)))
+        host = pool.metrics()["hosts"]["https://busy.test"]
+        assert host["peak_in_flight"] == 3
+        assert host["requests"] == 10
+        assert host["in_flight"] == 0
+
+    async def test_single_client_reused(self) -> None:
+        pool = _pool(lambda request: httpx.Response(200))
+        client = pool.client
+        await pool.get("https://example.test/1")
+        await pool.post("https://example.test/2")
+        assert pool.client is client
+        await pool.aclose()
+        assert client.is_closed
+
+
+class TestSharedPool:
+    async def test_lazy_pool_keeps_no_idle_connections(self) -> None:
+        await close_http_client()
+        pool = get_http_client()
+        assert get_http_client() is pool
+        assert pool.client._transport._pool._max_keepalive_connections == 0  # type: ignore[attr-defined]
+        await close_http_client()
+
+    def test_lifespan_pool_not_used_from_another_loop(self) -> None:
+        app_loop = asyncio.new_event_loop()
+        try:
+            pool = app_loop.run_until_complete(start_http_client())
+            with pytest.raises(RuntimeError):
+                asyncio.run(self._get())
+            assert http_mod._pool is pool
+        finally:
+            app_loop.run_until_complete(close_http_client())
+            app_loop.close()
+
+    @staticmethod
+    async def _get() -> HttpClientPool:
+        return get_http_client()
+
+
+class TestAuthVerification:
+    async def test_open_circuit_is_not_reported_as_bad_token(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        import app.middleware.auth as auth_mod
+        from app.lib.config import get_settings
+        from app.lib.token_cache import get_token_cache
+
+        async def unavailable(token: str, emulator_host: str) -> dict:
+            raise CircuitOpenError("emulator", retry_after=5)
+
+        monkeypatch.setattr(get_settings(), "auth_disabled", False)
+        monkeypatch.setattr(auth_mod, "_verify_token_emulator", unavailable)
+        get_token_cache().clear()
+        with pytest.raises(CircuitOpenError):
+            await auth_mod.authenticate("tok")
@@ -0,0 +1,193 @@
+"""Tests for envelope encryption with per-user data keys."""
+
+import asyncio
+import base64
+import secrets
+import uuid
+from collections.abc import Generator
+
+import pytest
+
+from app.lib import crypto
+from app.lib.config import get_settings
+from app.lib.firebase import get_async_firestore_client
+from app.lib.keyring import Keyring
+from app.repositories.keyring import AsyncKeyringRepository
+
+_MASTER_KEY = base64.b64encode(secrets.token_bytes(32)).decode()
+
+
+def _reset_crypto() -> None:
+    crypto._cached_key = None
+    get_settings.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def _master_key(monkeypatch: pytest.MonkeyPatch) -> Generator[None]:
+    """Use a known master key (version 1) and no retired keys."""
+    monkeypatch.setenv("CREDENTIAL_ENCRYPTION_KEY", _MASTER_KEY)
+    monkeypatch.setenv("CREDENTIAL_ENCRYPTION_KEY_VERSION", "1")
+    monkeypatch.delenv("CREDENTIAL_ENCRYPTION_PREVIOUS_KEYS", raising=False)
+    _reset_crypto()
+    yield
+    monkeypatch.undo()
+    _reset_crypto()
+
+
+def _rotate_master_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Make a new master key current (version 2) and retire the old one."""
+    monkeypatch.setenv(
+        "CREDENTIAL_ENCRYPTION_KEY", base64.b64encode(secrets.token_bytes(32)).decode()
+    )
+    monkeypatch.setenv("CREDENTIAL_ENCRYPTION_KEY_VERSION", "2")
+    monkeypatch.setenv("CREDENTIAL_ENCRYPTION_PREVIOUS_KEYS", f"1:{_MASTER_KEY}")
+    _reset_crypto()
+
+
+def _uid() -> str:
+    return f"keyring-test-{uuid.uuid4()}"
+
+
+# ---------------------------------------------------------------------------
+# Unit tests — key wrapping and envelope format
+# ---------------------------------------------------------------------------
+
+
+class TestDataKeyWrapping:
+    def test_wrap_unwrap_roundtrip(self) -> None:
+        key = crypto.generate_data_key()
+        wrapped, version = crypto.wrap_data_key(key, "alice")
+        assert version == 1
+        assert crypto.unwrap_data_key(wrapped, version, "alice") == key
+
+    def test_wrapped_key_is_bound_to_owner(self) -> None:
+        wrapped, version = crypto.wrap_data_key(crypto.generate_data_key(), "alice")
+        with pytest.raises(Exception):
+            crypto.unwrap_data_key(wrapped, version, "mallory")
+
+    def test_unwrap_with_retired_master_key(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        key = crypto.generate_data_key()
+        wrapped, version = crypto.wrap_data_key(key, "alice")
+
+        _rotate_master_key(monkeypatch)
+        assert crypto.current_master_version() == 2
+        assert crypto.unwrap_data_key(wrapped, version, "alice") == key
+
+    def test_unknown_master_version(self) -> None:
+        wrapped, _ = crypto.wrap_data_key(crypto.generate_data_key(), "alice")
+        with pytest.raises(RuntimeError, match="version 7"):
+            crypto.unwrap_data_key(wrapped, 7, "alice")
+
+    def test_envelope_version(self) -> None:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        cipher = AESGCM(crypto.generate_data_key())
+        sealed = crypto.seal(cipher, 3, "sk-test-key-12345678")
+        assert isinstance(sealed, bytes)
+        assert sealed[0] == 3
+        assert len(sealed) == 1 + 12 + len("sk-test-key-12345678") + 16
+        assert crypto.envelope_version(sealed) == 3
+        assert crypto.unseal(cipher, sealed) == "sk-test-key-12345678"
+
+        assert crypto.envelope_version(crypto.encrypt("sk-legacy-key-1234")) is None
+        with pytest.raises(ValueError, match="prefix"):
+            crypto.envelope_version("x1:abc")
+        with pytest.raises(ValueError, match="version byte"):
+            crypto.seal(cipher, 256, "sk-test-key-12345678")
+
+    def test_text_envelope_still_readable_and_convertible(self) -> None:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        cipher = AESGCM(crypto.generate_data_key())
+        binary = crypto.seal(cipher, 1, "sk-test-key-12345678")
+        # The first envelope format: "v{n}:" + base64 of the same payload
+        text = "v1:" + base64.b64encode(binary[1:]).decode()
+        assert crypto.envelope_version(text) == 1
+        assert crypto.unseal(cipher, text) == "sk-test-key-12345678"
+        assert crypto.envelope_to_bytes(text) == binary
+
+        with pytest.raises(ValueError, match="re-sealed"):
+            crypto.envelope_to_bytes(crypto.encrypt("sk-legacy-key-1234"))
+
+
+# ---------------------------------------------------------------------------
+# Integration tests — Keyring (requires emulator)
+# ---------------------------------------------------------------------------
+
+
+class TestKeyring:
+    async def test_data_key_created_once_and_cached(self) -> None:
+        keyring = Keyring(get_async_firestore_client)
+        uid = _uid()
+
+        sealed = await keyring.encrypt(uid, "sk-test-key-12345678")
+        assert isinstance(sealed, bytes)
+        assert crypto.envelope_version(sealed) == 1
+        assert await keyring.decrypt(uid, sealed) == "sk-test-key-12345678"
+        assert keyring.stats()["created"] == 1
+        assert keyring.stats()["unwrapped"] == 1
+        assert keyring.stats()["hits"] == 1
+
+        stored = await AsyncKeyringRepository(get_async_firestore_client(), uid).get()
+        assert stored is not None
+        assert stored.master_version == 1
+        assert base64.b64decode(stored.wrapped_key)
+
+    async def test_other_instances_use_the_stored_key(self) -> None:
+        uid = _uid()
+        sealed = await Keyring(get_async_firestore_client).encrypt(uid, "sk-test-key-12345678")
+
+        other = Keyring(get_async_firestore_client)
+        assert await other.decrypt(uid, sealed) == "sk-test-key-12345678"
+        assert other.stats()["created"] == 0
+
+    async def test_users_have_separate_keys(self) -> None:
+        keyring = Keyring(get_async_firestore_client)
+        sealed = await keyring.encrypt(_uid(), "sk-test-key-12345678")
+        with pytest.raises(Exception):
+            await keyring.decrypt(_uid(), sealed)
+
+    async def test_encrypt_many(self) -> None:
+        keyring = Keyring(get_async_firestore_client)
+        uid = _uid()
+        plaintexts = [f"sk-key-{i:04d}" for i in range(300)]
+        sealed = await keyring.encrypt_many(uid, plaintexts)
+        assert [await keyring.decrypt(uid, ct) for ct in sealed] == plaintexts
+
+    async def test_decrypts_legacy_blobs(self) -> None:
+        keyring = Keyring(get_async_firestore_client)
+        legacy = crypto.encrypt("sk-legacy-key-1234")
+        assert await keyring.decrypt(_uid(), legacy) == "sk-legacy-key-1234"
+        assert keyring.stats()["legacy_reads"] == 1
+        assert keyring.stats()["created"] == 0
+
+    async def test_master_rotation_rewraps_without_reencrypting(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        uid = _uid()
+        sealed = await Keyring(get_async_firestore_client).encrypt(uid, "sk-test-key-12345678")
+
+        _rotate_master_key(monkeypatch)
+        keyring = Keyring(get_async_firestore_client)
+        assert await keyring.decrypt(uid, sealed) == "sk-test-key-12345678"
+        assert keyring.stats()["rewrapped"] == 1
+
+        stored = await AsyncKeyringRepository(get_async_firestore_client(), uid).get()
+        assert stored is not None
+        assert stored.master_version == 2
+        assert await keyring.rewrap(uid) is False
+
+        # The retired key is no longer needed for this user
+        monkeypatch.delenv("CREDENTIAL_ENCRYPTION_PREVIOUS_KEYS")
+        _reset_crypto()
+        assert await Keyring(get_async_firestore_client).decrypt(uid, sealed) == (
+            "sk-test-key-12345678"
+        )
+
+    async def test_concurrent_creators_agree_on_one_key(self) -> None:
+        uid = _uid()
+        keyrings = [Keyring(get_async_firestore_client) for _ in range(4)]
+        sealed = await asyncio.gather(*(k.encrypt(uid, "sk-test-key-12345678") for k in keyrings))
+        assert sum(k.stats()["created"] for k in keyrings) == 1
+        for keyring in keyrings:
+            assert [await keyring.decrypt(uid, ct) for ct in sealed] == ["sk-test-key-12345678"] * 4
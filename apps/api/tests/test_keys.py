@@ -109,6 +109,63 @@ class TestEncryptDecrypt:
             decrypt(corrupted)
 
 
+class TestBatchCrypto:
+    def test_encrypt_many_roundtrip_serial(self) -> None:
+        from app.lib.crypto import decrypt, decrypt_many, encrypt_many
+
+        plaintexts = [f"sk-key-{i:04d}" for i in range(10)]
+        ciphertexts = encrypt_many(plaintexts)
+        assert [decrypt(ct) for ct in ciphertexts] == plaintexts
+        assert decrypt_many(ciphertexts, parallel=False) == plaintexts
+
+    def test_encrypt_many_roundtrip_parallel_keeps_order(self) -> None:
+        from app.lib.crypto import _PARALLEL_THRESHOLD, decrypt_many, encrypt_many
+
+        plaintexts = [f"sk-key-{i:04d}" for i in range(_PARALLEL_THRESHOLD + 3)]
+        ciphertexts = encrypt_many(plaintexts)
+        assert len(set(ciphertexts)) == len(plaintexts)
+        assert decrypt_many(ciphertexts) == plaintexts
+
+    def test_encrypt_many_empty(self) -> None:
+        from app.lib.crypto import decrypt_many, encrypt_many
+
+        assert encrypt_many([]) == []
+        assert decrypt_many([]) == []
+
+    def test_decrypt_many_raises_on_bad_blob(self) -> None:
+        from app.lib.crypto import decrypt_many, encrypt_many
+
+        ciphertexts = encrypt_many(["sk-good-key-1", "sk-good-key-2"])
+        with pytest.raises(ValueError, match="too short"):
+            decrypt_many([ciphertexts[0], base64.b64encode(b"short").decode()])
+
+    def test_cipher_reused_until_key_changes(self) -> None:
+        import app.lib.crypto as crypto_mod
+
+        cipher = crypto_mod._get_cipher()
+        assert crypto_mod._get_cipher() is cipher
+
+        crypto_mod._cached_key = None
+        crypto_mod._get_key()
+        assert crypto_mod._get_cipher() is not cipher
+
+    async def test_async_roundtrip(self) -> None:
+        from app.lib.crypto import (
+            _PARALLEL_THRESHOLD,
+            decrypt_async,
+            decrypt_many_async,
+            encrypt_async,
+            encrypt_many_async,
+        )
+
+        assert await decrypt_async(await encrypt_async("sk-async-key-1234")) == "sk-async-key-1234"
+        assert await encrypt_many_async([]) == []
+
+        plaintexts = [f"sk-key-{i:04d}" for i in range(_PARALLEL_THRESHOLD * 2)]
+        ciphertexts = await encrypt_many_async(plaintexts)
+        assert await decrypt_many_async(ciphertexts) == plaintexts
+
+
 # ---------------------------------------------------------------------------
 # Integration tests — CRUD endpoints
 # ---------------------------------------------------------------------------
@@ -230,3 +287,73 @@ class TestKeysEndpoints:
     def test_delete_nonexistent_key_404(self, client: TestClient) -> None:
         resp = client.delete("/api/keys/nonexistent-id")
         assert resp.status_code == 404
+
+    def test_list_keys_paginated(self, client: TestClient) -> None:
+        for i in range(3):
+            client.post(
+                "/api/keys",
+                json={"provider": "openai", "name": f"Page {i}", "key": f"sk-page-{i}2345678"},
+            )
+        everything = [item["id"] for item in client.get("/api/keys").json()]
+
+        seen: list[str] = []
+        page_token = None
+        while True:
+            params = {"limit": 2} | ({"page_token": page_token} if page_token else {})
+            resp = client.get("/api/keys", params=params)
+            assert resp.status_code == 200
+            assert len(resp.json()) <= 2
+            seen.extend(item["id"] for item in resp.json())
+            page_token = resp.headers.get("X-Next-Page-Token")
+            if page_token is None:
+                break
+
+        assert seen == sorted(everything)
+
+    def test_list_keys_streamed(self, client: TestClient) -> None:
+        client.post(
+            "/api/keys",
+            json={"provider": "openai", "name": "Streamed", "key": "sk-stream-12345678"},
+        )
+        resp = client.get("/api/keys", params={"stream": "true"})
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/json"
+        assert resp.json() == client.get("/api/keys").json()
+
+    def test_list_keys_invalid_page_token(self, client: TestClient) -> None:
+        resp = client.get("/api/keys", params={"page_token": "not-a-token"})
+        assert resp.status_code == 400
+
+    def test_batch_create_and_delete(self, client: TestClient) -> None:
+        resp = client.post(
+            "/api/keys:batch",
+            json={
+                "keys": [
+                    {"provider": "openai", "name": "Bulk A", "key": "sk-bulk-aaaa1111"},
+                    {"provider": "openai", "name": "Too short", "key": "abc"},
+                    {"provider": "anthropic", "name": "Bulk B", "key": "sk-ant-bbbb2222"},
+                ]
+            },
+        )
+        assert resp.status_code == 200
+        results = resp.json()["results"]
+        assert [r["status"] for r in results] == [201, 422, 201]
+        assert [r["index"] for r in results] == [0, 1, 2]
+        assert results[0]["key"]["key_hint"] == "sk-...1111"
+        assert "sk-bulk-aaaa1111" not in resp.text
+
+        created = [results[0]["key"]["id"], results[2]["key"]["id"]]
+        assert client.get(f"/api/keys/{created[1]}").json()["name"] == "Bulk B"
+
+        resp = client.request(
+            "DELETE", "/api/keys:batch", json={"ids": [*created, "does-not-exist"]}
+        )
+        assert resp.status_code == 200
+        assert [r["status"] for r in resp.json()["results"]] == [204, 204, 404]
+        for key_id in created:
+            assert client.get(f"/api/keys/{key_id}").status_code == 404
+
+    def test_batch_create_too_many_rejected(self, client: TestClient) -> None:
+        item = {"provider": "openai", "name": "x", "key": "sk-x-12345678"}
+        resp = client.post("/api/keys:batch", json={"keys": [item] * 1001})
+        assert resp.status_code == 422
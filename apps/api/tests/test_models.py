@@ -0,0 +1,78 @@
+"""Tests for the generated document model codecs."""
+
+from datetime import UTC, datetime
+
+import pytest
+
+from app.models.credential import CredentialDocument, CredentialSummary
+from app.models.user import User
+
+_WHEN = datetime(2024, 1, 2, 3, 4, 5, tzinfo=UTC)
+
+
+class TestCodecs:
+    def test_roundtrip(self) -> None:
+        doc = CredentialDocument(
+            id="k1",
+            provider="openai",
+            name="Key",
+            encrypted_key="ct",
+            key_suffix="sk-...1234",
+            created_at=_WHEN,
+            updated_at=_WHEN,
+        )
+        data = doc.to_dict()
+        assert data == {
+            "provider": "openai",
+            "name": "Key",
+            "key_suffix": "sk-...1234",
+            "created_at": _WHEN,
+            "updated_at": _WHEN,
+            "encrypted_key": "ct",
+        }
+        assert CredentialDocument.from_dict("k1", data) == doc
+
+    def test_missing_fields_take_defaults(self) -> None:
+        user = User.from_dict("u1", {"email": "a@example.com", "unknown": 1})
+        assert user.id == "u1"
+        assert user.email == "a@example.com"
+        assert user.firebase_uid == ""
+        assert user.display_name is None
+        assert user.created_at.tzinfo is UTC
+
+    def test_default_factory_only_called_when_missing(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        calls = 0
+        original = User.__dataclass_fields__["created_at"].default_factory
+
+        def counting_factory() -> datetime:
+            nonlocal calls
+            calls += 1
+            return original()  # type: ignore[misc]
+
+        import app.models.codec as codec
+
+        codec.decoder_for.cache_clear()
+        monkeypatch.setattr(
+            User.__dataclass_fields__["created_at"], "default_factory", counting_factory
+        )
+        try:
+            User.from_dict("u1", {"created_at": _WHEN, "updated_at": _WHEN})
+            assert calls == 0
+            User.from_dict("u1", {"updated_at": _WHEN})
+            assert calls == 1
+        finally:
+            codec.decoder_for.cache_clear()
+
+    def test_projected_summary(self) -> None:
+        summary = CredentialSummary.from_dict("k1", {"name": "Key", "encrypted_key": "ct"})
+        assert type(summary) is CredentialSummary
+        assert summary.name == "Key"
+        assert not hasattr(summary, "encrypted_key")
+
+    def test_models_use_slots(self) -> None:
+        user = User(id="u1")
+        assert not hasattr(user, "__dict__")
+        with pytest.raises(AttributeError):
+            user.nickname = "x"  # type: ignore[attr-defined]
@@ -0,0 +1,116 @@
+"""Tests for the two-tier user profile cache."""
+
+from datetime import UTC, datetime, timedelta
+
+from app.lib.profile_cache import ProfileCache
+from app.models.user import User
+from tests.local_redis import LocalRedis
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _user(uid: str = "u1", name: str = "Ada", updated: int = 0) -> User:
+    when = datetime(2024, 1, 1, tzinfo=UTC) + timedelta(seconds=updated)
+    return User(
+        id=uid,
+        firebase_uid=uid,
+        email=f"{uid}@example.com",
+        display_name=name,
+        created_at=when,
+        updated_at=when,
+    )
+
+
+class TestLocalTier:
+    async def test_hit_miss_and_ttl(self) -> None:
+        clock = FakeClock()
+        cache = ProfileCache(maxsize=10, ttl=60, clock=clock)
+        assert await cache.get("u1") is None
+
+        await cache.put(_user())
+        clock.now += 30
+        cached = await cache.get("u1")
+        assert cached is not None
+        assert cached.display_name == "Ada"
+
+        clock.now += 31
+        assert await cache.get("u1") is None
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 2
+        assert stats["hit_ratio"] == 0.3333
+        assert stats["staleness_max_seconds"] == 30.0
+
+    async def test_returns_copies(self) -> None:
+        cache = ProfileCache(maxsize=10, ttl=60)
+        await cache.put(_user())
+        first = await cache.get("u1")
+        assert first is not None
+        first.display_name = "mutated"
+        second = await cache.get("u1")
+        assert second is not None
+        assert second.display_name == "Ada"
+
+    async def test_size_bounded(self) -> None:
+        cache = ProfileCache(maxsize=2, ttl=60)
+        for uid in ("a", "b", "c"):
+            await cache.put(_user(uid))
+        assert await cache.get("a") is None
+        assert cache.stats()["evictions"] == 1
+
+    async def test_older_profile_does_not_replace_newer(self) -> None:
+        cache = ProfileCache(maxsize=10, ttl=60)
+        await cache.put(_user(name="New", updated=10))
+        await cache.put(_user(name="Old", updated=5))
+        cached = await cache.get("u1")
+        assert cached is not None
+        assert cached.display_name == "New"
+
+    async def test_disabled_when_size_zero(self) -> None:
+        cache = ProfileCache(maxsize=0, ttl=60)
+        await cache.put(_user())
+        assert await cache.get("u1") is None
+
+
+class TestSharedBackend:
+    async def test_instances_share_writes_and_invalidations(self) -> None:
+        clock = FakeClock()
+        redis = LocalRedis(clock=clock)
+        a = ProfileCache(maxsize=10, ttl=300, backend=redis, local_ttl=5, clock=clock)
+        b = ProfileCache(maxsize=10, ttl=300, backend=redis, local_ttl=5, clock=clock)
+
+        await a.put(_user())
+        from_b = await b.get("u1")
+        assert from_b is not None
+        assert from_b.display_name == "Ada"
+        assert from_b.created_at == datetime(2024, 1, 1, tzinfo=UTC)
+        assert b.stats()["backend_hits"] == 1
+
+        # b's local copy expires after local_ttl and picks up a's newer write
+        await a.put(_user(name="Grace", updated=1))
+        clock.now += 6
+        refreshed = await b.get("u1")
+        assert refreshed is not None
+        assert refreshed.display_name == "Grace"
+
+        await a.invalidate("u1")
+        clock.now += 6
+        assert await b.get("u1") is None
+
+    async def test_backend_failure_is_a_miss(self) -> None:
+        redis = LocalRedis()
+        cache = ProfileCache(maxsize=10, ttl=60, backend=redis)
+        redis.available = False
+
+        await cache.put(_user())
+        # The local tier still serves the profile
+        assert await cache.get("u1") is not None
+        assert await cache.get("u2") is None
+        assert cache.stats()["backend_errors"] >= 2
@@ -0,0 +1,156 @@
+"""Tests for the request identity map and single-flight read coalescing."""
+
+import asyncio
+from typing import Any
+
+import pytest
+
+from app.repositories.base import load_model
+from app.repositories.identity import ABSENT, forget, identity_scope, recall
+from app.repositories.singleflight import SingleFlight
+
+
+class _Snapshot:
+    def __init__(self, doc_id: str, data: dict[str, Any] | None) -> None:
+        self.id = doc_id
+        self.exists = data is not None
+        self.update_time = None
+        self._data = data
+
+    def to_dict(self) -> dict[str, Any] | None:
+        return dict(self._data) if self._data is not None else None
+
+
+class _DocRef:
+    """Minimal document reference that counts reads."""
+
+    def __init__(self, path: str, data: dict[str, Any] | None, delay: float = 0) -> None:
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+        self.data = data
+        self.delay = delay
+        self.reads = 0
+
+    async def get(self, field_paths: Any = None) -> _Snapshot:
+        self.reads += 1
+        data = self.data
+        await asyncio.sleep(self.delay)
+        return _Snapshot(self.id, data)
+
+
+def _to_dict_model(doc_id: str, data: dict[str, Any]) -> dict[str, Any]:
+    return {"id": doc_id, **data}
+
+
+class TestSingleFlight:
+    async def test_concurrent_calls_share_one_execution(self) -> None:
+        group = SingleFlight()
+        calls = 0
+
+        async def fetch() -> int:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return 42
+
+        results = await asyncio.gather(*(group.do("k", fetch) for _ in range(5)))
+        assert results == [42] * 5
+        assert calls == 1
+        assert group.stats() == {"calls": 5, "coalesced": 4, "in_flight": 0}
+
+        # Nothing is cached once the call completes
+        await group.do("k", fetch)
+        assert calls == 2
+
+    async def test_errors_are_shared(self) -> None:
+        group = SingleFlight()
+
+        async def fail() -> None:
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(
+            group.do("k", fail), group.do("k", fail), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def test_cancelled_caller_does_not_cancel_others(self) -> None:
+        group = SingleFlight()
+
+        async def fetch() -> str:
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        first = asyncio.create_task(group.do("k", fetch))
+        second = asyncio.create_task(group.do("k", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "ok"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+
+class TestIdentityMap:
+    async def test_repeated_reads_in_a_request_cost_one_rpc(self) -> None:
+        ref = _DocRef("users/u/credentials/k", {"name": "Key"})
+        with identity_scope() as identity:
+            first = await load_model(ref, dict, _to_dict_model)
+            second = await load_model(ref, dict, _to_dict_model)
+        assert first is second
+        assert ref.reads == 1
+        assert identity.hits == 1
+
+    async def test_missing_documents_are_remembered(self) -> None:
+        ref = _DocRef("users/u/credentials/missing", None)
+        with identity_scope():
+            assert await load_model(ref, dict, _to_dict_model) is None
+            assert await load_model(ref, dict, _to_dict_model) is None
+        assert ref.reads == 1
+
+    async def test_no_scope_reads_every_time(self) -> None:
+        ref = _DocRef("users/u/credentials/k", {"name": "Key"})
+        await load_model(ref, dict, _to_dict_model)
+        await load_model(ref, dict, _to_dict_model)
+        assert ref.reads == 2
+        assert recall(ref.path, dict) is ABSENT
+
+    async def test_scopes_are_isolated_and_forget_drops_entries(self) -> None:
+        ref = _DocRef("users/u/credentials/k", {"name": "Key"})
+        with identity_scope():
+            await load_model(ref, dict, _to_dict_model)
+            forget(ref.path)
+            await load_model(ref, dict, _to_dict_model)
+        with identity_scope():
+            await load_model(ref, dict, _to_dict_model)
+        assert ref.reads == 3
+
+    async def test_concurrent_requests_coalesce(self) -> None:
+        ref = _DocRef("users/u/credentials/shared", {"name": "Key"}, delay=0.01)
+
+        async def request() -> dict[str, Any] | None:
+            with identity_scope():
+                return await load_model(ref, dict, _to_dict_model)
+
+        results = await asyncio.gather(*(request() for _ in range(3)))
+        assert ref.reads == 1
+        # Each request hydrates its own model from the shared snapshot
+        assert results[0] == results[1] and results[0] is not results[1]
+
+    async def test_request_does_not_join_a_read_older_than_its_write(self) -> None:
+        ref = _DocRef("users/u/credentials/k", {"name": "Old"}, delay=0.02)
+
+        async def reader() -> dict[str, Any] | None:
+            with identity_scope():
+                return await load_model(ref, dict, _to_dict_model)
+
+        async def writer() -> dict[str, Any] | None:
+            with identity_scope():
+                await asyncio.sleep(0.005)
+                ref.data = {"name": "New"}
+                forget(ref.path)
+                return await load_model(ref, dict, _to_dict_model)
+
+        stale, fresh = await asyncio.gather(reader(), writer())
+        assert stale == {"id": "k", "name": "Old"}
+        assert fresh == {"id": "k", "name": "New"}
+        assert ref.reads == 2
@@ -0,0 +1,291 @@
+"""Tests for the resumable credential migration job."""
+
+import base64
+import os
+import secrets
+import uuid
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+os.environ.setdefault(
+    "CREDENTIAL_ENCRYPTION_KEY", base64.b64encode(secrets.token_bytes(32)).decode()
+)
+
+from app.jobs.reencrypt import (  # noqa: E402
+    Checkpoint,
+    Migration,
+    Progress,
+    ReencryptJob,
+    UnconfirmedWritesError,
+    reencrypt,
+    to_binary,
+)
+from app.lib import crypto  # noqa: E402
+from app.lib.firebase import get_async_firestore_client  # noqa: E402
+from app.lib.keyring import Keyring  # noqa: E402
+from app.models.credential import CredentialDocument  # noqa: E402
+from app.repositories import AsyncCredentialRepository  # noqa: E402
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _Crash(BaseException):
+    """Simulates the process dying mid-run."""
+
+
+class _LossyWriter:
+    """BulkWriter that drops updates to some documents, as when a batch RPC fails.
+
+    The real BulkWriter calls neither its result nor its error callback then.
+    """
+
+    def __init__(self, writer: Any, lose: set[str]) -> None:
+        self._writer = writer
+        self._lose = lose
+
+    def update(self, reference: Any, data: dict[str, Any], option: Any = None) -> None:
+        if reference.path not in self._lose:
+            self._writer.update(reference, data, option=option)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._writer, name)
+
+
+def _only(prefix: str, migration: Migration) -> Migration:
+    """Restrict a migration to this test's users (the emulator is shared)."""
+
+    async def migrate(uid: str, doc: CredentialDocument) -> dict[str, Any] | None:
+        return await migration(uid, doc) if uid.startswith(prefix) else None
+
+    return migrate
+
+
+async def _seed_legacy(prefix: str, users: int, per_user: int) -> list[tuple[str, str, str]]:
+    """Store legacy (master-key) credentials; returns (uid, doc_id, plaintext) tuples."""
+    seeded = []
+    for u in range(users):
+        uid = f"{prefix}-{u}"
+        repo = AsyncCredentialRepository(get_async_firestore_client(), uid)
+        for i in range(per_user):
+            plaintext = f"sk-legacy-{u}-{i}-abcd"
+            doc = CredentialDocument(
+                provider="openai",
+                name=f"Key {i}",
+                encrypted_key=crypto.encrypt(plaintext),
+                key_suffix=crypto.mask_key(plaintext),
+            )
+            await repo.create(f"cred-{i}", doc)
+            seeded.append((uid, f"cred-{i}", plaintext))
+    return seeded
+
+
+def _prefix() -> str:
+    return f"reencrypt-test-{uuid.uuid4().hex[:8]}"
+
+
+# ---------------------------------------------------------------------------
+# Unit tests — checkpoint and progress
+# ---------------------------------------------------------------------------
+
+
+class TestCheckpoint:
+    def test_roundtrip(self, tmp_path: Path) -> None:
+        path = tmp_path / "ckpt.json"
+        assert Checkpoint.load(path, "reencrypt") == Checkpoint("reencrypt")
+
+        Checkpoint("reencrypt", after="users/a/credentials/b", processed=3, updated=2).save(path)
+        loaded = Checkpoint.load(path, "reencrypt")
+        assert loaded.after == "users/a/credentials/b"
+        assert (loaded.processed, loaded.updated, loaded.failed) == (3, 2, 0)
+        assert [p.name for p in tmp_path.iterdir()] == ["ckpt.json"]
+
+    def test_other_migration_rejected(self, tmp_path: Path) -> None:
+        path = tmp_path / "ckpt.json"
+        Checkpoint("reencrypt").save(path)
+        with pytest.raises(ValueError, match="not 'other'"):
+            Checkpoint.load(path, "other")
+
+
+class TestProgress:
+    def test_rate_and_eta(self) -> None:
+        clock = _Clock()
+        progress = Progress(total=1000, start=100, clock=clock)
+        assert progress.eta(100) is None
+
+        clock.now = 10.0
+        assert progress.rate(300) == 20.0
+        assert progress.eta(300) == 35.0
+        assert "300/1000 processed" in progress.describe(Checkpoint("m", processed=300))
+
+    def test_unknown_total(self) -> None:
+        clock = _Clock()
+        progress = Progress(total=None, start=0, clock=clock)
+        clock.now = 1.0
+        assert progress.eta(50) is None
+        assert "ETA unknown" in progress.describe(Checkpoint("m", processed=50))
+
+
+# ---------------------------------------------------------------------------
+# Integration tests — job runs (requires emulator)
+# ---------------------------------------------------------------------------
+
+
+class TestReencryptJob:
+    async def test_reseals_legacy_credentials(self, tmp_path: Path) -> None:
+        prefix = _prefix()
+        seeded = await _seed_legacy(prefix, users=3, per_user=3)
+        db = get_async_firestore_client()
+        keyring = Keyring(lambda: db)
+
+        job = ReencryptJob(
+            db,
+            _only(prefix, reencrypt(keyring)),
+            Checkpoint("reencrypt"),
+            checkpoint_path=tmp_path / "ckpt.json",
+            page_size=4,
+        )
+        result = await job.run()
+        assert result.updated == len(seeded)
+        assert result.failed == 0
+        assert Checkpoint.load(tmp_path / "ckpt.json", "reencrypt").processed == result.processed
+
+        for uid, doc_id, plaintext in seeded:
+            stored = await AsyncCredentialRepository(db, uid).get(doc_id)
+            assert stored is not None
+            assert crypto.envelope_version(stored.encrypted_key) == 1
+            assert await keyring.decrypt(uid, stored.encrypted_key) == plaintext
+
+        # Already migrated: a second full run changes nothing
+        again = await ReencryptJob(
+            db, _only(prefix, reencrypt(keyring)), Checkpoint("reencrypt"), page_size=4
+        ).run()
+        assert again.updated == 0
+
+    async def test_binary_migration_converts_text_envelopes(self) -> None:
+        prefix = _prefix()
+        seeded = await _seed_legacy(prefix, users=2, per_user=2)
+        db = get_async_firestore_client()
+        keyring = Keyring(lambda: db)
+
+        # Rewrite half the credentials in the text envelope format
+        for uid, doc_id, plaintext in seeded[::2]:
+            binary = await keyring.encrypt(uid, plaintext)
+            text = f"v{binary[0]}:" + base64.b64encode(binary[1:]).decode()
+            await AsyncCredentialRepository(db, uid).update(doc_id, {"encrypted_key": text})
+
+        result = await ReencryptJob(
+            db, _only(prefix, to_binary(keyring)), Checkpoint("binary"), page_size=3
+        ).run()
+        assert result.updated == len(seeded)
+        for uid, doc_id, plaintext in seeded:
+            stored = await AsyncCredentialRepository(db, uid).get(doc_id)
+            assert stored is not None
+            assert isinstance(stored.encrypted_key, bytes)
+            assert await keyring.decrypt(uid, stored.encrypted_key) == plaintext
+
+    async def test_resumes_after_crash(self, tmp_path: Path) -> None:
+        prefix = _prefix()
+        seeded = await _seed_legacy(prefix, users=2, per_user=5)
+        db = get_async_firestore_client()
+        path = tmp_path / "ckpt.json"
+        visited: list[str] = []
+
+        def recording(crash_after: int | None) -> Migration:
+            async def migrate(uid: str, doc: CredentialDocument) -> dict[str, Any] | None:
+                if crash_after is not None and len(visited) == crash_after:
+                    raise _Crash
+                visited.append(f"{uid}/{doc.id}")
+                return {"name": "migrated"}
+
+            return _only(prefix, migrate)
+
+        with pytest.raises(_Crash):
+            await ReencryptJob(
+                db, recording(crash_after=6), Checkpoint("reencrypt"), path, page_size=2
+            ).run()
+        checkpoint = Checkpoint.load(path, "reencrypt")
+        assert checkpoint.after is not None
+        before_crash = len(visited)
+
+        await ReencryptJob(db, recording(crash_after=None), checkpoint, path, page_size=2).run()
+        ours = {f"{uid}/{doc_id}" for uid, doc_id, _ in seeded}
+        assert ours <= set(visited)
+        # Only the page in flight at the crash is processed twice
+        assert len(visited) - len(ours) <= 2
+        assert before_crash == 6
+
+    async def test_concurrent_edit_is_not_overwritten(self) -> None:
+        prefix = _prefix()
+        [(uid, doc_id, _)] = await _seed_legacy(prefix, users=1, per_user=1)
+        db = get_async_firestore_client()
+        repo = AsyncCredentialRepository(db, uid)
+
+        async def racing(uid: str, doc: CredentialDocument) -> dict[str, Any] | None:
+            # The user renames the key between the job's read and its write
+            await repo.update(doc.id, {"name": "Renamed by user"})
+            return {"name": "migrated"}
+
+        result = await ReencryptJob(db, _only(prefix, racing), Checkpoint("reencrypt")).run()
+        assert result.failed == 1
+        stored = await repo.get(doc_id)
+        assert stored is not None
+        assert stored.name == "Renamed by user"
+
+    async def test_dry_run_writes_nothing(self, tmp_path: Path) -> None:
+        prefix = _prefix()
+        [(uid, doc_id, _)] = await _seed_legacy(prefix, users=1, per_user=1)
+        db = get_async_firestore_client()
+        before = await AsyncCredentialRepository(db, uid).get(doc_id)
+
+        path = tmp_path / "ckpt.json"
+        result = await ReencryptJob(
+            db,
+            _only(prefix, reencrypt(Keyring(lambda: db))),
+            Checkpoint("reencrypt"),
+            path,
+            dry_run=True,
+        ).run()
+        assert result.updated == 1
+        assert not path.exists()
+        after = await AsyncCredentialRepository(db, uid).get(doc_id)
+        assert before is not None and after is not None
+        assert after.encrypted_key == before.encrypted_key
+
+    async def test_unconfirmed_write_stops_before_it(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        prefix = _prefix()
+        seeded = await _seed_legacy(prefix, users=1, per_user=4)
+        db = get_async_firestore_client()
+        keyring = Keyring(lambda: db)
+        path = tmp_path / "ckpt.json"
+        lost = db.document(f"users/{seeded[2][0]}/credentials/{seeded[2][1]}").path
+
+        make_writer = db.bulk_writer
+        monkeypatch.setattr(
+            db, "bulk_writer", lambda options=None: _LossyWriter(make_writer(options), {lost})
+        )
+        with pytest.raises(UnconfirmedWritesError):
+            await ReencryptJob(
+                db, _only(prefix, reencrypt(keyring)), Checkpoint("reencrypt"), path
+            ).run()
+        checkpoint = Checkpoint.load(path, "reencrypt")
+        assert checkpoint.after is not None and checkpoint.after < lost
+        assert checkpoint.failed == 0
+
+        monkeypatch.undo()
+        result = await ReencryptJob(db, _only(prefix, reencrypt(keyring)), checkpoint, path).run()
+        assert result.failed == 0
+        for uid, doc_id, plaintext in seeded:
+            stored = await AsyncCredentialRepository(db, uid).get(doc_id)
+            assert stored is not None
+            assert await keyring.decrypt(uid, stored.encrypted_key) == plaintext
+            assert crypto.envelope_version(stored.encrypted_key) == 1
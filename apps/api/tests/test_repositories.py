@@ -0,0 +1,240 @@
+"""Integration tests for the async Firestore repositories (requires emulator)."""
+
+import uuid
+
+import pytest
+from google.api_core.exceptions import FailedPrecondition
+
+from app.lib.firebase import get_async_firestore_client
+from app.models.credential import CredentialDocument, CredentialSummary
+from app.repositories import AsyncCredentialRepository, AsyncUserRepository
+from app.repositories.identity import identity_scope
+from app.repositories.pagination import (
+    InvalidPageTokenError,
+    decode_page_token,
+    encode_page_token,
+)
+
+
+def _credential_repo() -> AsyncCredentialRepository:
+    return AsyncCredentialRepository(get_async_firestore_client(), f"repo-test-{uuid.uuid4()}")
+
+
+class TestAsyncCredentialRepository:
+    async def test_crud_roundtrip(self) -> None:
+        repo = _credential_repo()
+        doc_id = str(uuid.uuid4())
+
+        created = await repo.create(
+            doc_id,
+            CredentialDocument(provider="openai", name="Key", encrypted_key="x", key_suffix="s"),
+        )
+        assert created.id == doc_id
+
+        fetched = await repo.get(doc_id)
+        assert isinstance(fetched, CredentialDocument)
+        assert fetched.name == "Key"
+
+        updated = await repo.update(doc_id, {"name": "Renamed"})
+        assert updated is not None
+        assert updated.name == "Renamed"
+        assert updated.provider == "openai"
+
+        assert [d.id for d in await repo.list()] == [doc_id]
+
+        assert await repo.delete(doc_id) is True
+        assert await repo.get(doc_id) is None
+
+    async def test_missing_document(self) -> None:
+        repo = _credential_repo()
+        assert await repo.get("missing") is None
+        assert await repo.update("missing", {"name": "x"}) is None
+        assert await repo.delete("missing") is False
+
+    async def test_update_is_conditional_on_the_loaded_version(self) -> None:
+        repo = _credential_repo()
+        doc_id = str(uuid.uuid4())
+        await repo.create(doc_id, CredentialDocument(provider="openai", name="Key"))
+        with identity_scope():
+            summary = await repo.get_summary(doc_id)
+            # Changed by someone else between this request's read and its write
+            await repo.collection.document(doc_id).update({"name": "Theirs"})
+            with pytest.raises(FailedPrecondition):
+                await repo.update(doc_id, {"name": "Mine"}, current=summary)
+            summary = await repo.get_summary(doc_id)
+            assert summary is not None and summary.name == "Theirs"
+            updated = await repo.update(doc_id, {"name": "Mine"}, current=summary)
+        assert updated is not None and updated.name == "Mine"
+
+    async def test_batch_delete_skips_credentials_deleted_meanwhile(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        repo = _credential_repo()
+        for doc_id in ("kept", "gone"):
+            await repo.create(doc_id, CredentialDocument(provider="openai", name=doc_id))
+        get_all = repo.db.get_all
+        reads = 0
+
+        async def delete_after_first_read(refs, **kwargs):  # type: ignore[no-untyped-def]
+            nonlocal reads
+            reads += 1
+            async for snap in get_all(refs, **kwargs):
+                yield snap
+            if reads == 1:
+                await repo.collection.document("gone").delete()
+
+        monkeypatch.setattr(repo.db, "get_all", delete_after_first_read)
+        assert await repo.scrub_and_delete_many(["kept", "gone"]) == [True, False]
+        # Not recreated by the scrub
+        assert not (await repo.collection.document("gone").get()).exists
+        assert not (await repo.collection.document("kept").get()).exists
+
+    async def test_pagination_walks_every_document(self) -> None:
+        repo = _credential_repo()
+        ids = sorted(str(uuid.uuid4()) for _ in range(5))
+        for doc_id in ids:
+            await repo.create(doc_id, CredentialDocument(provider="openai", name=doc_id))
+
+        first = await repo.list_page(limit=2)
+        assert [d.id for d in first.items] == ids[:2]
+        assert first.next_page_token is not None
+
+        second = await repo.list_page(limit=2, page_token=first.next_page_token)
+        assert [d.id for d in second.items] == ids[2:4]
+
+        last = await repo.list_page(limit=3, page_token=second.next_page_token)
+        assert [d.id for d in last.items] == ids[4:]
+        assert last.next_page_token is None
+
+        assert [d.id async for d in repo.iter_all(page_size=2)] == ids
+
+    async def test_summaries_skip_encrypted_key(self) -> None:
+        repo = _credential_repo()
+        await repo.create(
+            "k1",
+            CredentialDocument(
+                provider="openai", name="Key", encrypted_key="secret", key_suffix="s"
+            ),
+        )
+
+        summary = await repo.get_summary("k1")
+        assert type(summary) is CredentialSummary
+        assert summary.name == "Key"
+        assert summary.key_suffix == "s"
+        assert not hasattr(summary, "encrypted_key")
+        assert await repo.get_summary("missing") is None
+
+        page = await repo.list_summary_page()
+        assert [type(s) for s in page.items] == [CredentialSummary]
+        assert [s.id async for s in repo.iter_summaries()] == ["k1"]
+
+        updated = await repo.update("k1", {"name": "Renamed"}, current=summary)
+        assert updated is summary
+        assert summary.name == "Renamed"
+
+
+class TestPageToken:
+    def test_roundtrip(self) -> None:
+        assert decode_page_token(encode_page_token("abc/123")) == "abc/123"
+
+    @pytest.mark.parametrize("token", ["", "!!!", "bm90LWpzb24", encode_page_token("x")[:-2]])
+    def test_malformed_rejected(self, token: str) -> None:
+        with pytest.raises(InvalidPageTokenError):
+            decode_page_token(token)
+
+
+class TestAsyncUserRepository:
+    async def test_create_or_update(self) -> None:
+        repo = AsyncUserRepository(get_async_firestore_client())
+        uid = f"user-{uuid.uuid4()}"
+
+        user = await repo.create_or_update(uid, "a@example.com", display_name="A")
+        assert user.firebase_uid == uid
+
+        user = await repo.create_or_update(uid, "a@example.com", display_name="B")
+        assert user.display_name == "B"
+
+        fetched = await repo.get_by_firebase_uid(uid)
+        assert fetched is not None
+        assert fetched.display_name == "B"
+
+    async def test_upsert_skips_write_when_unchanged(self) -> None:
+        repo = AsyncUserRepository(get_async_firestore_client())
+        uid = f"user-{uuid.uuid4()}"
+
+        created = await repo.upsert(uid, "u@example.com", display_name="U")
+        again = await repo.upsert(uid, "u@example.com", display_name="U")
+        assert again.updated_at == created.updated_at
+
+        snapshot = await repo.collection.document(uid).get()
+        before = snapshot.update_time
+        await repo.upsert(uid, "u@example.com", display_name="U")
+        assert (await repo.collection.document(uid).get()).update_time == before
+
+    async def test_upsert_merges_changed_fields(self) -> None:
+        repo = AsyncUserRepository(get_async_firestore_client())
+        uid = f"user-{uuid.uuid4()}"
+
+        created = await repo.upsert(uid, "u@example.com", display_name="Old")
+        changed = await repo.upsert(uid, "u@example.com", display_name="New", avatar_url="a.png")
+        assert changed.display_name == "New"
+        assert changed.avatar_url == "a.png"
+        assert changed.created_at == created.created_at
+        assert changed.updated_at >= created.updated_at
+
+        stored = await repo.get(uid)
+        assert stored is not None
+        assert stored.display_name == "New"
+        assert stored.firebase_uid == uid
+
+    async def test_upsert_with_cached_profile_skips_the_read(self) -> None:
+        from app.lib.profile_cache import ProfileCache
+
+        repo = AsyncUserRepository(get_async_firestore_client(), cache=ProfileCache(10, 60))
+        uid = f"user-{uuid.uuid4()}"
+        created = await repo.upsert(uid, "u@example.com", display_name="Old")
+
+        reads: list[str] = []
+        doc_ref = repo.collection.document(uid)
+        original_get = type(doc_ref).get
+
+        async def counting_get(self, *args, **kwargs):  # type: ignore[no-untyped-def]
+            reads.append(self.path)
+            return await original_get(self, *args, **kwargs)
+
+        type(doc_ref).get = counting_get  # type: ignore[method-assign]
+        try:
+            same = await repo.upsert(uid, "u@example.com", display_name="Old")
+            changed = await repo.upsert(uid, "u@example.com", display_name="New")
+        finally:
+            type(doc_ref).get = original_get  # type: ignore[method-assign]
+        assert reads == []
+        assert same.updated_at == created.updated_at
+        assert changed.display_name == "New"
+        assert changed.created_at == created.created_at
+        stored = await repo.get(uid)
+        assert stored is not None and stored.display_name == "New"
+
+        # A cached user deleted behind the cache's back is recreated
+        await repo.collection.document(uid).delete()
+        recreated = await repo.upsert(uid, "u@example.com", display_name="Again")
+        assert (await repo.get(uid)).display_name == "Again"  # type: ignore[union-attr]
+        assert recreated.created_at > created.created_at
+
+    async def test_profile_cache_write_through(self) -> None:
+        from app.lib.profile_cache import ProfileCache
+
+        cache = ProfileCache(maxsize=10, ttl=60)
+        repo = AsyncUserRepository(get_async_firestore_client(), cache=cache)
+        uid = f"user-{uuid.uuid4()}"
+
+        await repo.upsert(uid, "c@example.com", display_name="Before")
+        await repo.upsert(uid, "c@example.com", display_name="After")
+        cached = await repo.get_by_firebase_uid(uid)
+        assert cached is not None
+        assert cached.display_name == "After"
+        # The second upsert and the read were both served by the cache
+        assert cache.stats()["hits"] == 2
+
+        assert await repo.delete(uid) is True
+        assert await repo.get_by_firebase_uid(uid) is None
@@ -0,0 +1,119 @@
+"""Regression tests for the number of Firestore RPCs each /api/keys endpoint makes.
+
+RPCs are counted at the generated gRPC client, below the repository layer,
+so any extra read-before-write shows up here. Requires the emulator.
+"""
+
+import base64
+import os
+import secrets
+from collections import Counter
+from collections.abc import Generator
+
+import pytest
+from fastapi.testclient import TestClient
+from google.cloud.firestore_v1.services.firestore.async_client import FirestoreAsyncClient
+
+os.environ.setdefault(
+    "CREDENTIAL_ENCRYPTION_KEY", base64.b64encode(secrets.token_bytes(32)).decode()
+)
+
+_RPC_METHODS = [
+    "batch_get_documents",
+    "commit",
+    "run_query",
+    "batch_write",
+    "get_document",
+    "update_document",
+    "delete_document",
+]
+
+
+@pytest.fixture
+def rpc_counter(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> Generator[Counter[str]]:
+    """Count calls to every data RPC on the async Firestore client.
+
+    Counts are for the steady state: a credential is created first, so the
+    user's data key is already loaded into the keyring cache.
+    """
+    _create_key(client, "Warm-up")
+    counts: Counter[str] = Counter()
+
+    for name in _RPC_METHODS:
+        original = getattr(FirestoreAsyncClient, name)
+
+        def counted(self, *args, __name=name, __original=original, **kwargs):  # type: ignore[no-untyped-def]
+            counts[__name] += 1
+            return __original(self, *args, **kwargs)
+
+        monkeypatch.setattr(FirestoreAsyncClient, name, counted)
+
+    yield counts
+
+
+def _create_key(client: TestClient, name: str = "Counted") -> str:
+    resp = client.post(
+        "/api/keys", json={"provider": "openai", "name": name, "key": "sk-count-12345678"}
+    )
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+class TestKeysRpcCounts:
+    def test_create(self, client: TestClient, rpc_counter: Counter[str]) -> None:
+        _create_key(client)
+        assert rpc_counter.total() == 1
+
+    def test_get(self, client: TestClient, rpc_counter: Counter[str]) -> None:
+        key_id = _create_key(client)
+        rpc_counter.clear()
+        assert client.get(f"/api/keys/{key_id}").status_code == 200
+        assert rpc_counter.total() == 1
+
+    def test_list(self, client: TestClient, rpc_counter: Counter[str]) -> None:
+        _create_key(client)
+        rpc_counter.clear()
+        assert client.get("/api/keys").status_code == 200
+        assert rpc_counter == Counter({"run_query": 1})
+
+    def test_update(self, client: TestClient, rpc_counter: Counter[str]) -> None:
+        key_id = _create_key(client)
+        rpc_counter.clear()
+        assert client.put(f"/api/keys/{key_id}", json={"name": "Renamed"}).status_code == 200
+        # One read, then one write conditional on it (merged into the response)
+        assert rpc_counter.total() == 2
+        assert rpc_counter["commit"] == 1
+
+    def test_delete(self, client: TestClient, rpc_counter: Counter[str]) -> None:
+        key_id = _create_key(client)
+        rpc_counter.clear()
+        assert client.delete(f"/api/keys/{key_id}").status_code == 204
+        # The overwrite is committed before the delete
+        assert rpc_counter == Counter({"commit": 2})
+
+    def test_delete_missing_is_single_rpc(
+        self, client: TestClient, rpc_counter: Counter[str]
+    ) -> None:
+        assert client.delete("/api/keys/does-not-exist").status_code == 404
+        assert rpc_counter == Counter({"commit": 1})
+
+    def test_update_missing_is_single_rpc(
+        self, client: TestClient, rpc_counter: Counter[str]
+    ) -> None:
+        assert client.put("/api/keys/does-not-exist", json={"name": "x"}).status_code == 404
+        assert rpc_counter.total() == 1
+
+    def test_batch_create_is_one_commit_per_500(
+        self, client: TestClient, rpc_counter: Counter[str]
+    ) -> None:
+        item = {"provider": "openai", "name": "Bulk", "key": "sk-bulk-12345678"}
+        resp = client.post("/api/keys:batch", json={"keys": [item] * 1000})
+        assert resp.status_code == 200
+        assert rpc_counter == Counter({"commit": 2})
+
+        rpc_counter.clear()
+        ids = [r["key"]["id"] for r in resp.json()["results"]]
+        resp = client.request("DELETE", "/api/keys:batch", json={"ids": ids})
+        assert resp.status_code == 200
+        # One read to find the existing keys, then an overwrite and a delete commit per 500
+        assert rpc_counter == Counter({"batch_get_documents": 1, "commit": 4})
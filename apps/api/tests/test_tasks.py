@@ -0,0 +1,354 @@
+"""Tests for the task engine: scheduling, limits, lifecycle and status events."""
+
+import asyncio
+from typing import Any
+
+import pytest
+
+import app.realtime.topics as topics_module
+from app.middleware.auth import AuthUser
+from app.realtime.backbone import RedisBackbone
+from app.realtime.manager import ConnectionManager
+from app.realtime.topics import can_subscribe
+from app.tasks.engine import TaskContext, TaskEngine, parse_limits
+from app.tasks.status import InvalidTransitionError, TaskStatus, check_transition
+from tests.local_redis import LocalRedis
+from tests.test_websocket import FakeWebSocket, _drain
+
+
+class Blocker:
+    """Task function factory whose tasks run until `release` is set."""
+
+    def __init__(self) -> None:
+        self.release = asyncio.Event()
+        self.started: list[str] = []
+
+    def __call__(self, label: str, checkpoints: bool = False) -> Any:
+        async def fn(ctx: TaskContext) -> str:
+            self.started.append(label)
+            while not self.release.is_set():
+                if checkpoints:
+                    await ctx.checkpoint()
+                await asyncio.sleep(0.001)
+            return label
+
+        return fn
+
+
+async def _settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestStatus:
+    def test_transitions(self) -> None:
+        check_transition(TaskStatus.PENDING, TaskStatus.RUNNING)
+        check_transition(TaskStatus.RUNNING, TaskStatus.PAUSED)
+        check_transition(TaskStatus.PAUSED, TaskStatus.PENDING)
+        with pytest.raises(InvalidTransitionError):
+            check_transition(TaskStatus.PENDING, TaskStatus.COMPLETED)
+        with pytest.raises(InvalidTransitionError):
+            check_transition(TaskStatus.COMPLETED, TaskStatus.RUNNING)
+        assert [s for s in TaskStatus if s.final] == [
+            TaskStatus.COMPLETED,
+            TaskStatus.FAILED,
+            TaskStatus.CANCELLED,
+        ]
+
+    def test_parse_limits(self) -> None:
+        assert parse_limits("") == {}
+        assert parse_limits("anthropic:8, openai:16") == {"anthropic": 8, "openai": 16}
+
+
+class TestScheduling:
+    async def test_higher_priority_runs_first(self) -> None:
+        engine = TaskEngine(max_workers=1)
+        blocker = Blocker()
+        first = engine.submit(blocker("first"), name="t", team_member_id="m", provider="p")
+        await _settle()
+        engine.submit(blocker("low"), name="t", team_member_id="m", provider="p", priority=1)
+        engine.submit(blocker("high"), name="t", team_member_id="m", provider="p", priority=5)
+        engine.submit(blocker("low2"), name="t", team_member_id="m", provider="p", priority=1)
+        blocker.release.set()
+        await first.wait()
+        while engine.runs:
+            await asyncio.sleep(0.001)
+        assert blocker.started == ["first", "high", "low", "low2"]
+
+    async def test_worker_pool_is_bounded(self) -> None:
+        engine = TaskEngine(max_workers=2, member_limit=0, provider_limit=0)
+        blocker = Blocker()
+        runs = [
+            engine.submit(blocker(str(i)), name="t", team_member_id=str(i), provider="p")
+            for i in range(5)
+        ]
+        await _settle()
+        assert engine.running == 2
+        assert [r.status for r in runs].count(TaskStatus.PENDING) == 3
+        blocker.release.set()
+        assert [await r.wait() for r in runs] == [TaskStatus.COMPLETED] * 5
+        assert runs[0].result == "0"
+        assert engine.stats()["completed"] == 5
+
+    async def test_member_limit_does_not_hold_up_other_members(self) -> None:
+        engine = TaskEngine(max_workers=4, member_limit=1)
+        blocker = Blocker()
+        a1 = engine.submit(blocker("a1"), name="t", team_member_id="a", provider="p")
+        a2 = engine.submit(blocker("a2"), name="t", team_member_id="a", provider="p")
+        b1 = engine.submit(blocker("b1"), name="t", team_member_id="b", provider="p")
+        await _settle()
+        assert (a1.status, a2.status, b1.status) == (
+            TaskStatus.RUNNING,
+            TaskStatus.PENDING,
+            TaskStatus.RUNNING,
+        )
+        assert engine.stats()["waiting_on_limits"] == 1
+        blocker.release.set()
+        await a1.wait()
+        assert await a2.wait() == TaskStatus.COMPLETED
+        assert blocker.started == ["a1", "b1", "a2"]
+
+    async def test_provider_limit_override(self) -> None:
+        engine = TaskEngine(
+            max_workers=8, member_limit=0, provider_limit=3, provider_limits={"x": 1}
+        )
+        blocker = Blocker()
+        for i in range(3):
+            engine.submit(blocker(f"x{i}"), name="t", team_member_id=str(i), provider="x")
+            engine.submit(blocker(f"y{i}"), name="t", team_member_id=str(i), provider="y")
+        await _settle()
+        assert sorted(blocker.started) == ["x0", "y0", "y1", "y2"]
+        blocker.release.set()
+        while engine.runs:
+            await asyncio.sleep(0.001)
+        assert engine.stats()["completed"] == 6
+
+
+class TestLifecycle:
+    async def test_pause_and_resume_pending(self) -> None:
+        engine = TaskEngine(max_workers=1)
+        blocker = Blocker()
+        engine.submit(blocker("first"), name="t", team_member_id="m", provider="p")
+        queued = engine.submit(blocker("queued"), name="t", team_member_id="m", provider="p")
+        engine.pause(queued.id)
+        assert queued.status is TaskStatus.PAUSED
+        with pytest.raises(InvalidTransitionError):
+            engine.pause(queued.id)
+        blocker.release.set()
+        await _settle()
+        await asyncio.sleep(0.01)
+        assert blocker.started == ["first"]
+        engine.resume(queued.id)
+        assert await queued.wait() == TaskStatus.COMPLETED
+
+    async def test_pause_running_frees_its_slot(self) -> None:
+        engine = TaskEngine(max_workers=1)
+        blocker = Blocker()
+        running = engine.submit(
+            blocker("a", checkpoints=True), name="t", team_member_id="m", provider="p"
+        )
+        other = engine.submit(blocker("b"), name="t", team_member_id="n", provider="p")
+        await _settle()
+        engine.pause(running.id)
+        # Still running until it reaches a checkpoint
+        assert running.status is TaskStatus.RUNNING
+        await asyncio.sleep(0.01)
+        assert running.status is TaskStatus.PAUSED
+        assert other.status is TaskStatus.RUNNING
+
+        engine.resume(running.id)
+        assert running.status is TaskStatus.PENDING
+        blocker.release.set()
+        await other.wait()
+        assert await running.wait() == TaskStatus.COMPLETED
+        # Continued from its checkpoint rather than starting over
+        assert blocker.started == ["a", "b"]
+
+    async def test_cancel(self) -> None:
+        engine = TaskEngine(max_workers=1)
+        blocker = Blocker()
+        running = engine.submit(
+            blocker("a", checkpoints=True), name="t", team_member_id="m", provider="p"
+        )
+        pending = engine.submit(blocker("b"), name="t", team_member_id="m", provider="p")
+        await _settle()
+        engine.cancel(pending.id)
+        assert pending.status is TaskStatus.CANCELLED
+        engine.cancel(running.id)
+        assert await running.wait() == TaskStatus.CANCELLED
+        assert blocker.started == ["a"]
+        assert engine.running == 0
+        with pytest.raises(KeyError):
+            engine.cancel(running.id)
+
+    async def test_cancel_while_paused_at_checkpoint(self) -> None:
+        engine = TaskEngine()
+        blocker = Blocker()
+        run = engine.submit(
+            blocker("a", checkpoints=True), name="t", team_member_id="m", provider="p"
+        )
+        await _settle()
+        engine.pause(run.id)
+        await asyncio.sleep(0.01)
+        assert run.status is TaskStatus.PAUSED
+        engine.cancel(run.id)
+        assert await run.wait() == TaskStatus.CANCELLED
+        await _settle()
+        assert run._task is not None and run._task.done()
+
+    async def test_failure(self) -> None:
+        engine = TaskEngine()
+
+        async def fail(ctx: TaskContext) -> None:
+            raise RuntimeError("model unavailable")
+
+        run = engine.submit(fail, name="t", team_member_id="m", provider="p")
+        assert await run.wait() == TaskStatus.FAILED
+        assert run.error == "model unavailable"
+        assert run.completed_at is not None
+        assert engine.stats()["failed"] == 1
+
+    async def test_resume_requires_paused(self) -> None:
+        engine = TaskEngine(max_workers=0)
+        run = engine.submit(Blocker()("a"), name="t", team_member_id="m", provider="p")
+        with pytest.raises(InvalidTransitionError):
+            engine.resume(run.id)
+
+    async def test_aclose_cancels_everything(self) -> None:
+        engine = TaskEngine(max_workers=1)
+        blocker = Blocker()
+        runs = [
+            engine.submit(blocker(str(i)), name="t", team_member_id="m", provider="p")
+            for i in range(3)
+        ]
+        await _settle()
+        await engine.aclose()
+        assert [r.status for r in runs] == [TaskStatus.CANCELLED] * 3
+        assert engine.running == 0
+        assert not engine.runs
+
+
+class TestStatusEvents:
+    async def test_status_published_to_task_topic(self) -> None:
+        manager = ConnectionManager(state_tick=60)
+        engine = TaskEngine(manager=manager)
+        ws = FakeWebSocket()
+        conn = await manager.connect(ws)  # type: ignore[arg-type]
+
+        async def work(ctx: TaskContext) -> None:
+            ctx.progress(progress=1.0)
+
+        run = engine.submit(work, name="lint", team_member_id="m", provider="p", task_id="t1")
+        manager.subscribe(conn, "task:t1")
+        await run.wait()
+        await manager.coalescer.flush()
+        await _drain()
+
+        # The state on subscribing, then the state once published
+        queued, snapshot = ws.sent
+        assert queued["state"]["status"] == "running"
+        state = snapshot["state"]
+        assert (snapshot["topic"], snapshot["entity"]) == ("task:t1", "t1")
+        assert state["status"] == "completed"
+        assert state["name"] == "lint"
+        assert state["teamMemberId"] == "m"
+        assert state["progress"] == 1.0
+        assert state["startedAt"] <= state["completedAt"]
+        await manager.aclose()
+
+    async def test_late_subscriber_gets_full_state(self) -> None:
+        manager = ConnectionManager(state_tick=60)
+        engine = TaskEngine(manager=manager)
+        early, late = FakeWebSocket(), FakeWebSocket()
+        manager.subscribe(await manager.connect(early), "task:t1")  # type: ignore[arg-type]
+        report, release = asyncio.Event(), asyncio.Event()
+
+        async def work(ctx: TaskContext) -> None:
+            await report.wait()
+            ctx.progress(progress=0.5)
+            await release.wait()
+
+        run = engine.submit(work, name="lint", team_member_id="m", provider="p", task_id="t1")
+        await _settle()
+        await manager.coalescer.flush()
+        # This instance forgets the task's state, as one that starts holding the topic late
+        manager._states.clear()
+
+        report.set()
+        await _settle()
+        await manager.coalescer.flush()
+        manager.subscribe(await manager.connect(late), "task:t1")  # type: ignore[arg-type]
+        await _drain()
+
+        [snapshot] = late.sent
+        assert snapshot["state"]["name"] == "lint"
+        assert snapshot["state"]["status"] == "running"
+        assert snapshot["state"]["progress"] == 0.5
+        release.set()
+        await run.wait()
+        await manager.aclose()
+
+    async def test_subscriber_to_unchanged_task_gets_its_state(self) -> None:
+        manager = ConnectionManager(state_tick=60)
+        engine = TaskEngine(max_workers=1, manager=manager)
+        blocker = Blocker()
+        engine.submit(blocker("a"), name="a", team_member_id="m", provider="p", task_id="t1")
+        engine.submit(blocker("b"), name="b", team_member_id="m", provider="p", task_id="t2")
+        await _settle()
+        await manager.coalescer.flush()
+
+        # No one held t2's topic when its state was published, and it has not changed since
+        ws = FakeWebSocket()
+        manager.subscribe(await manager.connect(ws), "task:t2")  # type: ignore[arg-type]
+        await _drain()
+        [snapshot] = ws.sent
+        assert snapshot["version"] == 1
+        assert snapshot["state"]["name"] == "b"
+        assert snapshot["state"]["status"] == "pending"
+        blocker.release.set()
+        await engine.aclose()
+        await manager.aclose()
+
+
+class TestOwnership:
+    async def test_only_the_owner_may_follow_a_task(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        manager = ConnectionManager(state_tick=60)
+        monkeypatch.setattr(topics_module, "get_connection_manager", lambda: manager)
+        engine = TaskEngine(manager=manager)
+        blocker = Blocker()
+        owned = engine.submit(
+            blocker("a"), name="t", team_member_id="m", provider="p", task_id="t1", owner="u1"
+        )
+        engine.submit(blocker("b"), name="t", team_member_id="m", provider="p", task_id="t2")
+
+        assert await can_subscribe(AuthUser(uid="u1"), "task:t1")
+        assert not await can_subscribe(AuthUser(uid="u2"), "task:t1")
+        # No owner recorded, or no such task
+        assert not await can_subscribe(AuthUser(uid="u1"), "task:t2")
+        assert not await can_subscribe(AuthUser(uid="u1"), "task:missing")
+
+        blocker.release.set()
+        await owned.wait()
+        # The claim outlives the run
+        assert await can_subscribe(AuthUser(uid="u1"), "task:t1")
+        await engine.aclose()
+        await manager.aclose()
+
+    async def test_owner_is_seen_by_other_instances(self) -> None:
+        redis = LocalRedis()
+        a = ConnectionManager(backbone=RedisBackbone(client=redis))
+        b = ConnectionManager(backbone=RedisBackbone(client=redis))
+        a.claim("task:t1", "u1")
+        # Seen locally before the backbone has it
+        assert await a.owner("task:t1") == "u1"
+        assert await b.owner("task:t1") is None
+        await _settle()
+        assert await b.owner("task:t1") == "u1"
+
+        # A task id already claimed stays with its owner
+        b.claim("task:t1", "u2")
+        await _settle()
+        assert await a.owner("task:t1") == "u1"
+        assert await b.owner("task:t1") == "u1"
+        await a.aclose()
+        await b.aclose()
@@ -0,0 +1,229 @@
+"""Tests for the verified token cache and its use in get_current_user."""
+
+import base64
+import json
+from collections.abc import Generator
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
+
+from app.lib.cache import TTLCache
+from app.lib.token_cache import VerifiedTokenCache, get_token_cache, peek_claims
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_700_000_000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _make_token(claims: dict) -> str:
+    """Build an unsigned JWT-shaped token carrying `claims`."""
+
+    def seg(obj: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+
+    return f"{seg({'alg': 'none'})}.{seg(claims)}."
+
+
+# ---------------------------------------------------------------------------
+# Unit tests — TTLCache
+# ---------------------------------------------------------------------------
+
+
+class TestTTLCache:
+    def test_lru_eviction(self) -> None:
+        cache: TTLCache[str, int] = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1  # "b" is now least recently used
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats.evictions == 1
+
+    def test_expiry(self) -> None:
+        clock = FakeClock()
+        cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl=5, clock=clock)
+        cache.set("a", 1)
+        clock.now += 4
+        assert cache.get("a") == 1
+        clock.now += 2
+        assert cache.get("a") is None
+        assert cache.stats.expirations == 1
+        assert len(cache) == 0
+
+    def test_on_remove_sees_every_departure(self) -> None:
+        clock = FakeClock()
+        removed: list[tuple[str, int]] = []
+        cache: TTLCache[str, int] = TTLCache(
+            maxsize=2, ttl=5, clock=clock, on_remove=lambda k, v: removed.append((k, v))
+        )
+        cache.set("a", 1)
+        cache.set("a", 2)  # replaced
+        cache.set("b", 3)
+        cache.set("c", 4)  # evicts "a"
+        assert cache.pop("b") == 3
+        clock.now += 6
+        assert cache.get("c") is None  # expired
+        cache.set("d", 5)
+        cache.clear()
+        assert removed == [("a", 1), ("a", 2), ("b", 3), ("c", 4), ("d", 5)]
+
+
+# ---------------------------------------------------------------------------
+# Unit tests — VerifiedTokenCache
+# ---------------------------------------------------------------------------
+
+
+class TestVerifiedTokenCache:
+    def test_hit_and_miss_counters(self) -> None:
+        clock = FakeClock()
+        cache = VerifiedTokenCache(maxsize=10, clock=clock)
+        claims = {"uid": "u1", "exp": clock.now + 60}
+
+        assert cache.get("tok") is None
+        cache.put("tok", claims)
+        assert cache.get("tok") == claims
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["size"] == 1
+
+    def test_expires_at_token_exp(self) -> None:
+        clock = FakeClock()
+        cache = VerifiedTokenCache(maxsize=10, clock=clock)
+        cache.put("tok", {"uid": "u1", "exp": clock.now + 60})
+        clock.now += 61
+        assert cache.get("tok") is None
+
+    def test_exp_read_from_token_when_claims_lack_it(self) -> None:
+        clock = FakeClock()
+        cache = VerifiedTokenCache(maxsize=10, clock=clock)
+        token = _make_token({"sub": "u1", "exp": clock.now + 30})
+        cache.put(token, {"uid": "u1"})
+        clock.now += 31
+        assert cache.get(token) is None
+
+    def test_raw_token_not_stored(self) -> None:
+        cache = VerifiedTokenCache(maxsize=10)
+        cache.put("secret-token", {"uid": "u1"})
+        assert "secret-token" not in cache._claims
+
+    def test_revoke_token(self) -> None:
+        clock = FakeClock()
+        cache = VerifiedTokenCache(maxsize=10, clock=clock)
+        claims = {"uid": "u1", "exp": clock.now + 60}
+        cache.put("tok", claims)
+
+        cache.revoke("tok")
+        assert cache.get("tok") is None
+        assert cache.is_revoked("tok", claims)
+        assert not cache.is_revoked("other", claims)
+
+    def test_revocations_are_not_evicted_by_size(self) -> None:
+        clock = FakeClock()
+        cache = VerifiedTokenCache(maxsize=2, clock=clock)
+        for i in range(5):
+            cache.revoke(_make_token({"sub": "u1", "exp": clock.now + 60 + i}))
+        first = _make_token({"sub": "u1", "exp": clock.now + 60})
+        assert cache.is_revoked(first, {})
+
+        # Expired revocations are dropped on the next revoke
+        clock.now += 65
+        cache.revoke(_make_token({"sub": "u1", "exp": clock.now + 60}))
+        assert len(cache._revoked) == 1
+
+    def test_revoke_user_rejects_older_tokens(self) -> None:
+        clock = FakeClock()
+        cache = VerifiedTokenCache(maxsize=10, clock=clock)
+        old = {"uid": "u1", "iat": clock.now - 10, "exp": clock.now + 60}
+        cache.put("old", old)
+        cache.put("other-user", {"uid": "u2", "exp": clock.now + 60})
+
+        cache.revoke_user("u1")
+        assert cache.get("old") is None
+        assert cache.get("other-user") is not None
+        assert cache.is_revoked("old", old)
+
+        clock.now += 5
+        fresh = {"uid": "u1", "iat": clock.now, "exp": clock.now + 60}
+        assert not cache.is_revoked("fresh", fresh)
+
+    def test_revocations_apply_on_other_instances(self) -> None:
+        clock = FakeClock()
+        here = VerifiedTokenCache(maxsize=10, clock=clock)
+        there = VerifiedTokenCache(maxsize=10, clock=clock)
+        claims = {"uid": "u1", "iat": clock.now - 10, "exp": clock.now + 60}
+        there.put("tok", claims)
+
+        there.apply_revocation(json.loads(json.dumps(here.revoke("tok"))))
+        assert there.get("tok") is None
+        assert there.is_revoked("tok", claims)
+        assert not there.is_revoked("other", {"uid": "u2"})
+
+        other = {"uid": "u2", "iat": clock.now - 10, "exp": clock.now + 60}
+        there.apply_revocation(here.revoke_user("u2"))
+        assert there.is_revoked("any", other)
+
+    def test_peek_claims_malformed(self) -> None:
+        assert peek_claims("not-a-jwt") == {}
+        assert peek_claims("a.!!!.c") == {}
+
+
+# ---------------------------------------------------------------------------
+# get_current_user integration
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def auth_enabled(monkeypatch: pytest.MonkeyPatch) -> Generator[list[str]]:
+    """Enable auth and replace emulator verification with a counting fake."""
+    import app.middleware.auth as auth_mod
+    from app.lib.config import get_settings
+
+    calls: list[str] = []
+
+    async def fake_verify(token: str, emulator_host: str) -> dict:
+        calls.append(token)
+        return {"uid": "u1", "email": "u1@example.com"}
+
+    monkeypatch.setattr(get_settings(), "auth_disabled", False)
+    monkeypatch.setattr(auth_mod, "_verify_token_emulator", fake_verify)
+    get_token_cache().clear()
+    yield calls
+    get_token_cache().clear()
+
+
+class TestGetCurrentUserCaching:
+    async def test_repeat_token_verified_once(self, auth_enabled: list[str]) -> None:
+        from app.middleware.auth import get_current_user
+
+        creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials="tok-1")
+        first = await get_current_user(None, creds)  # type: ignore[arg-type]
+        second = await get_current_user(None, creds)  # type: ignore[arg-type]
+
+        assert first.uid == second.uid == "u1"
+        assert auth_enabled == ["tok-1"]
+
+    async def test_revoked_user_rejected(self, auth_enabled: list[str]) -> None:
+        from app.middleware.auth import get_current_user
+
+        creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials="tok-2")
+        await get_current_user(None, creds)  # type: ignore[arg-type]
+        get_token_cache().revoke_user("u1")
+
+        with pytest.raises(HTTPException) as exc:
+            await get_current_user(None, creds)  # type: ignore[arg-type]
+        assert exc.value.status_code == 401
+
+    def test_sign_out_revokes_token(self, auth_enabled: list[str], client: TestClient) -> None:
+        headers = {"Authorization": "Bearer tok-3"}
+        assert client.post("/api/auth/signout", headers=headers).status_code == 204
+        assert client.get("/api/auth/me", headers=headers).status_code == 401
+        assert client.post("/api/auth/signout", headers=headers).status_code == 401
@@ -0,0 +1,146 @@
+"""Tests for offline ID token verification against the local key server."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.lib.http import CircuitOpenError
+from app.lib.token_verifier import FirebaseTokenVerifier, InvalidTokenError, parse_max_age
+from tests.keyserver import LocalKeyServer
+
+PROJECT_ID = "mcontrol-test"
+
+
+@pytest.fixture
+def key_server() -> LocalKeyServer:
+    return LocalKeyServer(PROJECT_ID)
+
+
+@pytest.fixture
+async def verifier(key_server: LocalKeyServer) -> FirebaseTokenVerifier:
+    v = FirebaseTokenVerifier(PROJECT_ID, client=key_server.client(), min_refresh_interval=0)
+    await v.refresh()
+    return v
+
+
+class TestVerify:
+    async def test_valid_token(
+        self, key_server: LocalKeyServer, verifier: FirebaseTokenVerifier
+    ) -> None:
+        claims = verifier.verify(key_server.issue_token("user-1"))
+        assert claims["uid"] == "user-1"
+        assert claims["email"] == "user-1@example.com"
+
+    async def test_no_network_on_request_path(
+        self, key_server: LocalKeyServer, verifier: FirebaseTokenVerifier
+    ) -> None:
+        fetches = key_server.fetch_count
+        for _ in range(20):
+            verifier.verify(key_server.issue_token("user-1"))
+        assert key_server.fetch_count == fetches
+
+    @pytest.mark.parametrize(
+        "overrides",
+        [
+            {"aud": "other-project"},
+            {"iss": "https://securetoken.google.com/other-project"},
+            {"exp": int(time.time()) - 1},
+            {"iat": int(time.time()) + 600},
+            {"sub": ""},
+        ],
+    )
+    async def test_invalid_claims_rejected(
+        self, key_server: LocalKeyServer, verifier: FirebaseTokenVerifier, overrides: dict
+    ) -> None:
+        with pytest.raises(InvalidTokenError):
+            verifier.verify(key_server.issue_token("user-1", **overrides))
+
+    async def test_foreign_signature_rejected(
+        self, key_server: LocalKeyServer, verifier: FirebaseTokenVerifier
+    ) -> None:
+        impostor = LocalKeyServer(PROJECT_ID)
+        forged = impostor.issue_token("user-1")
+        # Re-label the forged token with a kid the verifier trusts
+        header, payload, sig = forged.split(".")
+        good_header = key_server.issue_token("user-1").split(".")[0]
+        with pytest.raises(InvalidTokenError):
+            verifier.verify(f"{good_header}.{payload}.{sig}")
+
+    async def test_malformed_token_rejected(self, verifier: FirebaseTokenVerifier) -> None:
+        with pytest.raises(InvalidTokenError):
+            verifier.verify("not-a-token")
+
+    async def test_verify_async_loads_keys_lazily(self, key_server: LocalKeyServer) -> None:
+        v = FirebaseTokenVerifier(PROJECT_ID, client=key_server.client())
+        claims = await v.verify_async(key_server.issue_token("user-2"))
+        assert claims["uid"] == "user-2"
+        assert key_server.fetch_count == 1
+
+    async def test_failed_fetch_is_not_retried_inline(self, key_server: LocalKeyServer) -> None:
+        now = [time.time()]
+        fetches = 0
+
+        async def unavailable(request: httpx.Request) -> httpx.Response:
+            nonlocal fetches
+            fetches += 1
+            await asyncio.sleep(0.01)
+            return httpx.Response(503)
+
+        v = FirebaseTokenVerifier(
+            PROJECT_ID,
+            client=httpx.AsyncClient(transport=httpx.MockTransport(unavailable)),
+            retry_interval=30,
+            clock=lambda: now[0],
+        )
+        token = key_server.issue_token("user-2")
+        results = await asyncio.gather(
+            *(v.verify_async(token) for _ in range(5)), return_exceptions=True
+        )
+        assert fetches == 1
+        assert isinstance(results[0], httpx.HTTPStatusError)
+        assert all(isinstance(r, CircuitOpenError) for r in results[1:])
+
+        with pytest.raises(CircuitOpenError):
+            await v.verify_async(token)
+        assert fetches == 1
+
+        # Once the retry interval has passed, a request may fetch again
+        now[0] += 31
+        v._client = key_server.client()
+        assert (await v.verify_async(token))["uid"] == "user-2"
+        assert v.failed_at is None
+
+
+class TestBackgroundRefresh:
+    async def test_refreshes_before_max_age(self) -> None:
+        key_server = LocalKeyServer(PROJECT_ID, max_age=1)
+        v = FirebaseTokenVerifier(PROJECT_ID, client=key_server.client(), refresh_fraction=0.1)
+        await v.start()
+        try:
+            await asyncio.sleep(0.35)
+            assert key_server.fetch_count >= 3
+        finally:
+            await v.stop()
+
+    async def test_unknown_kid_triggers_refresh(self, key_server: LocalKeyServer) -> None:
+        v = FirebaseTokenVerifier(PROJECT_ID, client=key_server.client(), min_refresh_interval=0)
+        await v.start()
+        try:
+            new_kid = key_server.rotate()
+            token = key_server.issue_token("user-3", kid=new_kid)
+            with pytest.raises(InvalidTokenError):
+                v.verify(token)
+            for _ in range(50):
+                if new_kid in v.key_set.keys:
+                    break
+                await asyncio.sleep(0.01)
+            assert v.verify(token)["uid"] == "user-3"
+        finally:
+            await v.stop()
+
+
+def test_parse_max_age() -> None:
+    assert parse_max_age("public, max-age=19845, must-revalidate", 1.0) == 19845.0
+    assert parse_max_age(None, 42.0) == 42.0
@@ -0,0 +1,879 @@
+"""Tests for websocket connections and broadcast."""
+
+import asyncio
+import base64
+import json
+import time
+from collections.abc import AsyncIterator, Generator
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+from app.lib.encoding import Encoded, msgpack_available, packb, unpackb
+from app.lib.token_cache import get_token_cache, peek_claims
+from app.main import app
+from app.middleware.auth import AuthUser
+from app.realtime.backbone import RedisBackbone
+from app.realtime.connection import SLOW_CONSUMER_CLOSE_CODE, Connection, SlowConsumerPolicy
+from app.realtime.delta import apply_patch, diff
+from app.realtime.heartbeat import HeartbeatScheduler
+from app.realtime.manager import ConnectionManager
+from app.realtime.replay import ReplayBuffer
+from app.realtime.topics import can_subscribe
+from tests.local_redis import LocalRedis
+
+needs_msgpack = pytest.mark.skipif(not msgpack_available(), reason="msgpack is not installed")
+
+
+class FakeWebSocket:
+    """Records what was sent; `gate` blocks sends until it is set."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.application_state = WebSocketState.CONNECTED
+        self.delay = delay
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.sent: list[Any] = []
+        self.texts: list[str] = []
+        self.close_code: int | None = None
+
+    async def accept(self, subprotocol: str | None = None) -> None:
+        pass
+
+    async def send_json(self, message: Any) -> None:
+        await self.gate.wait()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def send_text(self, text: str) -> None:
+        await self.send_json(json.loads(text))
+        self.texts.append(text)
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self.send_json(unpackb(data))
+
+    async def close(self, code: int = 1000) -> None:
+        self.close_code = code
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+def _events(ws: FakeWebSocket) -> list[Any]:
+    """Data of the published events a socket received."""
+    return [m["data"] for m in ws.sent if isinstance(m, dict) and m.get("type") == "event"]
+
+
+async def _drain() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestConnection:
+    async def test_delivers_in_order(self) -> None:
+        ws = FakeWebSocket()
+        conn = Connection(ws)  # type: ignore[arg-type]
+        conn.start()
+        for i in range(3):
+            assert conn.send({"n": i})
+        await _drain()
+        assert ws.sent == [{"n": 0}, {"n": 1}, {"n": 2}]
+        assert conn.sent == 3
+        await conn.close()
+
+    async def test_drop_oldest_keeps_latest(self) -> None:
+        ws = FakeWebSocket()
+        ws.gate.clear()
+        conn = Connection(ws, max_queue=2)  # type: ignore[arg-type]
+        conn.start()
+        await _drain()
+        for i in range(5):
+            assert conn.send(i)
+        ws.gate.set()
+        await _drain()
+        assert ws.sent == [3, 4]
+        assert conn.dropped == 3
+        await conn.close()
+
+    async def test_drop_newest_keeps_earliest(self) -> None:
+        ws = FakeWebSocket()
+        ws.gate.clear()
+        conn = Connection(ws, max_queue=2, policy=SlowConsumerPolicy.DROP_NEWEST)  # type: ignore[arg-type]
+        conn.start()
+        await _drain()
+        assert [conn.send(i) for i in range(4)] == [True, True, False, False]
+        ws.gate.set()
+        await _drain()
+        assert ws.sent == [0, 1]
+        assert conn.dropped == 2
+        await conn.close()
+
+    async def test_disconnect_policy_closes_socket(self) -> None:
+        closed: list[Connection] = []
+        ws = FakeWebSocket()
+        ws.gate.clear()
+        conn = Connection(
+            ws,  # type: ignore[arg-type]
+            max_queue=1,
+            policy=SlowConsumerPolicy.DISCONNECT,
+            on_close=closed.append,
+        )
+        conn.start()
+        await _drain()
+        assert conn.send(0)
+        assert not conn.send(1)
+        await _drain()
+        assert conn.closed
+        assert closed == [conn]
+        assert ws.close_code == SLOW_CONSUMER_CLOSE_CODE
+        assert not conn.send(2)
+
+    async def test_send_timeout_closes_socket(self) -> None:
+        ws = FakeWebSocket()
+        ws.gate.clear()
+        conn = Connection(ws, send_timeout=0.01)  # type: ignore[arg-type]
+        conn.start()
+        conn.send({"type": "stuck"})
+        await asyncio.sleep(0.05)
+        assert conn.closed
+        assert ws.close_code == SLOW_CONSUMER_CLOSE_CODE
+
+
+class TestConnectionManager:
+    async def test_slow_client_does_not_delay_others(self) -> None:
+        manager = ConnectionManager(max_queue=8)
+        slow = FakeWebSocket()
+        slow.gate.clear()
+        fast = [FakeWebSocket() for _ in range(3)]
+        for ws in [slow, *fast]:
+            await manager.connect(ws)  # type: ignore[arg-type]
+
+        assert await manager.broadcast({"type": "update"}) == 4
+        await _drain()
+        assert all(ws.sent == [{"type": "update"}] for ws in fast)
+        assert slow.sent == []
+
+        for ws in [slow, *fast]:
+            await manager.disconnect(ws)  # type: ignore[arg-type]
+        assert manager.connections == {}
+        assert manager.stats()["sent"] == 3
+
+    async def test_closed_connection_is_removed(self) -> None:
+        manager = ConnectionManager(max_queue=1, policy=SlowConsumerPolicy.DISCONNECT)
+        ws = FakeWebSocket()
+        ws.gate.clear()
+        await manager.connect(ws)  # type: ignore[arg-type]
+        await _drain()
+        await manager.broadcast({"n": 1})
+        await manager.broadcast({"n": 2})
+        assert manager.connections == {}
+        assert manager.stats()["dropped"] == 2
+
+
+class TestTopics:
+    async def test_publish_reaches_only_subscribers(self) -> None:
+        manager = ConnectionManager()
+        sockets = [FakeWebSocket() for _ in range(3)]
+        conns = [await manager.connect(ws) for ws in sockets]  # type: ignore[arg-type]
+        manager.subscribe(conns[0], "task:1")
+        manager.subscribe(conns[1], "task:1")
+        manager.subscribe(conns[2], "task:2")
+
+        await manager.publish("task:1", {"n": 1})
+        await manager.publish("task:3", {"n": 3})
+        await _drain()
+        assert [_events(ws) for ws in sockets] == [[{"n": 1}], [{"n": 1}], []]
+        assert sockets[0].sent[0] == {
+            "type": "event",
+            "topic": "task:1",
+            "seq": 1,
+            "data": {"n": 1},
+        }
+        # Encoded once, the same str sent to both subscribers
+        assert sockets[0].texts[0] is sockets[1].texts[0]
+
+        manager.unsubscribe(conns[0], "task:1")
+        await manager.publish("task:1", {"n": 2})
+        await _drain()
+        assert [len(ws.sent) for ws in sockets] == [1, 2, 0]
+        for ws in sockets:
+            await manager.disconnect(ws)  # type: ignore[arg-type]
+
+    async def test_closed_connection_leaves_index(self) -> None:
+        manager = ConnectionManager()
+        ws = FakeWebSocket()
+        conn = await manager.connect(ws)  # type: ignore[arg-type]
+        manager.subscribe(conn, "task:1")
+        manager.subscribe(conn, "user:u1")
+        await manager.disconnect(ws)  # type: ignore[arg-type]
+        assert manager.topics == {}
+        assert not manager.subscribe(conn, "task:1")
+
+    async def test_topic_limit(self) -> None:
+        manager = ConnectionManager(max_topics=2)
+        ws = FakeWebSocket()
+        conn = await manager.connect(ws)  # type: ignore[arg-type]
+        assert manager.subscribe(conn, "task:1")
+        assert manager.subscribe(conn, "task:2")
+        assert manager.subscribe(conn, "task:2")
+        assert not manager.subscribe(conn, "task:3")
+        await manager.disconnect(ws)  # type: ignore[arg-type]
+
+    @pytest.mark.parametrize(
+        ("topic", "allowed"),
+        [
+            ("user:u1", True),
+            ("user:u2", False),
+            ("task:42", False),
+            ("unknown:1", False),
+            ("task:", False),
+            ("task", False),
+            ("task:" + "x" * 300, False),
+        ],
+    )
+    async def test_can_subscribe(self, topic: str, allowed: bool) -> None:
+        assert await can_subscribe(AuthUser(uid="u1"), topic) is allowed
+
+
+# Distinct encoded events, compared by identity
+_E = {n: Encoded.of(f"e{n}") for n in range(1, 6)}
+
+
+class TestReplay:
+    def test_since_returns_missed_events(self) -> None:
+        buffer = ReplayBuffer(maxlen=3)
+        for seq in range(1, 5):
+            buffer.append(seq, _E[seq])
+        assert buffer.since(2) == [_E[3], _E[4]]
+        assert buffer.since(1) == [_E[2], _E[3], _E[4]]
+        assert buffer.since(4) == []
+        # e1 was evicted, and a client cannot be ahead of the topic
+        assert buffer.since(0) is None
+        assert buffer.since(5) is None
+
+    def test_gap_discards_older_events(self) -> None:
+        buffer = ReplayBuffer()
+        buffer.append(1, _E[1])
+        buffer.append(2, _E[2])
+        buffer.append(5, _E[5])
+        assert buffer.since(1) is None
+        assert buffer.since(4) == [_E[5]]
+        # A late event that fills the gap is put back in order
+        buffer.append(4, _E[4])
+        assert buffer.since(3) == [_E[4], _E[5]]
+
+    def test_unsequenced_event_resets(self) -> None:
+        buffer = ReplayBuffer()
+        buffer.append(1, _E[1])
+        buffer.append(0, Encoded.of("x"))
+        assert buffer.since(1) is None
+        assert buffer.last_seq is None
+
+    async def test_resume_after_reconnect(self) -> None:
+        manager = ConnectionManager(replay_size=3)
+        ws = FakeWebSocket()
+        conn = await manager.connect(ws)  # type: ignore[arg-type]
+        manager.subscribe(conn, "task:1")
+        await manager.publish("task:1", {"n": 1})
+        await manager.disconnect(ws)  # type: ignore[arg-type]
+
+        # Published while the client was away; kept because the topic lingers
+        await manager.publish("task:1", {"n": 2})
+        await manager.publish("task:1", {"n": 3})
+
+        ws = FakeWebSocket()
+        conn = await manager.connect(ws)  # type: ignore[arg-type]
+        assert await manager.subscribe_resuming(conn, "task:1", 1)
+        await manager.publish("task:1", {"n": 4})
+        await _drain()
+        assert [m["seq"] for m in ws.sent] == [2, 3, 4]
+        assert _events(ws) == [{"n": 2}, {"n": 3}, {"n": 4}]
+        await manager.aclose()
+
+    async def test_resync_when_history_is_gone(self) -> None:
+        manager = ConnectionManager(replay_size=2)
+        ws = FakeWebSocket()
+        conn = await manager.connect(ws)  # type: ignore[arg-type]
+        manager.subscribe(conn, "task:1")
+        for n in range(4):
+            await manager.publish("task:1", {"n": n})
+
+        late = FakeWebSocket()
+        conn = await manager.connect(late)  # type: ignore[arg-type]
+        await manager.subscribe_resuming(conn, "task:1", 1)
+        await _drain()
+        assert late.sent == [{"type": "resync", "topic": "task:1", "seq": 4}]
+        assert manager.stats()["resyncs"] == 1
+        await manager.aclose()
+
+    async def test_history_dropped_after_linger(self) -> None:
+        manager = ConnectionManager(replay_linger=0.01)
+        ws = FakeWebSocket()
+        conn = await manager.connect(ws)  # type: ignore[arg-type]
+        manager.subscribe(conn, "task:1")
+        await manager.publish("task:1", {"n": 1})
+        await manager.disconnect(ws)  # type: ignore[arg-type]
+        assert manager.stats()["replay_topics"] == 1
+        await asyncio.sleep(0.05)
+        assert manager.stats()["replay_topics"] == 0
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestHeartbeatScheduler:
+    @pytest.fixture
+    async def wheel(self) -> AsyncIterator[tuple[FakeClock, HeartbeatScheduler]]:
+        clock = FakeClock()
+        scheduler = HeartbeatScheduler(interval=3, timeout=9, resolution=1, clock=clock)
+        yield clock, scheduler
+        await scheduler.aclose()
+
+    def _advance(self, clock: FakeClock, scheduler: HeartbeatScheduler, seconds: int) -> None:
+        for _ in range(seconds):
+            clock.now += 1
+            scheduler.tick()
+
+    async def test_heartbeats_idle_connection(
+        self, wheel: tuple[FakeClock, HeartbeatScheduler]
+    ) -> None:
+        clock, scheduler = wheel
+        ws = FakeWebSocket()
+        conn = Connection(ws)  # type: ignore[arg-type]
+        conn.start()
+        scheduler.add(conn)
+
+        self._advance(clock, scheduler, 2)
+        assert len(conn) == 0
+        self._advance(clock, scheduler, 1)
+        assert scheduler.heartbeats == 1
+        self._advance(clock, scheduler, 3)
+        assert scheduler.heartbeats == 2
+        await _drain()
+        assert ws.sent == [{"type": "heartbeat"}] * 2
+        await conn.close()
+
+    async def test_active_connection_is_not_heartbeated(
+        self, wheel: tuple[FakeClock, HeartbeatScheduler]
+    ) -> None:
+        clock, scheduler = wheel
+        conn = Connection(FakeWebSocket())  # type: ignore[arg-type]
+        scheduler.add(conn)
+        for _ in range(10):
+            self._advance(clock, scheduler, 2)
+            conn.last_seen = clock.now
+        assert scheduler.heartbeats == 0
+        assert len(scheduler) == 1
+
+    async def test_reaps_silent_connection(
+        self, wheel: tuple[FakeClock, HeartbeatScheduler]
+    ) -> None:
+        clock, scheduler = wheel
+        ws = FakeWebSocket()
+        conn = Connection(ws)  # type: ignore[arg-type]
+        conn.start()
+        scheduler.add(conn)
+
+        self._advance(clock, scheduler, 8)
+        assert not conn.closed
+        self._advance(clock, scheduler, 1)
+        await _drain()
+        assert conn.closed
+        assert ws.close_code == 1001
+        assert scheduler.reaped == 1
+        assert len(scheduler) == 0
+
+    async def test_listen_only_connection_is_kept_by_default(self) -> None:
+        clock = FakeClock()
+        scheduler = HeartbeatScheduler(interval=3, resolution=1, clock=clock)
+        conn = Connection(FakeWebSocket())  # type: ignore[arg-type]
+        conn.start()
+        scheduler.add(conn)
+
+        self._advance(clock, scheduler, 300)
+        await _drain()
+        assert not conn.closed
+        assert scheduler.heartbeats == 100
+        assert scheduler.reaped == 0
+        await conn.close()
+        await scheduler.aclose()
+
+    async def test_heartbeat_that_cannot_be_sent_closes_dead_peer(
+        self, wheel: tuple[FakeClock, HeartbeatScheduler]
+    ) -> None:
+        clock, scheduler = wheel
+        ws = FakeWebSocket()
+        ws.gate.clear()
+        conn = Connection(ws, send_timeout=0.01)  # type: ignore[arg-type]
+        conn.start()
+        scheduler.add(conn)
+
+        self._advance(clock, scheduler, 3)
+        await asyncio.sleep(0.05)
+        assert conn.closed
+        assert ws.close_code == SLOW_CONSUMER_CLOSE_CODE
+        assert scheduler.reaped == 0
+
+    async def test_manager_tracks_connections(self) -> None:
+        clock = FakeClock()
+        manager = ConnectionManager(heartbeats=HeartbeatScheduler(interval=3, clock=clock))
+        ws = FakeWebSocket()
+        conn = await manager.connect(ws)  # type: ignore[arg-type]
+        clock.now += 5
+        manager.seen(conn)
+        assert conn.last_seen == clock.now
+        assert manager.stats()["heartbeat"]["tracked"] == 1
+        await manager.disconnect(ws)  # type: ignore[arg-type]
+        assert manager.stats()["heartbeat"]["tracked"] == 0
+        await manager.aclose()
+
+
+class TestDelta:
+    @pytest.mark.parametrize(
+        ("old", "new"),
+        [
+            ({"a": 1, "b": 2}, {"a": 1, "b": 3}),
+            ({"a": 1}, {"a": 1, "c": [1, 2]}),
+            ({"a": 1, "gone": True}, {"a": 1}),
+            ({"n": {"x": 1, "y": 2}}, {"n": {"x": 1, "y": 5, "z": 0}}),
+            ({"a/b": 1, "c~d": 2}, {"a/b": 2}),
+            ({"v": 1}, {"v": 1.5}),
+        ],
+    )
+    def test_patch_roundtrip(self, old: dict, new: dict) -> None:
+        assert apply_patch(old, diff(old, new)) == new
+
+    def test_only_changes_are_sent(self) -> None:
+        old = {"status": "running", "progress": 0.1, "step": "build"}
+        new = {"status": "running", "progress": 0.2, "step": "build"}
+        assert diff(old, new) == [{"op": "replace", "path": "/progress", "value": 0.2}]
+        assert diff(new, new) == []
+
+
+class TestState:
+    async def test_updates_within_a_tick_are_merged(self) -> None:
+        manager = ConnectionManager(state_tick=60)
+        ws = FakeWebSocket()
+        conn = await manager.connect(ws)  # type: ignore[arg-type]
+        manager.subscribe(conn, "task:1")
+        for i in range(10):
+            manager.update_state("task:1", "t1", {"progress": i / 10, "status": "running"})
+        manager.update_state("task:1", "t1", {"step": "test"})
+        assert await manager.coalescer.flush() == 1
+        await _drain()
+        assert ws.sent == [
+            {
+                "type": "snapshot",
+                "topic": "task:1",
+                "entity": "t1",
+                "version": 1,
+                "state": {"progress": 0.9, "status": "running", "step": "test"},
+            }
+        ]
+        assert manager.stats()["state"]["updates"] == 11
+        await manager.aclose()
+
+    async def test_state_is_recognised_whatever_the_encoding(self) -> None:
+        manager = ConnectionManager()
+        ws = FakeWebSocket()
+        manager.subscribe(await manager.connect(ws), "task:1")  # type: ignore[arg-type]
+        # Not compact: the kind comes from the backbone, not the payload's bytes
+        event = {"seq": 1, "type": "state", "topic": "task:1", "entity": "t1", "fields": {"a": 1}}
+        manager.deliver("task:1", 1, json.dumps(event).encode(), state=True)
+        manager.deliver("task:1", 2, json.dumps({"type": "state", "x": 1}).encode())
+        await _drain()
+        assert [m["type"] for m in ws.sent] == ["snapshot", "state"]
+        await manager.aclose()
+
+    async def test_failed_publish_is_retried(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        manager = ConnectionManager(state_tick=0.01)
+        ws = FakeWebSocket()
+        manager.subscribe(await manager.connect(ws), "task:1")  # type: ignore[arg-type]
+        publish_state = manager.publish_state
+        failures = [RuntimeError("redis down")]
+
+        async def flaky(topic: str, entity: str, fields: dict[str, Any]) -> None:
+            if failures:
+                raise failures.pop()
+            await publish_state(topic, entity, fields)
+
+        monkeypatch.setattr(manager, "publish_state", flaky)
+        manager.update_state("task:1", "t1", {"status": "running"})
+        await asyncio.sleep(0.05)
+        manager.update_state("task:1", "t1", {"progress": 0.5})
+        await asyncio.sleep(0.05)
+        await _drain()
+
+        assert ws.sent[0]["state"] == {"status": "running"}
+        assert ws.sent[-1]["state"] == {"status": "running", "progress": 0.5}
+        assert manager.coalescer.stats()["failed"] == 1
+        await manager.aclose()
+
+    async def test_flush_task_is_restarted_after_it_died(self) -> None:
+        manager = ConnectionManager(state_tick=0.01)
+        ws = FakeWebSocket()
+        manager.subscribe(await manager.connect(ws), "task:1")  # type: ignore[arg-type]
+        manager.update_state("task:1", "t1", {"status": "pending"})
+        task = manager.coalescer._task
+        assert task is not None
+        task.cancel()
+        await asyncio.sleep(0)
+        manager.update_state("task:1", "t1", {"status": "running"})
+        await asyncio.sleep(0.05)
+        await _drain()
+        assert ws.sent[-1]["state"] == {"status": "running"}
+        await manager.aclose()
+
+    async def test_patch_against_acknowledged_version(self) -> None:
+        manager = ConnectionManager()
+        acking, silent = FakeWebSocket(), FakeWebSocket()
+        conns = [await manager.connect(ws) for ws in (acking, silent)]  # type: ignore[arg-type]
+        for conn in conns:
+            manager.subscribe(conn, "task:1")
+
+        await manager.publish_state("task:1", "t1", {"status": "running", "progress": 0.0})
+        manager.ack_state(conns[0], "task:1", "t1", 1)
+        await manager.publish_state("task:1", "t1", {"progress": 0.5})
+        await manager.publish_state("task:1", "t1", {"progress": 0.6, "step": "lint"})
+        await _drain()
+
+        # Both patches are against version 1, the last one acknowledged
+        assert [m["type"] for m in acking.sent] == ["snapshot", "patch", "patch"]
+        last = acking.sent[-1]
+        assert (last["base"], last["version"]) == (1, 3)
+        assert apply_patch(acking.sent[0]["state"], last["ops"]) == {
+            "status": "running",
+            "progress": 0.6,
+            "step": "lint",
+        }
+        # A client that never acknowledges keeps getting full state
+        assert [m["type"] for m in silent.sent] == ["snapshot"] * 3
+        await manager.aclose()
+
+    async def test_shared_base_is_encoded_once(self) -> None:
+        manager = ConnectionManager()
+        sockets = [FakeWebSocket() for _ in range(3)]
+        conns = [await manager.connect(ws) for ws in sockets]  # type: ignore[arg-type]
+        for conn in conns:
+            manager.subscribe(conn, "task:1")
+        await manager.publish_state("task:1", "t1", {"a": 1})
+        for conn in conns:
+            manager.ack_state(conn, "task:1", "t1", 1)
+        await manager.publish_state("task:1", "t1", {"a": 2})
+        await _drain()
+        assert sockets[0].texts[1] is sockets[1].texts[1] is sockets[2].texts[1]
+        assert manager.stats()["state"]["patches"] == 1
+        await manager.aclose()
+
+    async def test_unknown_or_evicted_version_is_ignored(self) -> None:
+        manager = ConnectionManager(state_history=2)
+        ws = FakeWebSocket()
+        conn = await manager.connect(ws)  # type: ignore[arg-type]
+        manager.subscribe(conn, "task:1")
+        for i in range(3):
+            await manager.publish_state("task:1", "t1", {"i": i})
+        manager.ack_state(conn, "task:1", "t1", 1)
+        manager.ack_state(conn, "task:1", "t1", 9)
+        assert conn.acked == {}
+        manager.ack_state(conn, "task:1", "t1", 3)
+        assert conn.acked == {("task:1", "t1"): 3}
+        manager.unsubscribe(conn, "task:1")
+        assert conn.acked == {}
+        await manager.aclose()
+
+    async def test_new_subscriber_gets_current_state(self) -> None:
+        manager = ConnectionManager()
+        early, late = FakeWebSocket(), FakeWebSocket()
+        first = await manager.connect(early)  # type: ignore[arg-type]
+        manager.subscribe(first, "task:1")
+        await manager.publish_state("task:1", "t1", {"status": "running", "progress": 0.0})
+        await manager.publish_state("task:1", "t1", {"progress": 0.5})
+        await _drain()
+
+        second = await manager.connect(late)  # type: ignore[arg-type]
+        manager.subscribe(second, "task:1")
+        manager.subscribe(second, "task:1")
+        await _drain()
+        assert late.sent == [
+            {
+                "type": "snapshot",
+                "topic": "task:1",
+                "entity": "t1",
+                "version": 2,
+                "state": {"status": "running", "progress": 0.5},
+            }
+        ]
+        # It can acknowledge that version and receive patches from there
+        manager.ack_state(second, "task:1", "t1", 2)
+        await manager.publish_state("task:1", "t1", {"progress": 0.7})
+        await _drain()
+        assert late.sent[-1]["type"] == "patch"
+        await manager.aclose()
+
+
+class TestRedisBackbone:
+    """Two managers sharing a LocalRedis, as two instances sharing a Redis server."""
+
+    @pytest.fixture
+    async def instances(
+        self,
+    ) -> AsyncIterator[tuple[LocalRedis, ConnectionManager, ConnectionManager]]:
+        redis = LocalRedis()
+        a = ConnectionManager(
+            backbone=RedisBackbone(client=redis, retry_interval=0.01), replay_linger=0.05
+        )
+        b = ConnectionManager(
+            backbone=RedisBackbone(client=redis, retry_interval=0.01), replay_linger=0.05
+        )
+        yield redis, a, b
+        await a.aclose()
+        await b.aclose()
+
+    async def _settle(self) -> None:
+        await asyncio.sleep(0.01)
+
+    async def test_event_reaches_other_instance(
+        self, instances: tuple[LocalRedis, ConnectionManager, ConnectionManager]
+    ) -> None:
+        _, a, b = instances
+        ws_a, ws_b = FakeWebSocket(), FakeWebSocket()
+        conn_a = await a.connect(ws_a)  # type: ignore[arg-type]
+        conn_b = await b.connect(ws_b)  # type: ignore[arg-type]
+        a.subscribe(conn_a, "task:1")
+        b.subscribe(conn_b, "task:1")
+        await self._settle()
+
+        await a.publish("task:1", {"status": "running"})
+        await self._settle()
+        assert _events(ws_a) == _events(ws_b) == [{"status": "running"}]
+
+    async def test_listener_receives_events_from_other_instance(
+        self, instances: tuple[LocalRedis, ConnectionManager, ConnectionManager]
+    ) -> None:
+        _, a, b = instances
+        received: list[Any] = []
+        b.listen("auth:revocations", received.append)
+        await self._settle()
+
+        await a.publish("auth:revocations", {"uid": "u1"})
+        await self._settle()
+        assert received == [{"uid": "u1"}]
+        assert not await can_subscribe(AuthUser(uid="u1"), "auth:revocations")
+
+    async def test_state_reaches_other_instance(
+        self, instances: tuple[LocalRedis, ConnectionManager, ConnectionManager]
+    ) -> None:
+        _, a, b = instances
+        ws_b = FakeWebSocket()
+        b.subscribe(await b.connect(ws_b), "task:1")  # type: ignore[arg-type]
+        await self._settle()
+
+        await a.publish_state("task:1", "t1", {"status": "running"})
+        await self._settle()
+        [snapshot] = ws_b.sent
+        assert (snapshot["type"], snapshot["state"]) == ("snapshot", {"status": "running"})
+
+    async def test_subscribes_only_to_local_topics(
+        self, instances: tuple[LocalRedis, ConnectionManager, ConnectionManager]
+    ) -> None:
+        redis, a, b = instances
+        ws = FakeWebSocket()
+        conn = await b.connect(ws)  # type: ignore[arg-type]
+        b.subscribe(conn, "task:1")
+        await self._settle()
+        assert redis.subscribers("mcontrol:ws:task:1") == 1
+        assert redis.subscribers("mcontrol:ws:task:2") == 0
+
+        await a.publish("task:2", {"n": 1})
+        b.unsubscribe(conn, "task:1")
+        await self._settle()
+        # Kept for the replay linger after the last local subscriber leaves
+        assert redis.subscribers("mcontrol:ws:task:1") == 1
+        await asyncio.sleep(0.1)
+        assert redis.subscribers("mcontrol:ws:task:1") == 0
+        assert ws.sent == []
+
+    async def test_resume_on_other_instance(
+        self, instances: tuple[LocalRedis, ConnectionManager, ConnectionManager]
+    ) -> None:
+        _, a, b = instances
+        ws_a = FakeWebSocket()
+        conn_a = await a.connect(ws_a)  # type: ignore[arg-type]
+        a.subscribe(conn_a, "task:1")
+        await self._settle()
+        for n in range(3):
+            await b.publish("task:1", {"n": n})
+        await self._settle()
+        assert [m["seq"] for m in ws_a.sent] == [1, 2, 3]
+
+        # b never held task:1, but knows from the shared counter that seq 3 is the latest
+        ws_b = FakeWebSocket()
+        conn_b = await b.connect(ws_b)  # type: ignore[arg-type]
+        assert await b.subscribe_resuming(conn_b, "task:1", 3)
+        assert await b.subscribe_resuming(conn_b, "task:2", 0)
+        await _drain()
+        assert ws_b.sent == []
+
+        ws_c = FakeWebSocket()
+        conn_c = await b.connect(ws_c)  # type: ignore[arg-type]
+        await b.subscribe_resuming(conn_c, "task:1", 1)
+        await _drain()
+        assert ws_c.sent == [{"type": "resync", "topic": "task:1", "seq": 3}]
+
+    async def test_resubscribes_after_connection_loss(
+        self, instances: tuple[LocalRedis, ConnectionManager, ConnectionManager]
+    ) -> None:
+        redis, a, b = instances
+        ws = FakeWebSocket()
+        conn = await b.connect(ws)  # type: ignore[arg-type]
+        b.subscribe(conn, "task:1")
+        await self._settle()
+
+        redis.available = False
+        await self._settle()
+        assert b.backbone.stats()["errors"] >= 1
+        redis.available = True
+        await asyncio.sleep(0.05)
+
+        await a.publish("task:1", {"n": 1})
+        await self._settle()
+        assert _events(ws) == [{"n": 1}]
+
+    async def test_publish_failure_still_delivers_locally(
+        self, instances: tuple[LocalRedis, ConnectionManager, ConnectionManager]
+    ) -> None:
+        redis, a, _ = instances
+        ws = FakeWebSocket()
+        conn = await a.connect(ws)  # type: ignore[arg-type]
+        a.subscribe(conn, "task:1")
+        await self._settle()
+
+        redis.available = False
+        await a.publish("task:1", {"n": 1})
+        await _drain()
+        assert _events(ws) == [{"n": 1}]
+
+
+def _jwt(**claims: Any) -> str:
+    """An unsigned JWT-shaped token for user u1 issued 10 seconds ago."""
+    now = time.time()
+    claims = {"sub": "u1", "iat": now - 10, "exp": now + 3600, **claims}
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).rstrip(b"=").decode()
+    return f"e30.{payload}.sig"
+
+
+@pytest.fixture
+def auth_enabled(monkeypatch: pytest.MonkeyPatch) -> Generator[None]:
+    """Enable auth and accept the token "good" and tokens from _jwt as user u1."""
+    import app.middleware.auth as auth_mod
+    from app.lib.config import get_settings
+
+    async def fake_verify(token: str, emulator_host: str) -> dict:
+        if token == "good":
+            return {"uid": "u1"}
+        claims = peek_claims(token)
+        if "sub" not in claims:
+            raise ValueError("bad token")
+        return {"uid": claims["sub"]}
+
+    monkeypatch.setattr(get_settings(), "auth_disabled", False)
+    monkeypatch.setattr(auth_mod, "_verify_token_emulator", fake_verify)
+    get_token_cache().clear()
+    yield
+    get_token_cache().clear()
+
+
+class TestEndpoint:
+    def test_rejects_missing_or_invalid_token(self, client: TestClient, auth_enabled: None) -> None:
+        for protocols in ([], ["bearer.bad"]):
+            with (
+                pytest.raises(WebSocketDisconnect) as exc,
+                client.websocket_connect("/api/ws", subprotocols=protocols),
+            ):
+                pass
+            assert exc.value.code == 1008
+
+    def test_subscribe_and_unsubscribe(self, client: TestClient, auth_enabled: None) -> None:
+        headers = {"Authorization": "Bearer good"}
+        with client.websocket_connect("/api/ws", headers=headers) as ws:
+            ws.send_json({"type": "subscribe", "topics": ["task:7", "user:u2", "user:u1"]})
+            assert ws.receive_json() == {
+                "type": "subscribed",
+                "topics": ["user:u1"],
+                "rejected": ["task:7", "user:u2"],
+            }
+            ws.send_json({"type": "unsubscribe", "topics": ["user:u1"]})
+            assert ws.receive_json() == {"type": "unsubscribed", "topics": ["user:u1"]}
+
+    def test_subprotocol_token(self, client: TestClient, auth_enabled: None) -> None:
+        with client.websocket_connect("/api/ws", subprotocols=["bearer.good", "json"]) as ws:
+            # The token is never echoed back as the selected subprotocol
+            assert ws.accepted_subprotocol == "json"
+            ws.send_json({"type": "ping"})
+            assert ws.receive_json() == {"type": "pong"}
+
+    def test_query_token_is_not_accepted(self, client: TestClient, auth_enabled: None) -> None:
+        with (
+            pytest.raises(WebSocketDisconnect) as exc,
+            client.websocket_connect("/api/ws?token=good"),
+        ):
+            pass
+        assert exc.value.code == 1008
+
+    def test_closed_when_token_expires(self, client: TestClient, auth_enabled: None) -> None:
+        headers = {"Authorization": f"Bearer {_jwt(exp=time.time() + 0.2)}"}
+        with client.websocket_connect("/api/ws", headers=headers) as ws:
+            ws.send_json({"type": "ping"})
+            assert ws.receive_json() == {"type": "pong"}
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 1008
+
+    def test_closed_when_user_signs_out(self, auth_enabled: None) -> None:
+        headers = {"Authorization": f"Bearer {_jwt()}"}
+        # Entering the client runs the lifespan, which listens for revocations
+        with TestClient(app) as client, client.websocket_connect("/api/ws", headers=headers) as ws:
+            ws.send_json({"type": "ping"})
+            assert ws.receive_json() == {"type": "pong"}
+            response = client.post("/api/auth/signout?all_sessions=true", headers=headers)
+            assert response.status_code == 204
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 1008
+
+
+@needs_msgpack
+async def test_binary_connection_gets_msgpack() -> None:
+    manager = ConnectionManager()
+    ws = FakeWebSocket()
+    conn = await manager.connect(ws, subprotocol="msgpack")  # type: ignore[arg-type]
+    manager.subscribe(conn, "task:1")
+    await manager.publish("task:1", {"n": 1})
+    conn.send({"type": "pong"})
+    await _drain()
+    assert _events(ws) == [{"n": 1}]
+    assert ws.sent[1] == {"type": "pong"}
+    assert ws.texts == []
+    await manager.aclose()
+
+
+@needs_msgpack
+def test_msgpack_subprotocol(client: TestClient) -> None:
+    with client.websocket_connect("/api/ws", subprotocols=["msgpack"]) as ws:
+        assert ws.accepted_subprotocol == "msgpack"
+        ws.send_bytes(packb({"type": "ping"}))
+        assert unpackb(ws.receive_bytes()) == {"type": "pong"}
+
+
+def test_ping_and_ack(client: TestClient) -> None:
+    with client.websocket_connect("/api/ws") as ws:
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+        ws.send_json({"type": "hello"})
+        assert ws.receive_json() == {"type": "ack", "data": {"type": "hello"}}